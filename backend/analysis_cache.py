@@ -0,0 +1,106 @@
+"""
+Cache persistente de analisis de Claude
+
+Guarda el JSON ya parseado de cada analisis en SQLite local, indexado por
+un hash de los inputs normalizados, el texto del prompt y el modelo. Si el producto,
+su margen y su competencia no cambiaron, no se vuelve a llamar a Claude.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from config import CACHE_CONFIG
+
+
+class AnalysisCache:
+    """Cache content-addressed en SQLite con TTL y limite de entradas"""
+
+    def __init__(
+        self,
+        path: str = CACHE_CONFIG["path"],
+        ttl_seconds: int = CACHE_CONFIG["ttl_seconds"],
+        max_entries: int = CACHE_CONFIG["max_entries"]
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_accessed ON analyses(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, inputs: Dict, prompt: str = "") -> str:
+        """
+        Hash estable de los inputs del prompt + modelo + texto del prompt.
+        prompt es lo que se manda a Claude (instrucciones y plantilla ya
+        rellenada): si se editan, las entradas viejas dejan de coincidir.
+        """
+        payload = json.dumps(
+            {"model": model, "inputs": inputs, "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest()},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM analyses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE analyses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, model: str, value: Dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, model, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._conn.commit()
+            self.stats["writes"] += 1
+            needs_eviction = self.stats["writes"] % 100 == 0
+        if needs_eviction:
+            self.evict()
+
+    def evict(self):
+        """Borra entradas vencidas y, si sobran, las menos usadas"""
+        with self._lock:
+            self._conn.execute("DELETE FROM analyses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            count = self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM analyses WHERE key IN (SELECT key FROM analyses ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
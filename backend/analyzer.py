@@ -1,10 +1,20 @@
 """
 Analizador de productos con Claude AI
 """
+import importlib
 import json
+import threading
+import time
 from typing import Dict, List, Optional, Tuple
-from anthropic import Anthropic
-from config import ANALYSIS_CONFIG, COUNTRIES
+from anthropic import Anthropic, DefaultHttpxClient
+from config import ANALYSIS_CONFIG, COUNTRIES, BATCH_CONFIG, RETRY_CONFIG, MULTI_PRODUCT_CONFIG
+from analysis_cache import AnalysisCache
+from http_recorder import cassette_transport
+from metrics import record_error, record_request, record_tokens
+
+# Paquete httpx sobre el que esta construido el SDK (httpx, o httpx2 en
+# versiones recientes); los transports del cassette tienen que ser de ese
+SDK_HTTPX = importlib.import_module(DefaultHttpxClient.__mro__[1].__module__.partition(".")[0])
 
 class MarginCalculator:
     """Calcula margenes reales considerando todos los costos"""
@@ -198,99 +208,520 @@ class ViabilityScorer:
         return score, reasons, verdict
 
 
+ANALYSIS_SCHEMA = """{
+    "recommendation": "VENDER" | "NO_VENDER" | "VENDER_CON_CONDICIONES",
+    "confidence": 1-10,
+    "optimal_price": numero en COP,
+    "price_justification": "explicacion breve",
+    "unused_angles": ["angulo 1", "angulo 2", ...],
+    "target_audience": {
+        "age_range": "25-45",
+        "gender": "Mujeres 70%",
+        "interests": ["interes 1", "interes 2"],
+        "pain_points": ["problema 1", "problema 2"]
+    },
+    "emotional_triggers": ["trigger 1", "trigger 2"],
+    "key_insight": "insight principal en una oracion",
+    "risks": ["riesgo 1", "riesgo 2"],
+    "action_items": ["accion 1", "accion 2", "accion 3"]
+}"""
+
+RECOMMENDATIONS = ("VENDER", "NO_VENDER", "VENDER_CON_CONDICIONES")
+
+
+def _cop(value: int) -> str:
+    """Monto con separador de miles como se escribe en Colombia (10.000)"""
+    return f"{value:,}".replace(",", ".")
+
+
+# Parte fija del prompt: va como bloque system con cache_control para que
+# la API reutilice el prefijo entre llamadas. No debe depender del producto.
+# La API solo cachea prefijos desde PROMPT_CACHE_MIN_TOKENS (Sonnet), por eso
+# la rubrica completa y el ejemplo van aqui y no en cada mensaje.
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+SYSTEM_PROMPT = f"""Eres un analista senior de productos de dropshipping contra entrega (COD) en Latinoamerica
+(Colombia, Mexico y Ecuador). Para cada producto recibes sus precios, ventas, stock, el analisis
+financiero (margen neto, ROI, breakeven) y los anuncios de la competencia con sus angulos. Das
+recomendaciones especificas y accionables para un vendedor que va a pautar en Facebook y TikTok.
+
+# CONTEXTO DEL NEGOCIO
+
+- El cliente paga al recibir (COD). Del total de pedidos, cerca del {int(ANALYSIS_CONFIG['cancel_rate'] * 100)}% se cancela antes
+  del despacho y cerca del {int(ANALYSIS_CONFIG['return_rate'] * 100)}% de lo despachado se devuelve; el vendedor paga el flete
+  de ida y de vuelta de las devoluciones.
+- El margen neto que recibes ya descuenta costo del producto, flete, CPA promedio de pauta,
+  devoluciones y cancelaciones. No lo vuelvas a calcular; usalo para decidir.
+- El precio proveedor es lo que cobra el dropshipper mayorista. El precio sugerido es una referencia
+  del proveedor, no siempre la mejor para vender.
+- Las ventas de 7 y 30 dias son unidades vendidas por todos los vendedores del producto en la
+  plataforma. Ventas 7d altas frente a 30d / 4 indican aceleracion; bajas indican desgaste.
+- El stock bajo (menos de 100 unidades) es un riesgo de quiebre cuando la pauta empieza a escalar.
+
+# RUBRICA DE DECISION
+
+"VENDER": margen neto comodo (sobre ${_cop(ANALYSIS_CONFIG['min_viable_margin'])} COP o equivalente), ROI de {ANALYSIS_CONFIG['min_viable_roi']}% o mas, demanda
+sostenida y al menos un angulo de venta que la competencia no este explotando.
+
+"VENDER_CON_CONDICIONES": el producto es viable solo si se cumple algo concreto: subir el precio,
+usar un angulo distinto, vender en combo o kit, esperar reposicion de stock o probar con presupuesto
+limitado. Las condiciones deben quedar explicitas en action_items.
+
+"NO_VENDER": no es rentable al precio realista de mercado, el mercado esta saturado (muchos
+competidores con engagement alto y los mismos angulos), la demanda esta cayendo, el producto tiene
+alta tasa de devolucion esperada (tallas, fragiles, expectativas dificiles de cumplir) o hay riesgos
+legales o de politicas de anuncios (salud con promesas medicas, replicas de marca, armas).
+
+confidence (1-10): 8-10 solo si margen, demanda y competencia apuntan en la misma direccion; 5-7
+si hay senales mezcladas; 1-4 si faltan datos (sin competencia encontrada, ventas muy bajas).
+
+# PRECIO OPTIMO
+
+- optimal_price es el precio final al consumidor en la moneda del pais, redondeado como se publica
+  en tiendas (por ejemplo 59.900, 79.900 o 89.900 COP).
+- Debe quedar por encima del precio breakeven con holgura para absorber un CPA peor que el promedio.
+- Compara con los precios de la competencia: no propongas un precio muy por encima sin un angulo que
+  lo justifique (bundle, garantia, regalo, percepcion premium).
+- price_justification explica en una o dos frases por que ese precio y no otro.
+
+# ANGULOS, PUBLICO Y DISPARADORES
+
+- unused_angles: 3 a 5 angulos de venta concretos que NO aparezcan entre los angulos usados por la
+  competencia. Un angulo es una promesa o situacion de uso ("regalo para el dia de la madre",
+  "ahorra energia en la factura", "antes y despues en 7 dias"), no una caracteristica tecnica.
+- target_audience: rango de edad, genero con porcentaje estimado, 2 a 4 intereses segmentables en
+  Meta/TikTok y 2 a 4 dolores o problemas que el producto resuelve.
+- emotional_triggers: 2 a 4 disparadores (miedo a perderse algo, estatus, comodidad, ahorro,
+  seguridad de la familia, prueba social) aplicables al producto.
+- key_insight: la observacion mas importante en una oracion, la que cambiaria la decision del
+  vendedor.
+- risks: 2 a 4 riesgos concretos del producto o del mercado, no genericos.
+- action_items: 3 a 5 pasos siguientes ordenados (precio de prueba, angulo del primer creativo,
+  presupuesto diario inicial, metrica para cortar o escalar).
+
+# FORMATO DE RESPUESTA
+
+Responde en JSON con esta estructura exacta:
+{ANALYSIS_SCHEMA}
+
+Si el mensaje trae un solo producto, responde solo con ese objeto JSON.
+Si trae varios productos (secciones "## PRODUCTO <id>", cada una con sus
+sub-secciones "### ... <id>"), responde con un array JSON con un objeto por
+producto, cada uno con "product_id" igual al id de su seccion ademas de los
+campos de arriba. Usa solo la competencia y los angulos que llevan el id
+del producto. Analiza cada producto por
+separado: no copies angulos ni conclusiones de un producto a otro.
+
+# EJEMPLO
+
+Para un corrector de postura con precio proveedor $28.000 COP, sugerido $79.900, 420 ventas en 7
+dias, margen neto $14.500 COP, ROI 32% y seis competidores que usan "alivia el dolor de espalda",
+una respuesta adecuada seria:
+{{"recommendation": "VENDER_CON_CONDICIONES", "confidence": 7, "optimal_price": 84900,
+"price_justification": "El margen aguanta un CPA 30% mayor y la competencia esta entre 79.900 y 89.900.",
+"unused_angles": ["postura para trabajo remoto", "regalo para estudiantes", "confianza al caminar"],
+"target_audience": {{"age_range": "22-40", "gender": "Mujeres 65%", "interests": ["teletrabajo", "yoga"],
+"pain_points": ["dolor de cuello frente al computador", "inseguridad por la postura"]}},
+"emotional_triggers": ["autoimagen", "comodidad"],
+"key_insight": "El mercado compite solo por dolor; el angulo de imagen personal esta libre.",
+"risks": ["devoluciones por talla", "saturacion del angulo de dolor"],
+"action_items": ["probar a 84.900 con el angulo de trabajo remoto", "tabla de tallas en la landing",
+"cortar si el CPA supera 35.000 tras 3 dias"]}}
+
+Solo responde con el JSON, sin texto adicional."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimacion conservadora (~3 caracteres por token en espanol)"""
+    return len(text) // 3 + 1
+
+
 class ProductAnalyzer:
     """Analizador principal usando Claude AI"""
     
-    def __init__(self, api_key: str):
-        self.client = Anthropic(api_key=api_key)
+    MODEL = "claude-sonnet-4-20250514"
+    MAX_TOKENS = 1500
     
-    def analyze_product(
-        self,
+    def __init__(self, api_key: str, cache: Optional[AnalysisCache] = None, base_url: Optional[str] = None):
+        # base_url permite apuntar a un servidor local que imite la API (pruebas de batch)
+        # El SDK ya hace backoff exponencial con jitter y respeta Retry-After
+        # Con HTTP_CASSETTE activo las llamadas a Claude se graban o se sirven del cassette
+        transport = cassette_transport(module=SDK_HTTPX)
+        self.client = Anthropic(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=RETRY_CONFIG["max_retries"],
+            http_client=DefaultHttpxClient(transport=transport) if transport else None
+        )
+        self.cache = cache
+        self.batch_stats = {"submitted": 0, "succeeded": 0, "failed": 0}
+        self.retry_stats = {"requests": 0, "retries": 0}
+        self.multi_stats = {"requests": 0, "products": 0, "fallbacks": 0}
+        self.token_stats = {"input": 0, "output": 0, "cache_read": 0, "cache_write": 0}
+        # Los contadores se actualizan desde el pool de workers del pipeline
+        self._stats_lock = threading.Lock()
+        self._cache_warned = False
+    
+    def _incr(self, stats: Dict, key: str, amount: int = 1):
+        """Incrementa un contador de stats de forma segura entre hilos"""
+        with self._stats_lock:
+            stats[key] += amount
+    
+    @staticmethod
+    def _prompt_inputs(
         product: Dict,
         margin_data: Dict,
         competitors: List[Dict],
         used_angles: List[str]
     ) -> Dict:
         """
-        Analiza un producto con Claude y genera recomendaciones
+        Datos que entran al prompt, normalizados. Es tambien la llave del cache:
+        si esto no cambia, el prompt tampoco.
         """
-        competitor_summary = []
-        for i, comp in enumerate(competitors[:10], 1):
-            competitor_summary.append(
-                f"{i}. {comp.get('page_name', 'N/A')} - "
-                f"Engagement: {comp.get('engagement_level', 'N/A')} - "
-                f"Angulo: {comp.get('main_angle', 'N/A')}"
-            )
+        return {
+            "name": product.get('name', 'N/A'),
+            "cost_price": margin_data.get('cost_price', 0),
+            "sale_price": margin_data.get('sale_price', 0),
+            "sales_7d": product.get('sales_7d', 0),
+            "sales_30d": product.get('sales_30d', 0),
+            "stock": product.get('stock', 0),
+            "net_margin": margin_data.get('net_margin', 0),
+            "roi": margin_data.get('roi', 0),
+            "breakeven_price": margin_data.get('breakeven_price', 0),
+            "is_profitable": bool(margin_data.get('is_profitable')),
+            "competitor_count": len(competitors),
+            "competitors": [
+                [comp.get('page_name', 'N/A'), comp.get('engagement_level', 'N/A'), comp.get('main_angle', 'N/A')]
+                for comp in competitors[:10]
+            ],
+            "used_angles": list(used_angles[:10]),
+        }
+    
+    @staticmethod
+    def _product_section(inputs: Dict, product_id: Optional[str] = None) -> str:
+        """
+        Datos de un producto en el prompt (PRODUCTO ... ANGULOS). Con
+        product_id (prompt agrupado) las sub-secciones van con ### y el id,
+        para que competencia y angulos no se mezclen entre productos.
+        """
+        competitor_summary = [
+            f"{i}. {page_name} - Engagement: {engagement} - Angulo: {angle}"
+            for i, (page_name, engagement, angle) in enumerate(inputs["competitors"], 1)
+        ]
+        level, suffix = ("###", f" {product_id}") if product_id else ("##", "")
         
-        prompt = f"""Analiza este producto de dropshipping y dame recomendaciones especificas.
-
-## PRODUCTO
-- Nombre: {product.get('name', 'N/A')}
-- Precio proveedor: ${margin_data.get('cost_price', 0):,} COP
-- Precio sugerido: ${margin_data.get('sale_price', 0):,} COP
-- Ventas 7 dias: {product.get('sales_7d', 0):,}
-- Ventas 30 dias: {product.get('sales_30d', 0):,}
-- Stock: {product.get('stock', 0):,}
+        def header(name: str, detail: str = "") -> str:
+            return f"{level} {name}{suffix}{detail}"
+        
+        return f"""## PRODUCTO{suffix}
+- Nombre: {inputs['name']}
+- Precio proveedor: ${inputs['cost_price']:,} COP
+- Precio sugerido: ${inputs['sale_price']:,} COP
+- Ventas 7 dias: {inputs['sales_7d']:,}
+- Ventas 30 dias: {inputs['sales_30d']:,}
+- Stock: {inputs['stock']:,}
 
-## ANALISIS FINANCIERO
-- Margen neto por venta: ${margin_data.get('net_margin', 0):,} COP
-- ROI: {margin_data.get('roi', 0)}%
-- Precio breakeven: ${margin_data.get('breakeven_price', 0):,} COP
-- Es rentable?: {'Si' if margin_data.get('is_profitable') else 'No'}
+{header("ANALISIS FINANCIERO")}
+- Margen neto por venta: ${inputs['net_margin']:,} COP
+- ROI: {inputs['roi']}%
+- Precio breakeven: ${inputs['breakeven_price']:,} COP
+- Es rentable?: {'Si' if inputs['is_profitable'] else 'No'}
 
-## COMPETENCIA ({len(competitors)} competidores encontrados)
+{header("COMPETENCIA", f" ({inputs['competitor_count']} competidores encontrados)")}
 {chr(10).join(competitor_summary) if competitor_summary else 'No se encontraron competidores'}
 
-## ANGULOS YA USADOS POR LA COMPETENCIA
-{', '.join(used_angles[:10]) if used_angles else 'Ninguno identificado'}
-
----
+{header("ANGULOS YA USADOS POR LA COMPETENCIA")}
+{', '.join(inputs['used_angles']) if inputs['used_angles'] else 'Ninguno identificado'}"""
+    
+    @classmethod
+    def _build_prompt(cls, inputs: Dict) -> str:
+        """Mensaje de usuario (solo datos del producto; las instrucciones van en SYSTEM_PROMPT)"""
+        return f"""Analiza este producto de dropshipping y dame recomendaciones especificas.
 
-Responde en JSON con esta estructura exacta:
-{{
-    "recommendation": "VENDER" | "NO_VENDER" | "VENDER_CON_CONDICIONES",
-    "confidence": 1-10,
-    "optimal_price": numero en COP,
-    "price_justification": "explicacion breve",
-    "unused_angles": ["angulo 1", "angulo 2", ...],
-    "target_audience": {{
-        "age_range": "25-45",
-        "gender": "Mujeres 70%",
-        "interests": ["interes 1", "interes 2"],
-        "pain_points": ["problema 1", "problema 2"]
-    }},
-    "emotional_triggers": ["trigger 1", "trigger 2"],
-    "key_insight": "insight principal en una oracion",
-    "risks": ["riesgo 1", "riesgo 2"],
-    "action_items": ["accion 1", "accion 2", "accion 3"]
-}}
+{cls._product_section(inputs)}"""
+    
+    @classmethod
+    def _cache_key(cls, inputs: Dict) -> str:
+        """Llave del cache: cambia con los inputs, el modelo o el texto del prompt"""
+        return AnalysisCache.make_key(cls.MODEL, inputs, SYSTEM_PROMPT + cls._build_prompt(inputs))
+    
+    @staticmethod
+    def _build_multi_prompt(sections: List[Tuple[str, str]]) -> str:
+        """Mensaje con varios productos; sections es [(product_id, seccion)]"""
+        products = "\n\n".join(section for _, section in sections)
+        ids = ", ".join(product_id for product_id, _ in sections)
+        
+        return f"""Analiza estos {len(sections)} productos de dropshipping por separado ({ids}) y responde con el array JSON.
 
-Solo responde con el JSON, sin texto adicional."""
+{products}"""
+    
+    @staticmethod
+    def _is_valid_analysis(analysis) -> bool:
+        """Chequeo minimo de un elemento de la respuesta agrupada"""
+        if not isinstance(analysis, dict):
+            return False
+        if analysis.get("recommendation") not in RECOMMENDATIONS:
+            return False
+        if not isinstance(analysis.get("confidence"), (int, float)) or not isinstance(analysis.get("optimal_price"), (int, float)):
+            return False
+        return all(isinstance(analysis.get(key), list) for key in ("unused_angles", "risks", "action_items"))
+    
+    @staticmethod
+    def _parse_response(response_text: str) -> Dict:
+        response_text = response_text.strip()
+        
+        if response_text.startswith("```"):
+            response_text = response_text.split("```")[1]
+            if response_text.startswith("json"):
+                response_text = response_text[4:]
+        
+        return json.loads(response_text)
+    
+    def _request_params(self, prompt: str, max_tokens: int = MAX_TOKENS) -> Dict:
+        return {
+            "model": self.MODEL,
+            "max_tokens": max_tokens,
+            "system": [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}],
+            "messages": [{"role": "user", "content": prompt}]
+        }
+    
+    def _create(self, params: Dict):
+        """messages.create con conteo de reintentos, bytes y tokens"""
+        raw = self.client.messages.with_raw_response.create(**params)
+        self._incr(self.retry_stats, "requests")
+        self._incr(self.retry_stats, "retries", raw.retries_taken)
+        record_request(len(raw.http_request.content), raw.http_response.num_bytes_downloaded)
+        response = raw.parse()
+        self._record_usage(response.usage)
+        return response
+    
+    def analyze_product(
+        self,
+        product: Dict,
+        margin_data: Dict,
+        competitors: List[Dict],
+        used_angles: List[str]
+    ) -> Dict:
+        """
+        Analiza un producto con Claude y genera recomendaciones
+        """
+        inputs = self._prompt_inputs(product, margin_data, competitors, used_angles)
+        
+        cache_key = None
+        if self.cache:
+            cache_key = self._cache_key(inputs)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        prompt = self._build_prompt(inputs)
 
         try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1500,
-                messages=[{"role": "user", "content": prompt}]
-            )
+            response = self._create(self._request_params(prompt))
             
-            response_text = response.content[0].text.strip()
-            
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
-            
-            analysis = json.loads(response_text)
+            analysis = self._parse_response(response.content[0].text)
+            if self.cache:
+                self.cache.set(cache_key, self.MODEL, analysis)
             return analysis
             
         except json.JSONDecodeError as e:
             print(f"Error parseando respuesta de Claude: {e}")
+            record_error()
             return self._default_analysis()
         except Exception as e:
             print(f"Error en analisis Claude: {e}")
+            record_error()
             return self._default_analysis()
     
+    def analyze_products(
+        self,
+        items: List[Dict],
+        products_per_request: int = MULTI_PRODUCT_CONFIG["products_per_request"]
+    ) -> List[Dict]:
+        """
+        Analiza varios productos metiendo hasta products_per_request en cada
+        prompt (las instrucciones y el schema van una sola vez), sin pasar
+        de MULTI_PRODUCT_CONFIG["max_input_tokens"].
+        
+        items es una lista de kwargs de analyze_product. Cada elemento de la
+        respuesta se valida por separado; los que faltan o no validan se
+        reintentan con analyze_product. Devuelve los analisis en orden.
+        """
+        results: List[Optional[Dict]] = [None] * len(items)
+        pending = []
+        
+        for index, item in enumerate(items):
+            inputs = self._prompt_inputs(**item)
+            cache_key = None
+            if self.cache:
+                cache_key = self._cache_key(inputs)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    results[index] = cached
+                    continue
+            pending.append((index, cache_key, self._product_section(inputs, product_id=f"p{index}")))
+        
+        budget = (
+            MULTI_PRODUCT_CONFIG["max_input_tokens"]
+            - estimate_tokens(SYSTEM_PROMPT)
+            - estimate_tokens(self._build_multi_prompt([]))
+        )
+        group, group_tokens = [], 0
+        for entry in pending:
+            tokens = estimate_tokens(entry[2])
+            if group and (len(group) >= products_per_request or group_tokens + tokens > budget):
+                self._analyze_group(group, results)
+                group, group_tokens = [], 0
+            group.append(entry)
+            group_tokens += tokens
+        if group:
+            self._analyze_group(group, results)
+        
+        for index, item in enumerate(items):
+            if results[index] is None:
+                results[index] = self.analyze_product(**item)
+        return results
+    
+    def _analyze_group(self, group: List[Tuple[int, Optional[str], str]], results: List[Optional[Dict]]):
+        """Un request para todo el grupo; deja en None los que no validan"""
+        if len(group) == 1:
+            return  # sin ahorro: lo resuelve analyze_product
+        
+        try:
+            self._request_group(group, results)
+        finally:
+            self._incr(self.multi_stats, "fallbacks", sum(1 for index, _, _ in group if results[index] is None))
+    
+    def _request_group(self, group: List[Tuple[int, Optional[str], str]], results: List[Optional[Dict]]):
+        prompt = self._build_multi_prompt([(f"p{index}", section) for index, _, section in group])
+        max_tokens = MULTI_PRODUCT_CONFIG["output_tokens_per_product"] * len(group)
+        try:
+            response = self._create(self._request_params(prompt, max_tokens=max_tokens))
+            analyses = self._parse_response(response.content[0].text)
+        except json.JSONDecodeError as e:
+            print(f"Error parseando respuesta agrupada de Claude: {e}")
+            record_error()
+            return
+        except Exception as e:
+            print(f"Error en analisis agrupado de Claude: {e}")
+            record_error()
+            return
+        
+        self._incr(self.multi_stats, "requests")
+        by_id = {
+            str(analysis.get("product_id")): analysis
+            for analysis in (analyses if isinstance(analyses, list) else [])
+            if isinstance(analysis, dict)
+        }
+        for index, cache_key, _ in group:
+            analysis = by_id.get(f"p{index}")
+            if not self._is_valid_analysis(analysis):
+                # Queda para el reintento individual
+                record_error()
+                continue
+            analysis = {key: value for key, value in analysis.items() if key != "product_id"}
+            self._incr(self.multi_stats, "products")
+            results[index] = analysis
+            if self.cache:
+                self.cache.set(cache_key, self.MODEL, analysis)
+    
+    def analyze_batch(self, items: List[Dict], poll_interval: float = 30.0) -> List[Dict]:
+        """
+        Analiza muchos productos con la API de Message Batches.
+        
+        items es una lista de kwargs de analyze_product. Los que estan en
+        cache no se envian. Devuelve los analisis en el mismo orden.
+        """
+        results: List[Optional[Dict]] = [None] * len(items)
+        pending: Dict[str, Tuple[int, Optional[str]]] = {}
+        requests = []
+        
+        for index, item in enumerate(items):
+            inputs = self._prompt_inputs(**item)
+            cache_key = None
+            if self.cache:
+                cache_key = self._cache_key(inputs)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    results[index] = cached
+                    continue
+            
+            custom_id = f"item-{index}"
+            pending[custom_id] = (index, cache_key)
+            requests.append({"custom_id": custom_id, "params": self._request_params(self._build_prompt(inputs))})
+        
+        chunk_size = BATCH_CONFIG["max_requests_per_batch"]
+        for start in range(0, len(requests), chunk_size):
+            chunk = requests[start:start + chunk_size]
+            try:
+                self._run_batch(chunk, pending, results, poll_interval)
+            except Exception as e:
+                print(f"Error en batch de Claude: {e}")
+                record_error()
+        
+        return [result if result is not None else self._default_analysis() for result in results]
+    
+    def _run_batch(
+        self,
+        requests: List[Dict],
+        pending: Dict[str, Tuple[int, Optional[str]]],
+        results: List[Optional[Dict]],
+        poll_interval: float
+    ):
+        batch = self.client.messages.batches.create(requests=requests)
+        self._incr(self.batch_stats, "submitted", len(requests))
+        print(f"    Batch {batch.id}: {len(requests)} requests enviados")
+        
+        deadline = time.monotonic() + BATCH_CONFIG["max_wait_seconds"]
+        while batch.processing_status != "ended":
+            if time.monotonic() > deadline:
+                self.client.messages.batches.cancel(batch.id)
+                raise TimeoutError(f"Batch {batch.id} no termino a tiempo, cancelado")
+            time.sleep(poll_interval)
+            batch = self.client.messages.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            print(f"    Batch {batch.id}: {counts.succeeded} ok, {counts.errored} error, {counts.processing} en proceso")
+        
+        for entry in self.client.messages.batches.results(batch.id):
+            index, cache_key = pending[entry.custom_id]
+            if entry.result.type != "succeeded":
+                # errored, expired o canceled: queda el analisis por defecto
+                detail = entry.result.error.error.message if entry.result.type == "errored" else ""
+                print(f"Request {entry.custom_id} del batch termino {entry.result.type} {detail}".rstrip())
+                self._incr(self.batch_stats, "failed")
+                continue
+            try:
+                analysis = self._parse_response(entry.result.message.content[0].text)
+            except json.JSONDecodeError as e:
+                print(f"Error parseando respuesta de Claude ({entry.custom_id}): {e}")
+                self._incr(self.batch_stats, "failed")
+                continue
+            self._incr(self.batch_stats, "succeeded")
+            self._record_usage(entry.result.message.usage)
+            results[index] = analysis
+            if self.cache:
+                self.cache.set(cache_key, self.MODEL, analysis)
+    
+    def _record_usage(self, usage):
+        """Tokens de la respuesta a token_stats y a las metricas de la etapa activa"""
+        tokens = {
+            "input": usage.input_tokens,
+            "output": usage.output_tokens,
+            "cache_read": getattr(usage, "cache_read_input_tokens", None) or 0,
+            "cache_write": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        }
+        with self._stats_lock:
+            for kind, value in tokens.items():
+                self.token_stats[kind] += value
+            warn = not tokens["cache_read"] and not tokens["cache_write"] and not self._cache_warned
+            self._cache_warned = self._cache_warned or warn
+        if warn:
+            print(
+                "Warning: Claude no leyo ni escribio el cache del prompt "
+                f"(prefijo menor a {PROMPT_CACHE_MIN_TOKENS} tokens o cache_control ignorado)"
+            )
+        record_tokens(**tokens)
+    
     def _default_analysis(self) -> Dict:
         """Analisis por defecto si Claude falla"""
         return {
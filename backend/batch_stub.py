@@ -0,0 +1,259 @@
+"""
+Stand-in local de la API de Message Batches de Anthropic
+
+Sirve create, retrieve, cancel y results (JSONL) de /v1/messages/batches
+para probar ProductAnalyzer.analyze_batch sin la API real. Cada request
+termina como succeeded salvo que outcomes indique errored, expired o
+canceled para su custom_id.
+
+Uso:
+    python batch_stub.py --port 8765 --errored item-1 --expired item-2
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python run.py --batch --batch-poll 1
+"""
+import argparse
+import itertools
+import json
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Lo que devuelve el stand-in para los requests que terminan bien
+STUB_ANALYSIS = {
+    "recommendation": "VENDER",
+    "confidence": 7,
+    "optimal_price": 89900,
+    "price_justification": "Respuesta del stand-in de batches",
+    "unused_angles": [],
+    "risks": [],
+    "action_items": [],
+}
+
+OUTCOMES = ("succeeded", "errored", "expired", "canceled")
+
+_BATCH_PATH = re.compile(r"^/v1/messages/batches/([\w-]+)(/results|/cancel)?$")
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.isoformat().replace("+00:00", "Z")
+
+
+class BatchStub:
+    """Servidor HTTP en un hilo que imita /v1/messages/batches"""
+
+    def __init__(
+        self,
+        outcomes: Optional[Dict[str, str]] = None,
+        polls_until_ended: int = 1,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        # outcomes: custom_id -> succeeded|errored|expired|canceled
+        self.outcomes = outcomes or {}
+        self.polls_until_ended = polls_until_ended
+        self.batches: Dict[str, Dict] = {}
+        self.calls = {"create": 0, "retrieve": 0, "cancel": 0, "results": 0}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "BatchStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "BatchStub":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- estado de los batches ---
+
+    def _create(self, body: Dict) -> Dict:
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self.calls["create"] += 1
+            batch_id = f"msgbatch_stub_{next(self._ids)}"
+            self.batches[batch_id] = {
+                "requests": body.get("requests", []),
+                "created_at": now,
+                "polls": 0,
+                "status": "in_progress",
+                "canceled_at": None,
+                "ended_at": None,
+            }
+            return self._batch_json(batch_id)
+
+    def _retrieve(self, batch_id: str) -> Dict:
+        with self._lock:
+            self.calls["retrieve"] += 1
+            batch = self.batches[batch_id]
+            if batch["status"] != "ended":
+                batch["polls"] += 1
+                if batch["polls"] >= self.polls_until_ended or batch["status"] == "canceling":
+                    batch["status"] = "ended"
+                    batch["ended_at"] = datetime.now(timezone.utc)
+            return self._batch_json(batch_id)
+
+    def _cancel(self, batch_id: str) -> Dict:
+        with self._lock:
+            self.calls["cancel"] += 1
+            batch = self.batches[batch_id]
+            if batch["status"] == "in_progress":
+                batch["status"] = "canceling"
+                batch["canceled_at"] = datetime.now(timezone.utc)
+            return self._batch_json(batch_id)
+
+    def _outcome(self, batch: Dict, custom_id: str) -> str:
+        if batch["canceled_at"] is not None:
+            return "canceled"
+        return self.outcomes.get(custom_id, "succeeded")
+
+    def _batch_json(self, batch_id: str) -> Dict:
+        batch = self.batches[batch_id]
+        counts = dict.fromkeys(OUTCOMES, 0)
+        counts["processing"] = 0
+        for request in batch["requests"]:
+            if batch["status"] == "ended":
+                counts[self._outcome(batch, request["custom_id"])] += 1
+            else:
+                counts["processing"] += 1
+        ended = batch["status"] == "ended"
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": batch["status"],
+            "request_counts": counts,
+            "created_at": _timestamp(batch["created_at"]),
+            "expires_at": _timestamp(batch["created_at"] + timedelta(hours=24)),
+            "ended_at": _timestamp(batch["ended_at"]) if ended else None,
+            "cancel_initiated_at": _timestamp(batch["canceled_at"]) if batch["canceled_at"] else None,
+            "archived_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _results(self, batch_id: str) -> List[Dict]:
+        with self._lock:
+            self.calls["results"] += 1
+            batch = self.batches[batch_id]
+            return [
+                {"custom_id": request["custom_id"], "result": self._result(batch, request)}
+                for request in batch["requests"]
+            ]
+
+    def _result(self, batch: Dict, request: Dict) -> Dict:
+        outcome = self._outcome(batch, request["custom_id"])
+        if outcome == "errored":
+            return {
+                "type": "errored",
+                "error": {
+                    "type": "error",
+                    "error": {"type": "invalid_request_error", "message": "Error simulado por el stand-in"},
+                },
+            }
+        if outcome != "succeeded":
+            return {"type": outcome}
+        params = request.get("params", {})
+        return {
+            "type": "succeeded",
+            "message": {
+                "id": f"msg_stub_{request['custom_id']}",
+                "type": "message",
+                "role": "assistant",
+                "model": params.get("model", "stub"),
+                "content": [{"type": "text", "text": json.dumps(STUB_ANALYSIS)}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": 100, "output_tokens": 50},
+            },
+        }
+
+    # --- HTTP ---
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: str, content_type: str = "application/json", headers=()):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, status: int, message: str):
+                # x-should-retry evita que el SDK reintente errores del stand-in
+                body = json.dumps({"type": "error", "error": {"type": "not_found_error", "message": message}})
+                self._send(status, body, headers=[("x-should-retry", "false")])
+
+            def _route(self):
+                path = self.path.split("?", 1)[0]
+                match = _BATCH_PATH.match(path)
+                if not match or match.group(1) not in stub.batches:
+                    return None, None
+                return match.group(1), match.group(2)
+
+            def do_POST(self):
+                path = self.path.split("?", 1)[0]
+                length = int(self.headers.get("content-length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if path == "/v1/messages/batches":
+                    return self._send(200, json.dumps(stub._create(body)))
+                batch_id, action = self._route()
+                if batch_id and action == "/cancel":
+                    return self._send(200, json.dumps(stub._cancel(batch_id)))
+                self._error(404, f"Ruta no soportada: POST {path}")
+
+            def do_GET(self):
+                batch_id, action = self._route()
+                if batch_id and action is None:
+                    return self._send(200, json.dumps(stub._retrieve(batch_id)))
+                if batch_id and action == "/results":
+                    if stub.batches[batch_id]["status"] != "ended":
+                        return self._error(404, f"Batch {batch_id} sin resultados todavia")
+                    lines = "".join(json.dumps(entry) + "\n" for entry in stub._results(batch_id))
+                    return self._send(200, lines, "application/x-jsonl")
+                self._error(404, f"Ruta no soportada: GET {self.path}")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in local de /v1/messages/batches")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--polls", type=int, default=1, help="Consultas hasta que el batch termina")
+    for outcome in ("errored", "expired"):
+        parser.add_argument(f"--{outcome}", action="append", default=[], help=f"custom_id que termina {outcome}")
+    args = parser.parse_args()
+
+    outcomes = {custom_id: "errored" for custom_id in args.errored}
+    outcomes.update({custom_id: "expired" for custom_id in args.expired})
+    stub = BatchStub(outcomes, polls_until_ended=args.polls, host=args.host, port=args.port)
+    print(f"Stand-in de batches en {stub.base_url} (Ctrl+C para salir)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Benchmark de CPU de las rutas de scoring a escala de catalogo
+
+Genera productos sinteticos con la forma de los payloads de historial de
+DropKiller (historial diario de 6 meses con soldUnits/stock, anuncios de
+Adskiller con salesAngles, etc.) y mide, para cada funcion, operaciones por
+segundo y pico de memoria (tracemalloc). Los resultados se pueden guardar
+como baseline JSON y comparar contra ella para detectar regresiones cuando
+cambia la logica de scoring.
+
+Uso:
+    python benchmark.py                                # 1k, 100k y 1M
+    python benchmark.py --sizes 1000,100000 --only trend_analyze,margin_calculate
+    python benchmark.py --save-baseline                # guarda benchmarks/baseline.json
+    python benchmark.py --compare                      # falla si algo cae > --tolerance
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterator, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraper"))
+
+from analyzer import MarginCalculator, ViabilityScorer
+from margin_engine import calculate_margins
+from scraper import extract_competitor_data
+from scraper_auto import TrendAnalyzerV2, FiltroExperto, calculate_margin
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+CHUNK_SIZE = 2_000       # Productos generados por tanda (acota la memoria de los inputs)
+MEMORY_SAMPLE = 1_000    # Productos sobre los que se mide el pico de memoria
+HISTORY_DAYS = 180       # 6 meses, como analyze_product_deep
+
+ANGLES = ["Envio gratis", "Pago contraentrega", "Antes y despues", "Oferta limitada", "Garantia", "Testimonios"]
+PLATFORMS = [["facebook"], ["instagram"], ["facebook", "instagram"], ["tiktok"]]
+
+
+# ============== DATOS SINTETICOS ==============
+
+def _daily_sales(rng: np.random.Generator, n: int) -> np.ndarray:
+    """
+    Ventas diarias (dia 0 = hoy) con patrones mezclados: estables,
+    creciendo, cayendo, pico unico y productos nuevos con pocos dias.
+    """
+    base = rng.gamma(2.0, 6.0, size=(n, 1))
+    days = np.arange(HISTORY_DAYS)[None, :]
+    kind = rng.integers(0, 5, size=(n, 1))
+    slope = np.where(kind == 1, 0.01, np.where(kind == 2, -0.008, 0.0))
+    curve = base * np.clip(1 - slope * days, 0.05, None)
+    peak = (kind == 3) & (np.abs(days - rng.integers(10, 60, size=(n, 1))) < 5)
+    curve = np.where(peak, curve * 8, curve)
+    sales = rng.poisson(curve)
+    young = kind == 4
+    sales[np.broadcast_to(young, sales.shape) & (days >= rng.integers(7, 40, size=(n, 1)))] = 0
+    return sales
+
+
+def iter_products(n: int, seed: int = 7) -> Iterator[List[Dict]]:
+    """Tandas de productos con historial diario como el de la API de DropKiller"""
+    rng = np.random.default_rng(seed)
+    today = date(2025, 1, 1)
+    dates = [(today - timedelta(days=d)).isoformat() for d in range(HISTORY_DAYS)]
+
+    for start in range(0, n, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, n - start)
+        sales = _daily_sales(rng, size)
+        stock = rng.integers(0, 2000, size=size)
+        cost = rng.integers(8, 120, size=size) * 1000
+        chunk = []
+        for i in range(size):
+            row = sales[i].tolist()
+            history = [
+                {"date": dates[d], "soldUnits": row[d], "stock": int(stock[i]) + d, "billing": row[d] * int(cost[i]) * 2}
+                for d in range(HISTORY_DAYS)
+            ]
+            # La API entrega el historial en orden cronologico
+            history.reverse()
+            chunk.append({
+                "externalId": str(start + i),
+                "name": f"Producto sintetico {start + i}",
+                "providerPrice": int(cost[i]),
+                "salePrice": int(cost[i]),
+                "suggestedPrice": int(cost[i] * 2.4),
+                "sales7d": int(sum(row[:7])),
+                "sales30d": int(sum(row[:30])),
+                "stock": int(stock[i]),
+                "history": history,
+            })
+        yield chunk
+
+
+def iter_ads(n: int, seed: int = 11) -> Iterator[List[Dict]]:
+    """Tandas de anuncios con la forma de la respuesta de Adskiller"""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, n - start)
+        likes = rng.integers(0, 5000, size=size)
+        chunk = []
+        for i in range(size):
+            k = int(rng.integers(0, 4))
+            chunk.append({
+                "page_name": f"Tienda {start + i}",
+                "company_name": f"Empresa {i % 97}",
+                "url": f"https://facebook.com/ads/{start + i}",
+                "link": f"https://tienda{i % 97}.com/p/{start + i}",
+                "likes": int(likes[i]),
+                "comments": int(likes[i] // 10),
+                "shares": int(likes[i] // 25),
+                "active_time": int(rng.integers(0, 90)) * 86400,
+                "salesAngles": [{"angle": ANGLES[(i + j) % len(ANGLES)]} for j in range(k)],
+                "images": [f"https://cdn.example.com/{start + i}.jpg"] if i % 3 else [],
+                "videos": [f"https://cdn.example.com/{start + i}.mp4"] if i % 2 else [],
+                "cta": "SHOP_NOW",
+                "description": "Descripcion del anuncio " * 30,
+                "platforms": PLATFORMS[i % len(PLATFORMS)],
+            })
+        yield chunk
+
+
+# ============== CASOS ==============
+# Cada caso recibe una tanda de inputs ya preparados y los procesa; la
+# preparacion (generar historiales, calcular trends previos) no se mide.
+
+def _prepare_margin(chunk: List[Dict]) -> List[Dict]:
+    return chunk
+
+
+def _run_margin(chunk: List[Dict]):
+    for p in chunk:
+        MarginCalculator.calculate(cost_price=p["salePrice"], sale_price=p["suggestedPrice"])
+
+
+def _prepare_viability(chunk: List[Dict]) -> List[tuple]:
+    prepared = []
+    for p in chunk:
+        margin = MarginCalculator.calculate(cost_price=p["salePrice"], sale_price=p["suggestedPrice"])
+        data = {"name": p["name"], "sales_7d": p["sales7d"], "sales_30d": p["sales30d"], "stock": p["stock"]}
+        competitors = [{"engagement_level": "Alto"}] * (int(p["externalId"]) % 12)
+        prepared.append((data, margin, competitors, p["history"]))
+    return prepared
+
+
+def _run_viability(chunk: List[tuple]):
+    for data, margin, competitors, history in chunk:
+        ViabilityScorer.calculate(product=data, margin_data=margin, competitors=competitors, sales_history=history)
+
+
+def _prepare_trend(chunk: List[Dict]) -> List[List[Dict]]:
+    return [p["history"] for p in chunk]
+
+
+def _run_trend(chunk: List[List[Dict]]):
+    for history in chunk:
+        TrendAnalyzerV2.analyze(history)
+
+
+def _prepare_trend_batch(chunk: List[Dict]):
+    return TrendAnalyzerV2.history_matrix([p["history"] for p in chunk])
+
+
+def _run_trend_batch(prepared):
+    sales, lengths = prepared
+    TrendAnalyzerV2.analyze_batch(sales, lengths)
+
+
+def _prepare_filtro(chunk: List[Dict]) -> List[tuple]:
+    return [
+        (p, TrendAnalyzerV2.analyze(p["history"]), calculate_margin(p["providerPrice"]))
+        for p in chunk
+    ]
+
+
+def _run_filtro(chunk: List[tuple]):
+    for product, trend, margin in chunk:
+        FiltroExperto.aplicar_filtros(product, trend, margin)
+
+
+def _prepare_margin_engine(chunk: List[Dict]):
+    return (
+        np.array([p["salePrice"] for p in chunk]),
+        np.array([p["suggestedPrice"] for p in chunk])
+    )
+
+
+def _run_margin_engine(prepared):
+    cost, sale = prepared
+    calculate_margins(cost, sale)
+
+
+def _run_competitors(chunk: List[Dict]):
+    # Por producto llegan ~25 anuncios (15 Facebook + 10 TikTok)
+    for start in range(0, len(chunk), 25):
+        extract_competitor_data(chunk[start:start + 25])
+
+
+CASES = {
+    # nombre: (generador de inputs, preparacion, funcion medida, unidad)
+    "margin_calculate": (iter_products, _prepare_margin, _run_margin, "productos"),
+    "margin_engine": (iter_products, _prepare_margin_engine, _run_margin_engine, "productos"),
+    "viability_score": (iter_products, _prepare_viability, _run_viability, "productos"),
+    "trend_analyze": (iter_products, _prepare_trend, _run_trend, "productos"),
+    "trend_analyze_batch": (iter_products, _prepare_trend_batch, _run_trend_batch, "productos"),
+    "filtro_experto": (iter_products, _prepare_filtro, _run_filtro, "productos"),
+    "extract_competitors": (iter_ads, lambda chunk: chunk, _run_competitors, "anuncios"),
+}
+
+
+# ============== MEDICION ==============
+
+def _peak_memory(prepare: Callable, run: Callable, chunk: List) -> int:
+    """Pico de memoria (bytes) de run sobre una muestra, sin contar los inputs"""
+    sample = prepare(chunk[:MEMORY_SAMPLE])
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        run(sample)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - baseline)
+
+
+def run_size(names: List[str], size: int) -> Dict[str, Dict]:
+    """
+    Corre los casos pedidos sobre size inputs. Los casos que comparten
+    generador reciben las mismas tandas (se generan una sola vez).
+    """
+    results = {}
+    for generate in dict.fromkeys(CASES[name][0] for name in names):
+        group = [name for name in names if CASES[name][0] is generate]
+        elapsed = dict.fromkeys(group, 0.0)
+        peaks: Dict[str, int] = {}
+
+        for chunk in generate(size):
+            for name in group:
+                _, prepare, run, _ = CASES[name]
+                if name not in peaks:
+                    peaks[name] = _peak_memory(prepare, run, chunk)
+                prepared = prepare(chunk)
+                gc.disable()
+                started = time.perf_counter()
+                try:
+                    run(prepared)
+                finally:
+                    elapsed[name] += time.perf_counter() - started
+                    gc.enable()
+                del prepared
+
+        for name in group:
+            results[name] = {
+                "size": size,
+                "unit": CASES[name][3],
+                "seconds": round(elapsed[name], 4),
+                "ops_per_sec": round(size / elapsed[name], 1) if elapsed[name] > 0 else None,
+                "peak_kb_per_1k": round(peaks.get(name, 0) / 1024 * 1000 / min(size, MEMORY_SAMPLE), 1),
+            }
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Casos cuyo ops/s cayo mas que tolerance (fraccion) contra la baseline"""
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if not previous or not previous.get("ops_per_sec") or not result.get("ops_per_sec"):
+            continue
+        change = result["ops_per_sec"] / previous["ops_per_sec"] - 1
+        marker = ""
+        if change < -tolerance:
+            marker = "  << REGRESION"
+            regressions.append(key)
+        print(f"  {key:<32} {previous['ops_per_sec']:>14,.0f} -> {result['ops_per_sec']:>14,.0f} ({change:+.1%}){marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las funciones de scoring")
+    parser.add_argument("--sizes", help="Tamanos separados por coma", default=",".join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument("--only", help="Casos separados por coma (default: todos)")
+    parser.add_argument("--baseline", help="Archivo JSON de baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar los resultados como baseline")
+    parser.add_argument("--compare", action="store_true", help="Comparar contra la baseline")
+    parser.add_argument("--tolerance", type=float, help="Caida de ops/s tolerada (0.15 = 15%%)", default=0.15)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"Casos desconocidos: {', '.join(unknown)} (disponibles: {', '.join(CASES)})")
+
+    print(f"{'caso':<22} {'n':>10} {'ops/s':>14} {'seg':>9} {'KB pico/1k':>11}")
+    results = {}
+    for size in sizes:
+        for name, result in run_size(names, size).items():
+            results[f"{name}@{size}"] = result
+            print(
+                f"{name:<22} {size:>10,} {result['ops_per_sec']:>14,.0f} "
+                f"{result['seconds']:>9.2f} {result['peak_kb_per_1k']:>11,.1f}"
+            )
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo existe baseline en {args.baseline} (usa --save-baseline)")
+            exit_code = 1
+        else:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            print(f"\nComparando contra {args.baseline} ({baseline.get('created_at', '?')}):")
+            regressions = compare(results, baseline, args.tolerance)
+            if regressions:
+                print(f"\n{len(regressions)} regresiones de mas de {args.tolerance:.0%}")
+                exit_code = 1
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline guardada en {args.baseline}")
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
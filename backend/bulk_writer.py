@@ -0,0 +1,99 @@
+"""
+Escritura en bloque para analyzed_products
+
+Acumula filas y las envia como upserts JSON-array en chunks. Si un chunk
+se rechaza por una fila invalida (400/409/422) se parte en mitades hasta
+aislar las filas culpables, asi un solo registro malo no tumba los demas.
+Un error de red o un 5xx (ya reintentados por el cliente HTTP) no es culpa
+de ninguna fila: el chunk se marca fallido una sola vez, sin partirlo.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence
+
+PRODUCT_KEY_FIELDS = ("external_id", "platform", "country_code")
+
+# Status con los que el backend rechaza filas puntuales; solo estos se bisectan
+ROW_ERROR_STATUSES = (400, 409, 422)
+
+
+def is_row_error(error: Exception) -> bool:
+    """True si el error viene de alguna fila del chunk (tiene status_code 4xx de fila)"""
+    return getattr(error, "status_code", None) in ROW_ERROR_STATUSES
+
+
+@dataclass
+class RowFailure:
+    """Fila que no se pudo escribir"""
+    key: str
+    error: str
+
+
+class BulkUpserter:
+    """Buffer de filas que se vacia en upserts por chunks"""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Dict]], None],
+        chunk_size: int = 200,
+        key_fields: Sequence[str] = PRODUCT_KEY_FIELDS
+    ):
+        """
+        flush_fn recibe una lista de filas y debe lanzar excepcion si el
+        upsert falla, con status_code si el backend rechazo filas.
+        """
+        self.flush_fn = flush_fn
+        self.chunk_size = max(1, chunk_size)
+        self.key_fields = tuple(key_fields)
+
+        self.rows_written = 0
+        self.requests_sent = 0
+        self.failures: List[RowFailure] = []
+
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, row: Dict) -> List[RowFailure]:
+        """Agrega una fila; si el buffer llega a chunk_size se envia"""
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) < self.chunk_size:
+                return []
+            chunk = self._buffer
+            self._buffer = []
+        return self._write(chunk)
+
+    def flush(self) -> List[RowFailure]:
+        """Envia todo lo pendiente"""
+        with self._lock:
+            pending = self._buffer
+            self._buffer = []
+        failures = []
+        for i in range(0, len(pending), self.chunk_size):
+            failures.extend(self._write(pending[i:i + self.chunk_size]))
+        return failures
+
+    def _row_key(self, row: Dict) -> str:
+        return ",".join(str(row.get(f, "")) for f in self.key_fields)
+
+    def _write(self, rows: List[Dict]) -> List[RowFailure]:
+        if not rows:
+            return []
+
+        with self._lock:
+            self.requests_sent += 1
+        try:
+            self.flush_fn(rows)
+        except Exception as e:
+            if len(rows) == 1 or not is_row_error(e):
+                error = str(e)[:300]
+                failures = [RowFailure(key=self._row_key(row), error=error) for row in rows]
+                with self._lock:
+                    self.failures.extend(failures)
+                return failures
+            mid = len(rows) // 2
+            return self._write(rows[:mid]) + self._write(rows[mid:])
+
+        with self._lock:
+            self.rows_written += len(rows)
+        return []
@@ -12,6 +12,7 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")  # anon key
 
 # Claude API
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None  # Ej: batch_stub.py local
 
 # DropKiller JWT (se pasa como argumento o env var)
 DROPKILLER_JWT = os.getenv("DROPKILLER_JWT", "")
@@ -60,3 +61,118 @@ ANALYSIS_CONFIG = {
     "min_viable_margin": 10000, # Mínimo $10,000 COP de margen neto para ser viable
     "min_viable_roi": 15,      # Mínimo 15% ROI para ser viable
 }
+
+# Cliente HTTP compartido (pool de conexiones)
+HTTP_CONFIG = {
+    "max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", "50")),
+    "max_keepalive_connections": int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+    "keepalive_expiry": 30.0,  # Segundos que una conexion ociosa sigue abierta
+    "http2": os.getenv("HTTP2", "0") == "1",  # Requiere httpx[http2]
+    "timeout": 30.0,
+}
+
+# Grabacion/replay de trafico HTTP (ver http_recorder.py)
+HTTP_CASSETTE_CONFIG = {
+    "mode": os.getenv("HTTP_CASSETTE", ""),  # "", "record" o "replay"
+    "path": os.getenv("HTTP_CASSETTE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "cassette.jsonl")),
+    "replay_latency": float(os.getenv("HTTP_REPLAY_LATENCY", "0")),  # 1 = latencia grabada, 0 = sin espera
+}
+
+# Rate limit por host (token bucket compartido por todos los scrapers).
+# rate = requests por segundo sostenidas, burst = requests seguidas permitidas.
+# Hosts que no estan aca no se limitan (ej: Supabase).
+RATE_LIMIT_CONFIG = {
+    "app.dropkiller.com": {
+        "rate": float(os.getenv("DROPKILLER_RATE", "4")),
+        "burst": int(os.getenv("DROPKILLER_BURST", "8")),
+    },
+    "extension-api.dropkiller.com": {
+        "rate": float(os.getenv("DROPKILLER_PUBLIC_RATE", "10")),
+        "burst": int(os.getenv("DROPKILLER_PUBLIC_BURST", "20")),
+    },
+}
+
+# Reintentos de requests salientes (backoff exponencial con jitter)
+RETRY_CONFIG = {
+    "max_retries": int(os.getenv("HTTP_MAX_RETRIES", "3")),
+    "base_delay": 0.5,        # Segundos del primer backoff
+    "max_delay": 20.0,        # Tope de cada backoff
+    "max_retry_after": 60.0,  # Tope para el Retry-After que mande el servidor
+    "retry_statuses": (429, 500, 502, 503, 504, 529),
+}
+
+# Metricas por etapa de cada corrida (.json o .prom para formato Prometheus)
+METRICS_CONFIG = {
+    "path": os.getenv("PIPELINE_METRICS_PATH", os.path.join(os.path.dirname(__file__), ".cache", "metrics.json")),
+}
+
+# Escritura en Supabase
+DB_CONFIG = {
+    "upsert_chunk_size": int(os.getenv("UPSERT_CHUNK_SIZE", "200")),  # Filas por request
+}
+
+# Paginacion del dashboard de DropKiller (iter_products)
+PAGINATION_CONFIG = {
+    "page_size": int(os.getenv("DROPKILLER_PAGE_SIZE", "50")),
+    "max_pages": int(os.getenv("DROPKILLER_MAX_PAGES", "40")),
+    "prefetch": 2,               # Paginas descargandose mientras se analiza la actual
+}
+
+# Historial de ventas (API publica de DropKiller)
+HISTORY_CONFIG = {
+    "concurrency": 8,            # Batches en vuelo a la vez
+    "initial_batch_size": 10,
+    "min_batch_size": 1,
+    "max_batch_size": 50,
+    "max_url_length": 2000,      # Limite conservador de URL para el GET
+    "target_latency": 3.0,       # Segundos; por encima se achican los batches
+    # Sin reintentos propios: los hace la RetryPolicy del HttpClient (RETRY_CONFIG)
+}
+
+# Cache local de analisis de Claude
+CACHE_CONFIG = {
+    "path": os.getenv("ANALYSIS_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "analysis.sqlite")),
+    "ttl_seconds": int(os.getenv("ANALYSIS_CACHE_TTL", str(3 * 24 * 3600))),  # 3 dias
+    "max_entries": 50000,
+}
+
+# Analisis offline con Message Batches de Claude
+BATCH_CONFIG = {
+    "max_requests_per_batch": 10000,
+    "max_wait_seconds": 24 * 3600,  # La API garantiza resultado en 24h
+}
+
+# Varios productos por request a Claude (ProductAnalyzer.analyze_products)
+MULTI_PRODUCT_CONFIG = {
+    "products_per_request": int(os.getenv("CLAUDE_PRODUCTS_PER_REQUEST", "1")),  # 1 = un prompt por producto
+    "max_input_tokens": 12000,        # Presupuesto estimado del prompt agrupado
+    "output_tokens_per_product": 900, # max_tokens = esto x productos del grupo
+}
+
+# Busqueda de precio optimo (margin_engine)
+PRICING_CONFIG = {
+    "price_elasticity": 4.0,         # Con 4.0 el optimo cae cerca de breakeven x 1.3 (regla actual)
+    "price_grid": (1.0, 2.5, 50),    # Precios candidatos: de 1.0x a 2.5x el breakeven, 50 puntos
+    "chunk_size": 20000,             # Productos por bloque al evaluar la grilla
+}
+
+# Cache de busquedas de Adskiller (find_competitors)
+SEARCH_CACHE_CONFIG = {
+    "ttl_seconds": 6 * 3600,   # Los anuncios activos no cambian tanto en una corrida
+    "max_entries": 5000,
+}
+
+# Corridas incrementales: huella de cada producto en SQLite local.
+# Subir SCORING_VERSION al cambiar la logica de scoring/recomendacion
+# obliga a reprocesar todo el catalogo.
+INCREMENTAL_CONFIG = {
+    "path": os.getenv("FINGERPRINT_STORE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "fingerprints.sqlite")),
+    "scoring_version": "1",
+    "max_age_seconds": int(os.getenv("FINGERPRINT_MAX_AGE", str(7 * 24 * 3600))),  # Reproceso forzado (competencia cambia)
+}
+
+# Donde se guardan los resultados: supabase (remoto) o sqlite (local)
+STORAGE_CONFIG = {
+    "backend": os.getenv("STORAGE_BACKEND", "supabase"),
+    "sqlite_path": os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "estrategas.sqlite")),
+}
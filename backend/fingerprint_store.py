@@ -0,0 +1,111 @@
+"""
+Huellas de productos para corridas incrementales
+
+Cada producto se resume en un hash de lo que mueve su analisis: precios,
+stock, ventas, historial y los umbrales de config (mas la version de
+scoring). Se guarda en SQLite junto con la ultima fila escrita en Supabase;
+si la huella no cambio, el pipeline reescribe esa fila con analyzed_at
+nuevo en vez de volver a buscar competencia y preguntarle a Claude.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from config import ANALYSIS_CONFIG, COUNTRIES, DEFAULT_FILTERS, INCREMENTAL_CONFIG
+
+# Campos del producto (DropKiller dashboard y API publica) que entran en la huella
+_FINGERPRINT_FIELDS = (
+    "salePrice", "price", "suggestedPrice", "suggested_price",
+    "sales7d", "soldUnits7d", "sales30d", "soldUnits30d",
+    "stock", "currentStock", "history",
+)
+
+
+def product_fingerprint(
+    product: Dict,
+    country_code: str,
+    scoring_version: str = INCREMENTAL_CONFIG["scoring_version"],
+    ai_enabled: bool = True
+) -> str:
+    """
+    Hash estable de los inputs del analisis de un producto. ai_enabled
+    separa las filas sin analisis de Claude (--no-ai o sin API key) para
+    que una corrida con IA no las tome como vigentes.
+    """
+    payload = json.dumps(
+        {
+            "version": scoring_version,
+            "ai": ai_enabled,
+            "country": country_code,
+            "costs": COUNTRIES.get(country_code, COUNTRIES["CO"]),
+            "analysis": ANALYSIS_CONFIG,
+            "filters": DEFAULT_FILTERS,
+            "product": {field: product.get(field) for field in _FINGERPRINT_FIELDS},
+        },
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FingerprintStore:
+    """Ultima huella y fila guardada por producto, en SQLite"""
+
+    def __init__(
+        self,
+        path: str = INCREMENTAL_CONFIG["path"],
+        max_age_seconds: int = INCREMENTAL_CONFIG["max_age_seconds"]
+    ):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.stats = {"unchanged": 0, "changed": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                row TEXT NOT NULL,
+                analyzed_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(external_id: str, platform: str, country_code: str) -> str:
+        return f"{platform}:{country_code}:{external_id}"
+
+    def get_unchanged(self, key: str, fingerprint: str) -> Optional[Dict]:
+        """
+        Devuelve la ultima fila guardada si la huella coincide y el analisis
+        no es mas viejo que max_age_seconds; si no, None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, row, analyzed_at FROM products WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[0] != fingerprint or time.time() - row[2] > self.max_age_seconds:
+                self.stats["changed"] += 1
+                return None
+            self.stats["unchanged"] += 1
+        return json.loads(row[1])
+
+    def set(self, key: str, fingerprint: str, row: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products (key, fingerprint, row, analyzed_at) VALUES (?, ?, ?, ?)",
+                (key, fingerprint, json.dumps(row, ensure_ascii=False, default=str), time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
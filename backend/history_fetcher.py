@@ -0,0 +1,146 @@
+"""
+Fetcher de historial de ventas de la API publica de DropKiller
+
+Reparte los IDs en batches que corren en paralelo bajo un limite de
+concurrencia. El tamano del batch se ajusta al largo de la URL y a la
+latencia observada (sube mientras responde rapido, se parte a la mitad
+cuando se pone lento o falla). Los reintentos los hace solo la RetryPolicy
+del HttpClient: un batch que falla despues de esos reintentos no se vuelve
+a encolar y sus IDs quedan en stats["failed_ids"]. Los resultados se
+entregan a medida que llegan.
+"""
+import asyncio
+import queue
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+from config import HISTORY_CONFIG
+from http_client import HttpClient, get_http_client
+
+HISTORY_URL = "https://extension-api.dropkiller.com/api/v3/history"
+
+_DONE = object()
+_ENCODED_SEPARATOR = "%2C"
+
+
+class HistoryFetcher:
+    """Historial de ventas en batches concurrentes y adaptativos"""
+
+    def __init__(
+        self,
+        http: Optional[HttpClient] = None,
+        concurrency: int = HISTORY_CONFIG["concurrency"],
+        initial_batch_size: int = HISTORY_CONFIG["initial_batch_size"],
+        min_batch_size: int = HISTORY_CONFIG["min_batch_size"],
+        max_batch_size: int = HISTORY_CONFIG["max_batch_size"],
+        max_url_length: int = HISTORY_CONFIG["max_url_length"],
+        target_latency: float = HISTORY_CONFIG["target_latency"],
+        url: str = HISTORY_URL
+    ):
+        self.http = http or get_http_client()
+        self.concurrency = max(1, concurrency)
+        self.batch_size = initial_batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_url_length = max_url_length
+        self.target_latency = target_latency
+        self.url = url
+
+        self.stats = {"batches": 0, "failed_ids": []}
+
+    # ---------- armado de batches ----------
+
+    def _take_batch(self, pending: Deque[str], country: str) -> List[str]:
+        """Saca el siguiente batch respetando tamano actual y largo de URL"""
+        length = len(self.url) + len("?ids=&country=") + len(country)
+        batch = []
+        while pending and len(batch) < self.batch_size:
+            # httpx codifica la coma como %2C: cada separador ocupa 3 caracteres
+            extra = len(pending[0]) + (len(_ENCODED_SEPARATOR) if batch else 0)
+            if batch and length + extra > self.max_url_length:
+                break
+            length += extra
+            batch.append(pending.popleft())
+        return batch
+
+    def _on_success(self, latency: float):
+        if latency <= self.target_latency:
+            self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+        else:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    def _on_failure(self):
+        self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    # ---------- fetch ----------
+
+    async def _fetch_batch(self, batch: List[str], country: str) -> List[Dict]:
+        response = await self.http.get(
+            self.url,
+            params={"ids": ",".join(batch), "country": country},
+            headers={"Accept": "application/json"}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        data = response.json()
+        return data if isinstance(data, list) else []
+
+    async def aiter_history(self, product_ids: List[str], country: str = "CO") -> AsyncIterator[Dict]:
+        """Entrega cada producto con historial apenas llega su batch"""
+        pending: Deque[str] = deque(dict.fromkeys(str(pid) for pid in product_ids if pid))
+        seen = set()
+        in_flight = {}
+
+        while pending or in_flight:
+            while pending and len(in_flight) < self.concurrency:
+                batch = self._take_batch(pending, country)
+                task = asyncio.ensure_future(self._fetch_batch(batch, country))
+                in_flight[task] = (batch, time.perf_counter())
+                self.stats["batches"] += 1
+
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                batch, started = in_flight.pop(task)
+                try:
+                    items = task.result()
+                except Exception as e:
+                    # El HttpClient ya reintento; aca solo se achican los batches siguientes
+                    self._on_failure()
+                    print(f"Error historial ({len(batch)} IDs sin datos): {e}")
+                    self.stats["failed_ids"].extend(batch)
+                    continue
+
+                self._on_success(time.perf_counter() - started)
+                for item in items:
+                    ext_id = item.get("externalId")
+                    if ext_id and ext_id not in seen:
+                        seen.add(ext_id)
+                        yield item
+
+    async def afetch(self, product_ids: List[str], country: str = "CO") -> Dict[str, Dict]:
+        return {item["externalId"]: item async for item in self.aiter_history(product_ids, country)}
+
+    # ---------- wrappers sync ----------
+
+    def iter_history(self, product_ids: List[str], country: str = "CO") -> Iterator[Dict]:
+        """Version sync de aiter_history: un generador que va entregando resultados"""
+        results: "queue.Queue" = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in self.aiter_history(product_ids, country):
+                    results.put(item)
+            finally:
+                results.put(_DONE)
+
+        future = self.http.submit(pump())
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            yield item
+        future.result()
+
+    def fetch(self, product_ids: List[str], country: str = "CO") -> Dict[str, Dict]:
+        return self.http.run(self.afetch(product_ids, country))
@@ -0,0 +1,324 @@
+"""
+Cliente HTTP compartido (httpx async) para los scrapers
+
+Todas las clases de scraping comparten un unico pool de conexiones con
+keep-alive, asi que decenas de requests en vuelo reutilizan las mismas
+conexiones TLS. El pool vive en un event loop propio (hilo de fondo) y
+expone wrappers sync para el codigo que no es async (run.py).
+
+Cada request pasa por un token bucket del host destino (RATE_LIMIT_CONFIG),
+asi la tasa total queda dentro de la cuota sin importar cuantos workers
+haya corriendo. Los 429/5xx y errores de red se reintentan segun
+RetryPolicy (RETRY_CONFIG).
+"""
+import asyncio
+import atexit
+import random
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Dict, Optional, TypeVar
+
+import httpx
+
+from config import HTTP_CONFIG, RATE_LIMIT_CONFIG, RETRY_CONFIG
+from http_recorder import cassette_transport
+from metrics import record_error, record_request
+
+T = TypeVar("T")
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class TokenBucket:
+    """
+    Token bucket async. Se usa siempre desde el loop del cliente, asi que no
+    necesita locks: cada acquire reserva su token (el saldo puede quedar
+    negativo) y espera lo que falte, lo que da orden FIFO entre los que esperan.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0}
+
+    async def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        self.stats["acquired"] += 1
+
+        if self.tokens < 0:
+            wait = -self.tokens / self.rate
+            self.stats["waited"] += 1
+            self.stats["wait_seconds"] += wait
+            await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    """Un token bucket por host"""
+
+    def __init__(self, limits: Dict[str, Dict]):
+        self.buckets = {
+            host: TokenBucket(cfg["rate"], cfg["burst"])
+            for host, cfg in limits.items()
+            if cfg.get("rate")
+        }
+
+    async def acquire(self, host: str):
+        bucket = self.buckets.get(host)
+        if bucket is not None:
+            await bucket.acquire()
+
+    @property
+    def stats(self) -> Dict[str, Dict]:
+        return {host: dict(bucket.stats) for host, bucket in self.buckets.items()}
+
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# Errores donde el request nunca llego al servidor: se pueden reintentar
+# aunque el endpoint no sea idempotente
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class RetryPolicy:
+    """
+    Backoff exponencial con jitter completo y soporte de Retry-After.
+
+    Reglas de idempotencia: un endpoint idempotente se reintenta ante
+    cualquier error de red o status de retry_statuses. Uno que no lo es
+    (POST por defecto) solo si el request no llego a procesarse: error de
+    conexion o 429.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = RETRY_CONFIG["max_retries"],
+        base_delay: float = RETRY_CONFIG["base_delay"],
+        max_delay: float = RETRY_CONFIG["max_delay"],
+        max_retry_after: float = RETRY_CONFIG["max_retry_after"],
+        retry_statuses=RETRY_CONFIG["retry_statuses"]
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def retry_on_status(self, status_code: int, idempotent: bool) -> bool:
+        if status_code not in self.retry_statuses:
+            return False
+        return idempotent or status_code == 429
+
+    def retry_on_error(self, error: Exception, idempotent: bool) -> bool:
+        if idempotent:
+            return isinstance(error, httpx.TransportError)
+        return isinstance(error, _NOT_SENT_ERRORS)
+
+    def _retry_after(self, response: Optional[httpx.Response]) -> Optional[float]:
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(0.0, seconds), self.max_retry_after)
+
+    def delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Segundos a esperar antes del reintento numero attempt + 1"""
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class HttpClient:
+    """Pool de conexiones async con wrappers sync"""
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_CONFIG["max_connections"],
+        max_keepalive_connections: int = HTTP_CONFIG["max_keepalive_connections"],
+        keepalive_expiry: float = HTTP_CONFIG["keepalive_expiry"],
+        http2: bool = HTTP_CONFIG["http2"],
+        timeout: float = HTTP_CONFIG["timeout"],
+        rate_limits: Optional[Dict[str, Dict]] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        if http2 and not _http2_available():
+            print("Warning: HTTP/2 requiere 'pip install httpx[http2]', usando HTTP/1.1")
+            http2 = False
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http2 = http2
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(RATE_LIMIT_CONFIG if rate_limits is None else rate_limits)
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Con HTTP_CASSETTE activo el trafico se graba o se sirve del cassette
+        self.transport = transport or cassette_transport(
+            async_transport=httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+        )
+        self.stats = {"requests": 0, "retries": 0, "retry_wait_seconds": 0.0, "gave_up": 0}
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # ---------- event loop de fondo ----------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def _run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=_run, name="http-client-loop", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+        return self._loop
+
+    def submit(self, coro: Awaitable[T]) -> "Future[T]":
+        """Programa una corrutina en el loop del cliente sin esperarla"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """Ejecuta una corrutina en el loop del cliente y espera el resultado"""
+        loop = self._ensure_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("HttpClient.run() no se puede llamar desde el loop del cliente, usa await")
+        return self.submit(coro).result()
+
+    # ---------- requests ----------
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                http2=self.http2,
+                timeout=self.timeout,
+                headers={"User-Agent": DEFAULT_USER_AGENT},
+                transport=self.transport
+            )
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        idempotent: Optional[bool] = None,
+        retry: Optional[RetryPolicy] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Request con rate limit y reintentos. idempotent marca si el endpoint
+        se puede repetir sin efectos (por defecto segun el metodo). Si se
+        agotan los reintentos devuelve la ultima respuesta o lanza el error.
+        """
+        policy = retry or self.retry_policy
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        host = httpx.URL(url).host
+        attempt = 0
+
+        while True:
+            await self.rate_limiter.acquire(host)
+            self.stats["requests"] += 1
+            try:
+                response = await self._get_client().request(method, url, **kwargs)
+                record_request(len(response.request.content), response.num_bytes_downloaded)
+            except httpx.TransportError as e:
+                if not policy.retry_on_error(e, idempotent):
+                    record_error()
+                    raise
+                if attempt >= policy.max_retries:
+                    self.stats["gave_up"] += 1
+                    record_error()
+                    raise
+                wait = policy.delay(attempt)
+            else:
+                retry = policy.retry_on_status(response.status_code, idempotent)
+                if not retry or attempt >= policy.max_retries:
+                    if retry:
+                        self.stats["gave_up"] += 1
+                    if not response.is_success:
+                        record_error()
+                    return response
+                wait = policy.delay(attempt, response)
+
+            attempt += 1
+            self.stats["retries"] += 1
+            self.stats["retry_wait_seconds"] += wait
+            await asyncio.sleep(wait)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def request_sync(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self.run(self.request(method, url, **kwargs))
+
+    # ---------- cierre ----------
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._loop.is_running():
+            self.run(self.aclose())
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+        self._loop = None
+        self._thread = None
+
+
+_default_client: Optional[HttpClient] = None
+_default_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Cliente compartido por todo el proceso"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+            atexit.register(_default_client.close)
+        return _default_client
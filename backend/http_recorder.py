@@ -0,0 +1,304 @@
+"""
+Grabacion y replay de trafico HTTP (DropKiller, Adskiller, Claude, Supabase)
+
+En modo record cada par request/response que pasa por el cliente HTTP
+compartido o por el SDK de Anthropic se agrega a un cassette JSONL, con
+credenciales (headers y query params) redactadas. En modo replay se sirven
+esas respuestas sin red, en el mismo orden en que se grabaron, y opcionalmente
+con la latencia observada. Asi se puede medir el pipeline contra un corpus
+fijo de trafico.
+
+Se activa con HTTP_CASSETTE=record|replay (ver HTTP_CASSETTE_CONFIG).
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+from config import HTTP_CASSETTE_CONFIG
+
+REDACTED = "REDACTED"
+
+# Headers y query params que nunca se escriben a disco
+SECRET_HEADERS = frozenset({"authorization", "x-api-key", "apikey", "cookie", "set-cookie", "proxy-authorization"})
+SECRET_PARAMS = frozenset({"key", "apikey", "api_key", "token", "access_token", "jwt"})
+
+# El body ya se guarda decodificado, estos headers no aplican al replay
+_DROP_RESPONSE_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding", "connection"})
+
+
+def _redact_url(url: httpx.URL) -> str:
+    params = [
+        (name, REDACTED if name.lower() in SECRET_PARAMS else value)
+        for name, value in parse_qsl(url.query.decode("ascii"), keep_blank_values=True)
+    ]
+    params.sort()
+    base = str(url.copy_with(query=None))
+    return f"{base}?{urlencode(params)}" if params else base
+
+
+def _redact_headers(headers: httpx.Headers, drop=frozenset()) -> Dict[str, str]:
+    return {
+        name: REDACTED if name.lower() in SECRET_HEADERS else value
+        for name, value in headers.items()
+        if name.lower() not in drop
+    }
+
+
+def _canonical_body(content: bytes) -> bytes:
+    """JSON con llaves ordenadas para que el hash no dependa del orden"""
+    if not content:
+        return b""
+    try:
+        return json.dumps(json.loads(content), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return content
+
+
+def request_keys(request: httpx.Request) -> Tuple[str, str]:
+    """
+    (llave exacta, llave suelta). La exacta incluye el body; la suelta solo
+    metodo + URL, para requests cuyo body cambia entre corridas (ej: upserts
+    con analyzed_at).
+    """
+    loose = f"{request.method} {_redact_url(request.url)}"
+    digest = hashlib.sha256(_canonical_body(request.content)).hexdigest()
+    return f"{loose} {digest}", loose
+
+
+def _encode_body(content: bytes) -> Dict:
+    try:
+        return {"body": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode_body(entry: Dict) -> bytes:
+    if "body_b64" in entry:
+        return base64.b64decode(entry["body_b64"])
+    return entry.get("body", "").encode("utf-8")
+
+
+class Cassette:
+    """Archivo JSONL de intercambios grabados"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._exact: Dict[str, List[Dict]] = defaultdict(list)
+        self._loose: Dict[str, List[Dict]] = defaultdict(list)
+        self._served: Dict[str, int] = defaultdict(int)
+        self.stats = {"recorded": 0, "hits": 0, "loose_hits": 0, "misses": 0}
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._exact[entry["key"]].append(entry)
+                    self._loose[entry["loose_key"]].append(entry)
+        return self
+
+    def append(self, request: httpx.Request, response: httpx.Response, content: bytes, elapsed: float):
+        exact, loose = request_keys(request)
+        entry = {
+            "key": exact,
+            "loose_key": loose,
+            "method": request.method,
+            "url": _redact_url(request.url),
+            "request_headers": _redact_headers(request.headers),
+            "status": response.status_code,
+            "headers": _redact_headers(response.headers, drop=_DROP_RESPONSE_HEADERS),
+            "elapsed": round(elapsed, 4),
+            **_encode_body(content),
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.stats["recorded"] += 1
+
+    def _next(self, index: Dict[str, List[Dict]], key: str) -> Optional[Dict]:
+        entries = index.get(key)
+        if not entries:
+            return None
+        position = self._served[key]
+        self._served[key] = position + 1
+        # Pasado el final se repite la ultima respuesta
+        return entries[min(position, len(entries) - 1)]
+
+    def lookup(self, request: httpx.Request) -> Optional[Dict]:
+        """Siguiente respuesta grabada para este request (en orden de grabacion)"""
+        exact, loose = request_keys(request)
+        with self._lock:
+            entry = self._next(self._exact, exact)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry
+            entry = self._next(self._loose, loose)
+            if entry is not None:
+                self.stats["loose_hits"] += 1
+                return entry
+            self.stats["misses"] += 1
+            return None
+
+
+class _RecordingTransport:
+    """Pasa los requests al transport real y graba cada intercambio"""
+    
+    _httpx = httpx
+    
+    def __init__(self, cassette: Cassette, transport=None, async_transport=None):
+        self.cassette = cassette
+        self.transport = transport
+        self.async_transport = async_transport
+    
+    def handle_request(self, request):
+        if self.transport is None:
+            self.transport = self._httpx.HTTPTransport()
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        content = response.read()  # ya decodificado (gzip/br)
+        elapsed = time.perf_counter() - started
+        self.cassette.append(request, response, content, elapsed)
+        return response
+    
+    async def handle_async_request(self, request):
+        if self.async_transport is None:
+            self.async_transport = self._httpx.AsyncHTTPTransport()
+        started = time.perf_counter()
+        response = await self.async_transport.handle_async_request(request)
+        content = await response.aread()  # ya decodificado (gzip/br)
+        elapsed = time.perf_counter() - started
+        self.cassette.append(request, response, content, elapsed)
+        return response
+    
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+    
+    async def aclose(self):
+        if self.async_transport is not None:
+            await self.async_transport.aclose()
+
+
+class _ReplayTransport:
+    """
+    Sirve respuestas del cassette sin red. latency_scale > 0 espera
+    elapsed x latency_scale antes de responder. Un request que no esta
+    grabado recibe un 501 (no se reintenta).
+    """
+    
+    _httpx = httpx
+    
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+    
+    def _build(self, request) -> Tuple[object, float]:
+        entry = self.cassette.lookup(request)
+        if entry is None:
+            print(f"Warning: request no grabado en el cassette: {request.method} {_redact_url(request.url)}")
+            body = json.dumps({"error": "not_in_cassette"}).encode("utf-8")
+            # x-should-retry: que el SDK de Anthropic no reintente el 501
+            headers = {"content-type": "application/json", "x-should-retry": "false"}
+            return self._httpx.Response(501, headers=headers, content=body, request=request), 0.0
+        response = self._httpx.Response(
+            entry["status"],
+            headers=entry["headers"],
+            content=_decode_body(entry),
+            request=request
+        )
+        return response, entry.get("elapsed", 0.0) * self.latency_scale
+    
+    def handle_request(self, request):
+        request.read()
+        response, delay = self._build(request)
+        if delay > 0:
+            time.sleep(delay)
+        return response
+    
+    async def handle_async_request(self, request):
+        await request.aread()
+        response, delay = self._build(request)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return response
+
+
+_transport_classes: Dict[str, Tuple[type, type]] = {}
+
+
+def transport_classes(module=httpx) -> Tuple[type, type]:
+    """
+    (RecordingTransport, ReplayTransport) sobre las clases base del modulo
+    httpx dado. El SDK de Anthropic puede venir con su propio fork de httpx
+    (httpx2) y rechaza transports del paquete httpx.
+    """
+    name = module.__name__
+    if name not in _transport_classes:
+        bases = (module.BaseTransport, module.AsyncBaseTransport)
+        _transport_classes[name] = (
+            type("RecordingTransport", (_RecordingTransport,) + bases, {"_httpx": module}),
+            type("ReplayTransport", (_ReplayTransport,) + bases, {"_httpx": module}),
+        )
+    return _transport_classes[name]
+
+
+RecordingTransport, ReplayTransport = transport_classes(httpx)
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def _shared_cassette(path: str, mode: str) -> Cassette:
+    """Un cassette por archivo, compartido por el pool HTTP y el SDK de Anthropic"""
+    with _cassettes_lock:
+        if path not in _cassettes:
+            cassette = Cassette(path)
+            if mode == "replay":
+                cassette.load()
+            _cassettes[path] = cassette
+        return _cassettes[path]
+
+
+def cassette_transport(
+    transport=None,
+    async_transport=None,
+    config: Dict = HTTP_CASSETTE_CONFIG,
+    module=httpx
+):
+    """
+    Transport segun HTTP_CASSETTE_CONFIG, o None si no hay grabacion ni
+    replay activos. transport/async_transport son los reales a envolver
+    al grabar (si faltan se crean con module). module es el paquete httpx
+    del cliente que va a usar el transport.
+    """
+    mode = (config.get("mode") or "").lower()
+    if not mode:
+        return None
+    if mode not in ("record", "replay"):
+        raise ValueError(f"HTTP_CASSETTE invalido: {mode} (usa record o replay)")
+
+    cassette = _shared_cassette(config["path"], mode)
+    recording, replay = transport_classes(module)
+    if mode == "record":
+        return recording(cassette, transport, async_transport)
+    return replay(cassette, latency_scale=config["replay_latency"])
+
+
+def cassette_stats() -> Dict[str, Dict]:
+    with _cassettes_lock:
+        return {path: dict(cassette.stats) for path, cassette in _cassettes.items()}
@@ -0,0 +1,140 @@
+"""
+Motor de margenes vectorizado (NumPy)
+
+Misma formula que MarginCalculator.calculate pero sobre arrays: calcula
+margen neto, ROI y breakeven de todo el catalogo en una llamada, con los
+costos por pais de config.COUNTRIES y las tasas de ANALYSIS_CONFIG. Ademas
+busca, sobre una grilla de precios candidatos, el precio que maximiza el
+margen esperado (margen neto x demanda relativa).
+"""
+from dataclasses import dataclass
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from config import COUNTRIES, ANALYSIS_CONFIG, PRICING_CONFIG
+
+
+@dataclass
+class MarginBatch:
+    """Resultado por producto (arrays alineados con cost_price)"""
+    cost_price: np.ndarray
+    sale_price: np.ndarray
+    total_cost: np.ndarray
+    effective_rate: np.ndarray
+    net_margin: np.ndarray
+    roi: np.ndarray
+    breakeven_price: np.ndarray
+    is_profitable: np.ndarray
+    optimal_price: np.ndarray
+    optimal_net_margin: np.ndarray
+    optimal_roi: np.ndarray
+    expected_margin: np.ndarray  # margen esperado relativo en optimal_price
+
+    def __len__(self) -> int:
+        return len(self.cost_price)
+
+
+def _country_params(country_code: Union[str, Sequence[str]], n: int):
+    """Arrays de envio y CPA por producto segun su pais"""
+    if isinstance(country_code, str):
+        country = COUNTRIES.get(country_code, COUNTRIES["CO"])
+        return np.full(n, float(country["shipping_cost"])), np.full(n, float(country["avg_cpa"]))
+
+    codes = np.asarray(country_code)
+    shipping = np.empty(n)
+    cpa = np.empty(n)
+    for code in np.unique(codes):
+        country = COUNTRIES.get(str(code), COUNTRIES["CO"])
+        mask = codes == code
+        shipping[mask] = country["shipping_cost"]
+        cpa[mask] = country["avg_cpa"]
+    return shipping, cpa
+
+
+def calculate_margins(
+    cost_price: Sequence[float],
+    sale_price: Optional[Sequence[float]] = None,
+    country_code: Union[str, Sequence[str]] = "CO",
+    price_multipliers: Optional[Sequence[float]] = None,
+    elasticity: float = PRICING_CONFIG["price_elasticity"],
+    chunk_size: int = PRICING_CONFIG["chunk_size"]
+) -> MarginBatch:
+    """
+    Calcula margenes de muchos productos a la vez.
+
+    cost_price: precio proveedor por producto.
+    sale_price: precio de venta actual; si no se da, se usa breakeven x 1.3
+        (la misma regla que MarginCalculator).
+    country_code: un pais para todos o uno por producto.
+    price_multipliers: grilla de precios candidatos como multiplos del
+        breakeven (por defecto PRICING_CONFIG).
+    elasticity: elasticidad precio de la demanda. La demanda relativa a
+        sale_price es (p / sale_price) ** -elasticity.
+    """
+    cost = np.asarray(cost_price, dtype=np.float64)
+    n = len(cost)
+    shipping, cpa = _country_params(country_code, n)
+
+    return_rate = ANALYSIS_CONFIG["return_rate"]
+    cancel_rate = ANALYSIS_CONFIG["cancel_rate"]
+    effective_rate = 1 - return_rate - cancel_rate
+
+    total_cost = cost + shipping + cpa + shipping * return_rate * 0.5
+    breakeven = np.floor(total_cost / effective_rate) if effective_rate > 0 else np.zeros(n)
+
+    if sale_price is None:
+        price = np.floor(breakeven * 1.3)
+    else:
+        price = np.asarray(sale_price, dtype=np.float64)
+
+    net_margin = price * effective_rate - total_cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi = np.where(total_cost > 0, net_margin / total_cost * 100, 0.0)
+
+    # ---------- busqueda del precio optimo en la grilla ----------
+    if price_multipliers is None:
+        grid_start, grid_stop, grid_points = PRICING_CONFIG["price_grid"]
+        price_multipliers = np.linspace(grid_start, grid_stop, grid_points)
+    multipliers = np.asarray(price_multipliers, dtype=np.float64)
+
+    optimal_price = np.empty(n)
+    expected_margin = np.empty(n)
+    reference = np.where(price > 0, price, breakeven)
+
+    # Por chunks para acotar memoria (productos x precios)
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        candidates = breakeven[start:end, None] * multipliers[None, :]
+        margins = candidates * effective_rate - total_cost[start:end, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            demand = np.where(
+                reference[start:end, None] > 0,
+                (candidates / reference[start:end, None]) ** -elasticity,
+                0.0
+            )
+        expected = margins * demand
+        best = expected.argmax(axis=1)
+        rows = np.arange(end - start)
+        optimal_price[start:end] = candidates[rows, best]
+        expected_margin[start:end] = expected[rows, best]
+
+    optimal_price = np.floor(optimal_price)
+    optimal_net = optimal_price * effective_rate - total_cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        optimal_roi = np.where(total_cost > 0, optimal_net / total_cost * 100, 0.0)
+
+    return MarginBatch(
+        cost_price=cost,
+        sale_price=price,
+        total_cost=total_cost,
+        effective_rate=np.full(n, effective_rate),
+        net_margin=net_margin,
+        roi=roi,
+        breakeven_price=breakeven,
+        is_profitable=net_margin > ANALYSIS_CONFIG["min_viable_margin"],
+        optimal_price=optimal_price,
+        optimal_net_margin=optimal_net,
+        optimal_roi=optimal_roi,
+        expected_margin=expected_margin
+    )
@@ -0,0 +1,199 @@
+"""
+Metricas por etapa de una corrida del pipeline
+
+Cada etapa (fetch de productos, busqueda de competencia, scoring, analisis
+IA, escritura en DB) registra latencias, requests, bytes y tokens de Claude.
+La etapa activa viaja en un ContextVar: el cliente HTTP y el analizador
+reportan sus requests con record_request/record_tokens sin conocer al
+pipeline, y asyncio copia el contexto al loop del cliente HTTP, asi que
+los requests quedan en la etapa que los origino.
+
+errors cuenta las muestras de la etapa que fallaron: las que terminaron
+con excepcion y las que reportaron record_error (errores que el codigo
+de abajo atrapa y convierte en un valor por defecto).
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+
+class _ActiveStage:
+    """Bloque stage() en curso; failed lo marca record_error"""
+
+    __slots__ = ("metrics", "name", "failed")
+
+    def __init__(self, metrics: "RunMetrics", name: str):
+        self.metrics = metrics
+        self.name = name
+        self.failed = False
+
+
+_current_stage: ContextVar[Optional[_ActiveStage]] = ContextVar("pipeline_stage", default=None)
+
+
+def _quantile(values: List[float], q: float) -> float:
+    """Percentil por rango mas cercano (valores ya ordenados)"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(q * len(values)) - 1))
+    return values[index]
+
+
+class StageMetrics:
+    """Acumulados de una etapa"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.tokens = {"input": 0, "output": 0, "cache_read": 0, "cache_write": 0}
+
+    def summary(self) -> Dict:
+        values = sorted(self.latencies)
+        return {
+            "count": len(values),
+            "errors": self.errors,
+            "total_seconds": round(sum(values), 4),
+            **{f"p{int(q * 100)}": round(_quantile(values, q), 4) for q in QUANTILES},
+            "max": round(values[-1], 4) if values else 0.0,
+            "requests": self.requests,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "tokens": dict(self.tokens),
+        }
+
+
+class RunMetrics:
+    """Metricas de todas las etapas de una corrida (thread-safe)"""
+
+    def __init__(self):
+        self.stages: Dict[str, StageMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name: str) -> StageMetrics:
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages.setdefault(name, StageMetrics())
+        return stage
+
+    @contextmanager
+    def stage(self, name: str):
+        """Mide la duracion del bloque y le asigna los requests que haga"""
+        active = _ActiveStage(self, name)
+        token = _current_stage.set(active)
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current_stage.reset(token)
+            self.observe(name, time.perf_counter() - started, failed or active.failed)
+
+    def observe(self, name: str, seconds: float, failed: bool = False):
+        """Agrega una muestra de latencia medida por fuera"""
+        with self._lock:
+            stage = self._stage(name)
+            stage.latencies.append(seconds)
+            if failed:
+                stage.errors += 1
+
+    def timed(self, name: str, fn: Callable[..., T]) -> Callable[..., T]:
+        """Envuelve fn para que cada llamada cuente como una muestra de la etapa"""
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def add(self, name: str, requests: int = 0, bytes_sent: int = 0, bytes_received: int = 0,
+            tokens: Optional[Dict[str, int]] = None):
+        with self._lock:
+            stage = self._stage(name)
+            stage.requests += requests
+            stage.bytes_sent += bytes_sent
+            stage.bytes_received += bytes_received
+            for kind, value in (tokens or {}).items():
+                stage.tokens[kind] = stage.tokens.get(kind, 0) + value
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: stage.summary() for name, stage in self.stages.items()}
+
+    # ---------- exportacion ----------
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# TYPE pipeline_stage_duration_seconds summary",
+        ]
+        summary = self.summary()
+        for name, s in summary.items():
+            for q in QUANTILES:
+                lines.append(f'pipeline_stage_duration_seconds{{stage="{name}",quantile="{q}"}} {s[f"p{int(q * 100)}"]}')
+            lines.append(f'pipeline_stage_duration_seconds_sum{{stage="{name}"}} {s["total_seconds"]}')
+            lines.append(f'pipeline_stage_duration_seconds_count{{stage="{name}"}} {s["count"]}')
+        lines.append("# TYPE pipeline_stage_errors_total counter")
+        for name, s in summary.items():
+            lines.append(f'pipeline_stage_errors_total{{stage="{name}"}} {s["errors"]}')
+        lines.append("# TYPE pipeline_stage_requests_total counter")
+        for name, s in summary.items():
+            lines.append(f'pipeline_stage_requests_total{{stage="{name}"}} {s["requests"]}')
+        lines.append("# TYPE pipeline_stage_bytes_total counter")
+        for name, s in summary.items():
+            lines.append(f'pipeline_stage_bytes_total{{stage="{name}",direction="sent"}} {s["bytes_sent"]}')
+            lines.append(f'pipeline_stage_bytes_total{{stage="{name}",direction="received"}} {s["bytes_received"]}')
+        lines.append("# TYPE pipeline_stage_tokens_total counter")
+        for name, s in summary.items():
+            for kind, value in s["tokens"].items():
+                lines.append(f'pipeline_stage_tokens_total{{stage="{name}",type="{kind}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Escribe las metricas en JSON o, si el archivo termina en .prom, en formato Prometheus"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.summary(), f, indent=2)
+
+
+# ---------- reporte desde cliente HTTP / analizador ----------
+
+def record_request(bytes_sent: int = 0, bytes_received: int = 0):
+    """Cuenta un request en la etapa activa (no hace nada fuera de una etapa)"""
+    current = _current_stage.get()
+    if current is not None:
+        current.metrics.add(current.name, requests=1, bytes_sent=bytes_sent, bytes_received=bytes_received)
+
+
+def record_tokens(**tokens: int):
+    """Suma tokens de Claude (input, output, cache_read, cache_write) a la etapa activa"""
+    current = _current_stage.get()
+    if current is not None:
+        current.metrics.add(current.name, tokens={kind: value for kind, value in tokens.items() if value})
+
+
+def record_error():
+    """
+    Marca como fallida la muestra activa de la etapa. Cada bloque stage()
+    cuenta a lo sumo un error, aunque varias capas reporten el mismo fallo.
+    """
+    current = _current_stage.get()
+    if current is not None:
+        current.failed = True
@@ -15,18 +15,26 @@ O con variables de entorno:
 import os
 import sys
 import json
+import time
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List, Dict
-
-from supabase import create_client, Client
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 
 from config import (
-    SUPABASE_URL, SUPABASE_KEY, ANTHROPIC_API_KEY,
-    COUNTRIES, DEFAULT_FILTERS, ANALYSIS_CONFIG
+    SUPABASE_URL, SUPABASE_KEY, ANTHROPIC_API_KEY, ANTHROPIC_BASE_URL,
+    COUNTRIES, DEFAULT_FILTERS, ANALYSIS_CONFIG, DB_CONFIG, STORAGE_CONFIG, METRICS_CONFIG,
+    MULTI_PRODUCT_CONFIG
 )
+from bulk_writer import BulkUpserter
+from storage import Storage, SupabaseStorage, create_storage
+from http_recorder import cassette_stats
+from metrics import RunMetrics
+from analysis_cache import AnalysisCache
+from fingerprint_store import FingerprintStore, product_fingerprint
 from scraper import (
-    DropKillerScraper, AdskillerScraper,
+    DropKillerScraper, AdskillerScraper, ProductPageError,
     extract_competitor_data, extract_used_angles
 )
 from analyzer import (
@@ -43,30 +51,83 @@ class Pipeline:
         jwt: str,
         anthropic_key: str,
         supabase_url: str,
-        supabase_key: str
+        supabase_key: str,
+        use_cache: bool = True,
+        incremental: bool = True,
+        storage: Optional[Storage] = None,
+        metrics_path: Optional[str] = METRICS_CONFIG["path"],
+        anthropic_base_url: Optional[str] = ANTHROPIC_BASE_URL
     ):
         self.jwt = jwt
         self.dropkiller = DropKillerScraper(jwt)
         self.adskiller = AdskillerScraper(jwt)
-        self.analyzer = ProductAnalyzer(anthropic_key)
-        self.supabase: Client = create_client(supabase_url, supabase_key)
+        self.cache = AnalysisCache() if use_cache else None
+        self.analyzer = ProductAnalyzer(anthropic_key, cache=self.cache, base_url=anthropic_base_url)
+        self.fingerprints = FingerprintStore() if incremental else None
+        self._pending_fingerprints: Dict[str, Tuple[str, str]] = {}
+        self.storage = storage or SupabaseStorage(supabase_url, supabase_key)
+        self.metrics = RunMetrics()
+        self.metrics_path = metrics_path
+        self.writer = BulkUpserter(
+            self.metrics.timed("db_write", self.storage.upsert_products),
+            chunk_size=DB_CONFIG["upsert_chunk_size"]
+        )
         
         self.stats = {
             "started_at": datetime.now().isoformat(),
             "products_scanned": 0,
+            "product_pages_failed": 0,
             "products_analyzed": 0,
+            "products_unchanged": 0,
             "products_recommended": 0,
+            "ai_cache_hits": 0,
+            "ai_cache_misses": 0,
+            "ai_batch_requests": 0,
+            "ai_grouped_requests": 0,
+            "ai_group_fallbacks": 0,
+            "ai_input_tokens": 0,
+            "ai_output_tokens": 0,
+            "ai_cache_read_tokens": 0,
+            "ai_cache_write_tokens": 0,
+            "competitor_cache_hits": 0,
+            "competitor_cache_misses": 0,
+            "competitor_cache_coalesced": 0,
+            "rate_limit_wait_seconds": 0.0,
+            "http_retries": 0,
+            "ai_retries": 0,
             "errors": []
         }
+        self._stats_lock = threading.Lock()
+        self._print_lock = threading.Lock()
+    
+    def _incr_stat(self, key: str, amount: int = 1):
+        """Incrementa un contador de stats de forma segura entre hilos"""
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    def _add_error(self, message: str):
+        with self._stats_lock:
+            self.stats["errors"].append(message)
     
     def run(
         self,
         country_code: str = "CO",
         max_products: int = 50,
-        min_sales_7d: int = 50
+        min_sales_7d: int = 50,
+        workers: int = 1,
+        batch: bool = False,
+        batch_poll_interval: float = 30.0,
+        products_per_request: int = MULTI_PRODUCT_CONFIG["products_per_request"]
     ):
         """
         Ejecuta el pipeline completo
+        
+        Con workers > 1 los productos se analizan en paralelo con un pool
+        acotado de hilos (casi todo el tiempo es espera de red).
+        Con batch=True los analisis de Claude se envian todos juntos como
+        un message batch y se espera a que termine (corridas nocturnas).
+        Con products_per_request > 1 cada prompt a Claude lleva varios
+        productos (ver ProductAnalyzer.analyze_products).
         """
         print("=" * 60)
         print("ESTRATEGAS IA - Pipeline de Analisis")
@@ -74,38 +135,73 @@ class Pipeline:
         print(f"Pais: {country_code}")
         print(f"Maximo productos: {max_products}")
         print(f"Ventas minimas 7d: {min_sales_7d}")
+        print(f"Workers: {workers}")
+        print(f"Modo IA: {'batch' if batch else 'tiempo real'}")
         print("=" * 60)
         
+        started = time.perf_counter()
         country = COUNTRIES.get(country_code, COUNTRIES["CO"])
         
-        # Paso 1: Obtener productos de DropKiller
+        # Pasos 1 y 2: las paginas de DropKiller llegan en streaming y cada
+        # producto se analiza apenas llega su pagina
         print("\n[1] Obteniendo productos de DropKiller...")
-        products = self.dropkiller.get_products(
+        pages = self.dropkiller.iter_products(
             country_code=country_code,
             min_sales_7d=min_sales_7d,
             min_stock=DEFAULT_FILTERS["min_stock"],
             min_price=DEFAULT_FILTERS["min_price"],
             max_price=DEFAULT_FILTERS["max_price"],
-            limit=max_products
+            max_products=max_products
         )
+        products = self._stream_products(pages, country_code)
         
-        if not products:
+        print("\n[2] Analizando productos...")
+        
+        if batch:
+            prepared = self._map_products(self._prepare_product, products, country, workers, max_products)
+            self._analyze_in_batch([ctx for ctx in prepared if ctx], batch_poll_interval)
+        elif products_per_request > 1:
+            prepared = self._map_products(self._prepare_product, products, country, workers, max_products)
+            self._analyze_grouped([ctx for ctx in prepared if ctx], products_per_request, workers)
+        else:
+            self._map_products(self._analyze_product, products, country, workers, max_products)
+        
+        if self.stats["product_pages_failed"]:
+            # Una caida del listado no es un JWT invalido: se guarda la corrida igual
+            print(f"ERROR: {self.stats['product_pages_failed']} pagina(s) del listado fallaron, resultados incompletos")
+        elif not self.stats["products_scanned"]:
             print("ERROR: No se encontraron productos. Verifica el JWT.")
             return self.stats
         
-        print(f"OK: {len(products)} productos encontrados")
-        self.stats["products_scanned"] = len(products)
-        
-        # Paso 2: Analizar cada producto
-        print("\n[2] Analizando productos...")
+        print(f"OK: {self.stats['products_scanned']} productos encontrados")
+        if self.fingerprints:
+            print(f"OK: {self.stats['products_unchanged']} sin cambios (solo se actualiza analyzed_at)")
+        
+        print(f"\n[3] Guardando en {self.storage.name}...")
+        self.writer.flush()
+        for failure in self.writer.failures:
+            self._add_error(f"DB error [{failure.key}]: {failure.error}")
+        print(f"OK: {self.writer.rows_written} filas en {self.writer.requests_sent} requests")
+        
+        if self.cache:
+            self.stats["ai_cache_hits"] = self.cache.stats["hits"]
+            self.stats["ai_cache_misses"] = self.cache.stats["misses"]
+        search_stats = self.adskiller.cache.stats
+        self.stats["competitor_cache_hits"] = search_stats["hits"]
+        self.stats["competitor_cache_misses"] = search_stats["misses"]
+        self.stats["competitor_cache_coalesced"] = search_stats["coalesced"]
+        limiter_stats = self.dropkiller.http.rate_limiter.stats
+        self.stats["rate_limit_wait_seconds"] = round(
+            sum(host["wait_seconds"] for host in limiter_stats.values()), 2
+        )
+        self.stats["http_retries"] = self.dropkiller.http.stats["retries"]
+        self.stats["ai_retries"] = self.analyzer.retry_stats["retries"]
+        for kind, value in self.analyzer.token_stats.items():
+            self.stats[f"ai_{kind}_tokens"] = value
         
-        for i, product in enumerate(products, 1):
-            try:
-                self._analyze_product(product, country, i, len(products))
-            except Exception as e:
-                error_msg = f"Error en producto {product.get('id', 'unknown')}: {str(e)}"
-                print(f"  ERROR: {error_msg}")
-                self.stats["errors"].append(error_msg)
+        elapsed = time.perf_counter() - started
+        self.stats["elapsed_seconds"] = round(elapsed, 2)
+        self.stats["products_per_second"] = round(self.stats["products_scanned"] / elapsed, 3) if elapsed > 0 else 0.0
         
         # Resumen final
         print("\n" + "=" * 60)
@@ -113,21 +209,158 @@ class Pipeline:
         print("=" * 60)
         print(f"Productos escaneados: {self.stats['products_scanned']}")
         print(f"Productos analizados: {self.stats['products_analyzed']}")
+        print(f"Productos sin cambios: {self.stats['products_unchanged']}")
         print(f"Productos recomendados: {self.stats['products_recommended']}")
+        print(f"Cache IA: {self.stats['ai_cache_hits']} hits / {self.stats['ai_cache_misses']} misses")
+        print(
+            f"Cache Adskiller: {self.stats['competitor_cache_hits']} hits / "
+            f"{self.stats['competitor_cache_coalesced']} agrupadas / "
+            f"{self.stats['competitor_cache_misses']} misses "
+            f"({self.adskiller.cache.hit_rate:.0%} ahorradas)"
+        )
+        print(f"Reintentos: {self.stats['http_retries']} HTTP / {self.stats['ai_retries']} Claude")
+        print(
+            f"Tokens Claude: {self.stats['ai_input_tokens']} input / "
+            f"{self.stats['ai_cache_read_tokens']} leidos de cache / "
+            f"{self.stats['ai_cache_write_tokens']} escritos en cache / "
+            f"{self.stats['ai_output_tokens']} output"
+        )
+        print(f"Espera acumulada por rate limit: {self.stats['rate_limit_wait_seconds']}s")
+        if batch:
+            print(f"Requests IA en batch: {self.stats['ai_batch_requests']}")
+        if products_per_request > 1:
+            print(
+                f"Requests IA agrupados: {self.stats['ai_grouped_requests']} "
+                f"({products_per_request} productos c/u, {self.stats['ai_group_fallbacks']} reintentados solos)"
+            )
+        for path, cassette in cassette_stats().items():
+            print(
+                f"Cassette {path}: {cassette['recorded']} grabados / "
+                f"{cassette['hits'] + cassette['loose_hits']} servidos / {cassette['misses']} sin grabar"
+            )
+        if self.stats["product_pages_failed"]:
+            print(f"Paginas del listado con error: {self.stats['product_pages_failed']} (listado incompleto)")
         print(f"Errores: {len(self.stats['errors'])}")
+        print(f"Tiempo total: {self.stats['elapsed_seconds']}s ({workers} workers)")
+        print(f"Throughput: {self.stats['products_per_second']} productos/s")
+        self._print_metrics()
         
         self._save_run_log()
         
         return self.stats
     
-    def _analyze_product(self, product: Dict, country: Dict, index: int, total: int):
+    def _stream_products(self, pages: Iterator[List[Dict]], country_code: str) -> Iterator[Dict]:
+        """
+        Aplana las paginas de iter_products en productos a analizar. La
+        espera por cada pagina cuenta en la etapa fetch_products. Si una
+        pagina falla se analiza lo ya recibido y el error queda en stats.
+        """
+        while True:
+            try:
+                with self.metrics.stage("fetch_products"):
+                    page = next(pages, None)
+            except ProductPageError as e:
+                self._incr_stat("product_pages_failed")
+                self._add_error(f"Listado incompleto, {e}")
+                print(f"  ERROR: Listado incompleto, {e}")
+                return
+            if page is None:
+                return
+            self._incr_stat("products_scanned", len(page))
+            if self.fingerprints:
+                page = self._skip_unchanged(page, country_code)
+            yield from page
+    
+    def _skip_unchanged(self, products: List[Dict], country_code: str) -> List[Dict]:
+        """
+        Separa los productos cuya huella no cambio desde el ultimo analisis:
+        su ultima fila se vuelve a encolar con analyzed_at nuevo. Devuelve
+        los que hay que analizar.
+        """
+        pending = []
+        now = datetime.now().isoformat()
+        
+        for product in products:
+            product_id = str(product.get("id", product.get("externalId", "")))
+            key = FingerprintStore.make_key(product_id, "dropi", country_code)
+            fingerprint = product_fingerprint(product, country_code)
+            
+            row = self.fingerprints.get_unchanged(key, fingerprint)
+            if row is None:
+                self._pending_fingerprints[product_id] = (key, fingerprint)
+                pending.append(product)
+                continue
+            
+            row["analyzed_at"] = now
+            self.writer.add(row)
+            self._incr_stat("products_unchanged")
+            if row.get("is_recommended"):
+                self._incr_stat("products_recommended")
+        
+        return pending
+    
+    def _map_products(self, step, products: Iterable[Dict], country: Dict, workers: int, total: int) -> List:
+        """
+        Aplica step a cada producto (serial o con el pool de hilos) a medida
+        que llegan y devuelve los resultados en el orden original. total es
+        solo para los logs (el stream puede traer menos).
+        """
+        if workers <= 1:
+            return [
+                self._run_step(step, product, country, i, total, print)
+                for i, product in enumerate(products, 1)
+            ]
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._run_step_buffered, step, product, country, i, total)
+                for i, product in enumerate(products, 1)
+            ]
+            for future in as_completed(futures):
+                future.result()
+            return [future.result() for future in futures]
+    
+    def _run_step(self, step, product: Dict, country: Dict, index: int, total: int, log):
+        try:
+            return step(product, country, index, total, log)
+        except Exception as e:
+            error_msg = f"Error en producto {product.get('id', 'unknown')}: {str(e)}"
+            log(f"  ERROR: {error_msg}")
+            self._add_error(error_msg)
+            return None
+    
+    def _run_step_buffered(self, step, product: Dict, country: Dict, index: int, total: int):
+        """
+        Version para el pool de hilos: acumula la salida del producto y la
+        imprime de una vez para que no se mezcle con la de otros workers
+        """
+        lines = []
+        result = self._run_step(step, product, country, index, total, lines.append)
+        with self._print_lock:
+            print("\n".join(lines))
+        return result
+    
+    def _analyze_product(self, product: Dict, country: Dict, index: int, total: int, log=print):
         """
         Analiza un producto individual
         """
+        ctx = self._prepare_product(product, country, index, total, log)
+        if ctx is None:
+            return
+        
+        log(f"    Analizando con IA...")
+        with self.metrics.stage("ai_analysis"):
+            ai_analysis = self.analyzer.analyze_product(**ctx["ai_inputs"])
+        self._finish_product(ctx, ai_analysis, log)
+    
+    def _prepare_product(self, product: Dict, country: Dict, index: int, total: int, log=print) -> Optional[Dict]:
+        """
+        Todo lo previo a Claude: margen, competencia y score.
+        Devuelve None si el producto se descarta.
+        """
         product_name = product.get("name", "Sin nombre")[:50]
-        product_id = str(product.get("id", product.get("externalId", "")))
         
-        print(f"\n  [{index}/{total}] {product_name}...")
+        log(f"\n  [{index}/{total}] {product_name}...")
         
         cost_price = product.get("salePrice", product.get("price", 0))
         sale_price = product.get("suggestedPrice", product.get("suggested_price", cost_price * 2))
@@ -135,6 +368,7 @@ class Pipeline:
         sales_30d = product.get("sales30d", product.get("soldUnits30d", 0))
         stock = product.get("stock", product.get("currentStock", 0))
         
+        scoring_started = time.perf_counter()
         margin = MarginCalculator.calculate(
             cost_price=cost_price,
             sale_price=sale_price,
@@ -143,19 +377,22 @@ class Pipeline:
             return_rate=ANALYSIS_CONFIG["return_rate"],
             cancel_rate=ANALYSIS_CONFIG["cancel_rate"]
         )
+        scoring_seconds = time.perf_counter() - scoring_started
         
-        print(f"    Margen neto: ${margin['net_margin']:,} | ROI: {margin['roi']}%")
+        log(f"    Margen neto: ${margin['net_margin']:,} | ROI: {margin['roi']}%")
         
         if margin["roi"] < -20:
-            print(f"    SKIP - ROI muy bajo ({margin['roi']}%)")
-            return
+            self.metrics.observe("scoring", scoring_seconds)
+            log(f"    SKIP - ROI muy bajo ({margin['roi']}%)")
+            return None
         
-        print(f"    Buscando competencia...")
-        ads = self.adskiller.find_competitors(product_name, country_code="CO")
+        log(f"    Buscando competencia...")
+        with self.metrics.stage("competitor_search"):
+            ads = self.adskiller.find_competitors(product_name, country_code="CO")
         competitors = extract_competitor_data(ads)
         used_angles = extract_used_angles(competitors)
         
-        print(f"    {len(competitors)} competidores encontrados")
+        log(f"    {len(competitors)} competidores encontrados")
         
         sales_history = product.get("history", [])
         
@@ -166,49 +403,121 @@ class Pipeline:
             "stock": stock
         }
         
+        scoring_started = time.perf_counter()
         score, reasons, verdict = ViabilityScorer.calculate(
             product=product_data,
             margin_data=margin,
             competitors=competitors,
             sales_history=sales_history
         )
-        
-        print(f"    Score: {score}/100 - {verdict}")
-        
-        print(f"    Analizando con IA...")
-        ai_analysis = self.analyzer.analyze_product(
-            product=product_data,
-            margin_data=margin,
-            competitors=competitors,
-            used_angles=used_angles
-        )
-        
+        self.metrics.observe("scoring", scoring_seconds + time.perf_counter() - scoring_started)
+        
+        log(f"    Score: {score}/100 - {verdict}")
+        
+        return {
+            "product": product,
+            "margin": margin,
+            "score": score,
+            "reasons": reasons,
+            "verdict": verdict,
+            "competitors": competitors,
+            "used_angles": used_angles,
+            "ai_inputs": {
+                "product": product_data,
+                "margin_data": margin,
+                "competitors": competitors,
+                "used_angles": used_angles
+            }
+        }
+    
+    def _finish_product(self, ctx: Dict, ai_analysis: Dict, log=print):
+        """
+        Con el analisis de Claude listo: decide la recomendacion y encola
+        la fila para la base de datos
+        """
         recommendation = ai_analysis.get("recommendation", "REVISAR")
-        print(f"    IA recomienda: {recommendation}")
+        log(f"    IA recomienda: {recommendation}")
         
-        self.stats["products_analyzed"] += 1
+        self._incr_stat("products_analyzed")
         
-        is_recommended = should_recommend_product(score, margin, ai_analysis)
+        is_recommended = should_recommend_product(ctx["score"], ctx["margin"], ai_analysis)
         
         if is_recommended:
-            self.stats["products_recommended"] += 1
-            print(f"    RECOMENDADO")
+            self._incr_stat("products_recommended")
+            log(f"    RECOMENDADO")
         else:
-            print(f"    No recomendado")
+            log(f"    No recomendado")
         
         self._save_to_database(
-            product=product,
-            margin=margin,
-            score=score,
-            reasons=reasons,
-            verdict=verdict,
-            competitors=competitors,
-            used_angles=used_angles,
+            product=ctx["product"],
+            margin=ctx["margin"],
+            score=ctx["score"],
+            reasons=ctx["reasons"],
+            verdict=ctx["verdict"],
+            competitors=ctx["competitors"],
+            used_angles=ctx["used_angles"],
             ai_analysis=ai_analysis,
             is_recommended=is_recommended,
             country_code="CO"
         )
     
+    def _analyze_in_batch(self, prepared: List[Dict], poll_interval: float):
+        """
+        Envia todos los prompts como un message batch, espera el resultado
+        y completa cada producto
+        """
+        if not prepared:
+            return
+        
+        print(f"\n[2b] Enviando {len(prepared)} analisis IA en batch...")
+        with self.metrics.stage("ai_analysis"):
+            analyses = self.analyzer.analyze_batch(
+                [ctx["ai_inputs"] for ctx in prepared],
+                poll_interval=poll_interval
+            )
+        self.stats["ai_batch_requests"] = self.analyzer.batch_stats["submitted"]
+        
+        for ctx, ai_analysis in zip(prepared, analyses):
+            print(f"\n  {ctx['ai_inputs']['product']['name']}")
+            self._finish_product(ctx, ai_analysis)
+    
+    def _analyze_grouped(self, prepared: List[Dict], products_per_request: int, workers: int):
+        """
+        Analisis IA de varios productos por request. Cada tarea del pool
+        toma products_per_request productos; analyze_products puede
+        partirlos mas si no caben en el presupuesto de tokens.
+        """
+        if not prepared:
+            return
+        
+        print(f"\n[2b] Analizando {len(prepared)} productos con IA ({products_per_request} por request)...")
+        groups = [prepared[i:i + products_per_request] for i in range(0, len(prepared), products_per_request)]
+        
+        def analyze_group(group: List[Dict]):
+            lines = []
+            try:
+                with self.metrics.stage("ai_analysis"):
+                    analyses = self.analyzer.analyze_products(
+                        [ctx["ai_inputs"] for ctx in group],
+                        products_per_request=products_per_request
+                    )
+                for ctx, ai_analysis in zip(group, analyses):
+                    lines.append(f"\n  {ctx['ai_inputs']['product']['name']}")
+                    self._finish_product(ctx, ai_analysis, lines.append)
+            except Exception as e:
+                error_msg = f"Error en grupo IA: {str(e)}"
+                lines.append(f"  ERROR: {error_msg}")
+                self._add_error(error_msg)
+            with self._print_lock:
+                print("\n".join(lines))
+        
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for future in as_completed([executor.submit(analyze_group, group) for group in groups]):
+                future.result()
+        
+        self.stats["ai_grouped_requests"] = self.analyzer.multi_stats["requests"]
+        self.stats["ai_group_fallbacks"] = self.analyzer.multi_stats["fallbacks"]
+    
     def _save_to_database(
         self,
         product: Dict,
@@ -223,7 +532,7 @@ class Pipeline:
         country_code: str
     ):
         """
-        Guarda el producto analizado en Supabase
+        Encola el producto analizado para el upsert en bloque
         """
         product_id = str(product.get("id", product.get("externalId", "")))
         
@@ -280,15 +589,13 @@ class Pipeline:
             "analyzed_at": datetime.now().isoformat()
         }
         
-        try:
-            self.supabase.table("analyzed_products").upsert(
-                data,
-                on_conflict="external_id,platform,country_code"
-            ).execute()
-            
-        except Exception as e:
-            print(f"    DB Error: {e}")
-            self.stats["errors"].append(f"DB error: {str(e)}")
+        self.writer.add(data)
+        
+        # Un analisis por defecto (Claude fallo) no se congela: se reintenta en la proxima corrida
+        fingerprint = self._pending_fingerprints.get(product_id)
+        if fingerprint and ai_analysis.get("recommendation") != "REVISAR_MANUALMENTE":
+            key, value = fingerprint
+            self.fingerprints.set(key, value, data)
     
     def _calculate_trend_direction(self, history: List[Dict]) -> str:
         if not history or len(history) < 2:
@@ -323,17 +630,35 @@ class Pipeline:
     def _save_run_log(self):
         """Guarda log de la ejecucion"""
         try:
-            self.supabase.table("pipeline_runs").insert({
+            self.storage.log_run({
                 "started_at": self.stats["started_at"],
                 "finished_at": datetime.now().isoformat(),
                 "status": "completed" if not self.stats["errors"] else "completed_with_errors",
                 "products_scanned": self.stats["products_scanned"],
                 "products_analyzed": self.stats["products_analyzed"],
                 "products_recommended": self.stats["products_recommended"],
-                "error_message": "\n".join(self.stats["errors"][:5]) if self.stats["errors"] else None
-            }).execute()
+                "error_message": "\n".join(self.stats["errors"][:5]) if self.stats["errors"] else None,
+                "metrics": self.metrics.summary()
+            })
         except Exception as e:
             print(f"Warning: No se pudo guardar log: {e}")
+        
+        if self.metrics_path:
+            try:
+                self.metrics.write(self.metrics_path)
+                print(f"Metricas en {self.metrics_path}")
+            except OSError as e:
+                print(f"Warning: No se pudieron escribir metricas: {e}")
+    
+    def _print_metrics(self):
+        """Tabla de latencias y trafico por etapa"""
+        print(f"\n{'Etapa':<18} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'reqs':>6} {'KB in':>9} {'tokens':>9}")
+        for name, s in self.metrics.summary().items():
+            tokens = s["tokens"]["input"] + s["tokens"]["output"]
+            print(
+                f"{name:<18} {s['count']:>5} {s['p50']:>7.3f}s {s['p95']:>7.3f}s {s['p99']:>7.3f}s "
+                f"{s['requests']:>6} {s['bytes_received'] / 1024:>9.1f} {tokens:>9}"
+            )
 
 
 def main():
@@ -342,6 +667,25 @@ def main():
     parser.add_argument("--country", help="Codigo de pais", default="CO")
     parser.add_argument("--max", type=int, help="Maximo productos", default=30)
     parser.add_argument("--min-sales", type=int, help="Ventas minimas 7d", default=50)
+    parser.add_argument("--workers", type=int, help="Productos analizados en paralelo", default=1)
+    parser.add_argument("--no-cache", action="store_true", help="No usar el cache local de analisis IA")
+    parser.add_argument("--batch", action="store_true", help="Analisis IA offline con message batches")
+    parser.add_argument("--batch-poll", type=float, help="Segundos entre consultas del batch", default=30.0)
+    parser.add_argument(
+        "--anthropic-base-url", default=ANTHROPIC_BASE_URL,
+        help="URL base de la API de Claude (ej: stand-in local de batch_stub.py)"
+    )
+    parser.add_argument(
+        "--group", type=int, default=MULTI_PRODUCT_CONFIG["products_per_request"],
+        help="Productos por request a Claude (1 = un prompt por producto)"
+    )
+    parser.add_argument(
+        "--storage", choices=["supabase", "sqlite"], default=STORAGE_CONFIG["backend"],
+        help="Donde guardar los resultados (sqlite = base local, sin red)"
+    )
+    parser.add_argument("--db-path", help="Archivo SQLite para --storage sqlite", default=STORAGE_CONFIG["sqlite_path"])
+    parser.add_argument("--metrics-file", help="Archivo de metricas (.json o .prom)", default=METRICS_CONFIG["path"])
+    parser.add_argument("--full", action="store_true", help="Reprocesar todos los productos aunque no hayan cambiado")
     
     args = parser.parse_args()
     
@@ -360,21 +704,34 @@ def main():
     supabase_url = os.getenv("SUPABASE_URL", SUPABASE_URL)
     supabase_key = os.getenv("SUPABASE_KEY", SUPABASE_KEY)
     
-    if not supabase_url or not supabase_key:
-        print("ERROR: Se requieren credenciales de Supabase")
-        sys.exit(1)
+    if args.storage == "supabase":
+        if not supabase_url or not supabase_key:
+            print("ERROR: Se requieren credenciales de Supabase (o usa --storage sqlite)")
+            sys.exit(1)
+        storage = create_storage("supabase", url=supabase_url, key=supabase_key)
+    else:
+        storage = create_storage("sqlite", path=args.db_path)
     
     pipeline = Pipeline(
         jwt=jwt,
         anthropic_key=anthropic_key,
         supabase_url=supabase_url,
-        supabase_key=supabase_key
+        supabase_key=supabase_key,
+        use_cache=not args.no_cache,
+        incremental=not args.full,
+        storage=storage,
+        metrics_path=args.metrics_file,
+        anthropic_base_url=args.anthropic_base_url
     )
     
     pipeline.run(
         country_code=args.country,
         max_products=args.max,
-        min_sales_7d=args.min_sales
+        min_sales_7d=args.min_sales,
+        workers=args.workers,
+        batch=args.batch,
+        batch_poll_interval=args.batch_poll,
+        products_per_request=args.group
     )
 
 
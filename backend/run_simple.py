@@ -9,80 +9,50 @@ import os
 import sys
 import json
 import argparse
-import requests
 from datetime import datetime
 from typing import List, Dict
 
+import httpx
 from dotenv import load_dotenv
 
+from config import COUNTRIES, ANALYSIS_CONFIG, STORAGE_CONFIG, DB_CONFIG
+from http_client import get_http_client
+from bulk_writer import BulkUpserter
+from storage import create_storage
+from history_fetcher import HistoryFetcher
+from analysis_cache import AnalysisCache
+from fingerprint_store import FingerprintStore, product_fingerprint
+
 load_dotenv()
 
 # ============== CONFIG ==============
-SUPABASE_URL = os.getenv("SUPABASE_URL", "https://dzfwbwwjeiocvtyjeoqf.supabase.co")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
-
-# ============== SUPABASE CLIENT ==============
-class SupabaseSimple:
-    def __init__(self, url: str, key: str):
-        self.url = url.rstrip('/')
-        self.headers = {
-            "apikey": key,
-            "Authorization": f"Bearer {key}",
-            "Content-Type": "application/json",
-            "Prefer": "return=minimal"
-        }
-    
-    def upsert(self, table: str, data: dict):
-        url = f"{self.url}/rest/v1/{table}"
-        headers = {**self.headers, "Prefer": "resolution=merge-duplicates"}
-        response = requests.post(url, headers=headers, json=data)
-        return response.status_code in [200, 201, 204]
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
 
 # ============== DROPKILLER PUBLIC API ==============
 class DropKillerPublicAPI:
-    BASE_URL = "https://extension-api.dropkiller.com"
-    
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "application/json",
-        })
+        self.fetcher = HistoryFetcher()
+    
+    def iter_history(self, product_ids: List[str], country: str = "CO"):
+        """Entrega productos a medida que llegan sus batches"""
+        return self.fetcher.iter_history(product_ids, country)
     
     def get_history(self, product_ids: List[str], country: str = "CO") -> List[Dict]:
         if not product_ids:
             return []
         
-        all_results = []
-        seen_ids = set()
-        
-        for i in range(0, len(product_ids), 10):
-            batch = product_ids[i:i+10]
-            ids_str = ",".join(str(pid) for pid in batch)
-            url = f"{self.BASE_URL}/api/v3/history?ids={ids_str}&country={country}"
-            
-            try:
-                response = self.session.get(url, timeout=30)
-                if response.status_code == 200:
-                    data = response.json()
-                    if isinstance(data, list):
-                        for item in data:
-                            ext_id = item.get("externalId")
-                            if ext_id and ext_id not in seen_ids:
-                                seen_ids.add(ext_id)
-                                all_results.append(item)
-            except:
-                pass
-        
-        return all_results
+        return list(self.iter_history(product_ids, country))
 
 # ============== MARGIN CALCULATOR ==============
 def calculate_margin(cost_price: int) -> Dict:
-    shipping = 18000
-    cpa = 25000
-    effective_rate = 0.63
-    return_shipping_cost = shipping * 0.22 * 0.5
+    # Precios en COP (redondeo a ...900); costos de config.COUNTRIES["CO"]
+    costs = COUNTRIES["CO"]
+    shipping = costs["shipping_cost"]
+    cpa = costs["avg_cpa"]
+    effective_rate = 1 - ANALYSIS_CONFIG["return_rate"] - ANALYSIS_CONFIG["cancel_rate"]
+    return_shipping_cost = shipping * ANALYSIS_CONFIG["return_rate"] * 0.5
     
     fixed_costs = shipping + cpa + return_shipping_cost
     total_cost = cost_price + fixed_costs
@@ -200,41 +170,77 @@ def calculate_viability(product: Dict, margin: Dict) -> tuple:
     return score, reasons, verdict, total_sales, recent_sales, estimated_stock
 
 # ============== CLAUDE ANALYZER ==============
-def analyze_with_claude(product: Dict, margin: Dict, api_key: str) -> Dict:
+def analyze_with_claude(product: Dict, margin: Dict, api_key: str, cache: AnalysisCache = None) -> Dict:
     if not api_key:
         return {"recommendation": "REVISAR", "unused_angles": ["Envio gratis", "Garantia"], "optimal_price": margin["optimal_price"]}
     
+    inputs = {
+        "name": product.get('name', 'N/A'),
+        "cost_price": margin['cost_price'],
+        "optimal_price": margin['optimal_price'],
+        "multiplier": margin['multiplier'],
+        "net_margin": margin['net_margin'],
+        "roi": margin['roi'],
+        "recent_sales": product.get('recent_sales', 0),
+    }
     prompt = f"""Analiza este producto de dropshipping para Colombia:
 
-Producto: {product.get('name', 'N/A')}
-Costo proveedor: ${margin['cost_price']:,} COP
-Precio óptimo de venta: ${margin['optimal_price']:,} COP (multiplicador {margin['multiplier']}x)
-Margen neto estimado: ${margin['net_margin']:,} COP por venta
-ROI estimado: {margin['roi']}%
-Ventas últimos 7 días: {product.get('recent_sales', 0)} unidades
+Producto: {inputs['name']}
+Costo proveedor: ${inputs['cost_price']:,} COP
+Precio óptimo de venta: ${inputs['optimal_price']:,} COP (multiplicador {inputs['multiplier']}x)
+Margen neto estimado: ${inputs['net_margin']:,} COP por venta
+ROI estimado: {inputs['roi']}%
+Ventas últimos 7 días: {inputs['recent_sales']} unidades
 
 Responde SOLO en JSON válido:
 {{"recommendation": "VENDER" o "NO_VENDER", "confidence": 1-10, "optimal_price": numero, "unused_angles": ["angulo1", "angulo2", "angulo3"], "key_insight": "una oración corta"}}"""
+    
+    # El texto del prompt entra en la llave: editar la plantilla invalida el cache
+    cache_key = None
+    if cache:
+        cache_key = AnalysisCache.make_key(CLAUDE_MODEL, inputs, prompt)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
 
     try:
-        response = requests.post(
+        # Sin efectos del lado del servidor: se reintenta en 429/5xx/529
+        response = get_http_client().request_sync(
+            "POST",
             "https://api.anthropic.com/v1/messages",
             headers={"x-api-key": api_key, "anthropic-version": "2023-06-01", "content-type": "application/json"},
-            json={"model": "claude-sonnet-4-20250514", "max_tokens": 400, "messages": [{"role": "user", "content": prompt}]},
-            timeout=30
+            json={"model": CLAUDE_MODEL, "max_tokens": 400, "messages": [{"role": "user", "content": prompt}]},
+            timeout=30,
+            idempotent=True
         )
-        if response.status_code == 200:
+        if response.status_code != 200:
+            print(f"Error en analisis Claude: HTTP {response.status_code}: {response.text[:200]}")
+        else:
             text = response.json()["content"][0]["text"]
             if "```" in text:
                 text = text.split("```")[1].replace("json", "").strip()
-            return json.loads(text)
-    except:
-        pass
+            analysis = json.loads(text)
+            if cache:
+                cache.set(cache_key, CLAUDE_MODEL, analysis)
+            return analysis
+    except httpx.HTTPError as e:
+        print(f"Error de red con Claude: {type(e).__name__}: {e}")
+    except json.JSONDecodeError as e:
+        print(f"Error parseando respuesta de Claude: {e}")
+    except (KeyError, IndexError, TypeError) as e:
+        print(f"Respuesta de Claude con formato inesperado: {e!r}")
     
     return {"recommendation": "REVISAR", "unused_angles": ["Envio gratis", "Garantia", "Oferta limitada"], "optimal_price": margin["optimal_price"]}
 
 # ============== MAIN PIPELINE ==============
-def run_pipeline(product_ids: List[str], country: str = "CO", use_ai: bool = True):
+def run_pipeline(
+    product_ids: List[str],
+    country: str = "CO",
+    use_ai: bool = True,
+    use_cache: bool = True,
+    incremental: bool = True,
+    storage_backend: str = STORAGE_CONFIG["backend"]
+):
     print("=" * 65)
     print("  ESTRATEGAS IA - Pipeline v7.3")
     print("=" * 65)
@@ -243,10 +249,14 @@ def run_pipeline(product_ids: List[str], country: str = "CO", use_ai: bool = Tru
         print("\nERROR: No hay IDs de productos")
         return
     
-    supabase = SupabaseSimple(SUPABASE_URL, SUPABASE_KEY)
+    storage = create_storage(storage_backend)
+    writer = BulkUpserter(storage.upsert_products, chunk_size=DB_CONFIG["upsert_chunk_size"])
     api = DropKillerPublicAPI()
+    cache = AnalysisCache() if use_ai and use_cache else None
+    fingerprints = FingerprintStore() if incremental else None
+    ai_enabled = use_ai and bool(ANTHROPIC_API_KEY)
     
-    stats = {"scanned": 0, "analyzed": 0, "recommended": 0}
+    stats = {"scanned": 0, "analyzed": 0, "recommended": 0, "ai_cache_hits": 0, "ai_cache_misses": 0, "http_retries": 0, "unchanged": 0}
     
     print(f"\n[1] Consultando {len(product_ids)} productos ({country})...")
     
@@ -271,6 +281,28 @@ def run_pipeline(product_ids: List[str], country: str = "CO", use_ai: bool = Tru
         
         print(f"  [{i}/{len(products_with_data)}] {name}")
         
+        if fingerprints:
+            fingerprint_key = FingerprintStore.make_key(ext_id, "dropi", country)
+            fingerprint = product_fingerprint(product, country, ai_enabled=ai_enabled)
+            stored = fingerprints.get_unchanged(fingerprint_key, fingerprint)
+            if stored is not None:
+                stored["analyzed_at"] = datetime.now().isoformat()
+                writer.add(stored)
+                stats["unchanged"] += 1
+                if stored.get("is_recommended"):
+                    stats["recommended"] += 1
+                    recommended_products.append({
+                        "name": stored["name"],
+                        "id": ext_id,
+                        "sales_7d": stored["sales_7d"],
+                        "price": stored["suggested_price"],
+                        "margin": stored["real_margin"],
+                        "roi": stored["roi"],
+                        "score": stored["viability_score"]
+                    })
+                print(f"      = Sin cambios, solo se actualiza analyzed_at\n")
+                continue
+        
         cost = product.get("salePrice", 35000)
         margin = calculate_margin(cost)
         
@@ -286,9 +318,9 @@ def run_pipeline(product_ids: List[str], country: str = "CO", use_ai: bool = Tru
         
         # IA
         ai_result = {"recommendation": verdict, "unused_angles": [], "optimal_price": margin["optimal_price"]}
-        if use_ai and ANTHROPIC_API_KEY and score >= 30 and recent_sales >= 3:
+        if ai_enabled and score >= 30 and recent_sales >= 3:
             product["recent_sales"] = recent_sales
-            ai_result = analyze_with_claude(product, margin, ANTHROPIC_API_KEY)
+            ai_result = analyze_with_claude(product, margin, ANTHROPIC_API_KEY, cache)
             print(f"      IA: {ai_result.get('recommendation')} (conf: {ai_result.get('confidence', 'N/A')})")
         
         # ¿Recomendar? - CRITERIOS AJUSTADOS
@@ -352,14 +384,28 @@ def run_pipeline(product_ids: List[str], country: str = "CO", use_ai: bool = Tru
             "analyzed_at": datetime.now().isoformat()
         }
         
-        supabase.upsert("analyzed_products", data)
+        writer.add(data)
+        # El fallback de Claude (REVISAR) no se guarda: se reintenta en la proxima corrida
+        if fingerprints and ai_result.get("recommendation") != "REVISAR":
+            fingerprints.set(fingerprint_key, fingerprint, data)
+    
+    writer.flush()
+    
+    if cache:
+        stats["ai_cache_hits"] = cache.stats["hits"]
+        stats["ai_cache_misses"] = cache.stats["misses"]
+    stats["http_retries"] = get_http_client().stats["retries"]
     
     # Resumen
     print("=" * 65)
     print("  RESUMEN")
     print("=" * 65)
     print(f"  Productos analizados: {stats['analyzed']}")
+    print(f"  Productos sin cambios: {stats['unchanged']}")
     print(f"  Productos recomendados: {stats['recommended']}")
+    if cache:
+        print(f"  Cache IA: {stats['ai_cache_hits']} hits / {stats['ai_cache_misses']} misses")
+    print(f"  Reintentos HTTP: {stats['http_retries']}")
     
     if recommended_products:
         print(f"\n  🏆 TOP PRODUCTOS RECOMENDADOS:")
@@ -368,7 +414,11 @@ def run_pipeline(product_ids: List[str], country: str = "CO", use_ai: bool = Tru
             print(f"       Ventas: {p['sales_7d']}/7d | Precio: ${p['price']:,} | Margen: ${p['margin']:,}")
     
     print("=" * 65)
-    print("\n  ✓ Datos guardados en Supabase")
+    print(f"\n  ✓ {writer.rows_written} filas guardadas en {storage.name} ({writer.requests_sent} requests)")
+    if writer.failures:
+        print(f"  ✗ {len(writer.failures)} filas fallaron:")
+        for failure in writer.failures[:10]:
+            print(f"     • {failure.key}: {failure.error[:80]}")
     print("=" * 65)
 
 
@@ -377,14 +427,17 @@ def main():
     parser.add_argument("--ids", required=True, help="IDs separados por coma")
     parser.add_argument("--country", default="CO", help="Pais (CO, MX, EC)")
     parser.add_argument("--no-ai", action="store_true", help="Sin Claude")
+    parser.add_argument("--no-cache", action="store_true", help="No usar el cache local de analisis IA")
+    parser.add_argument("--full", action="store_true", help="Reprocesar productos aunque no hayan cambiado")
+    parser.add_argument("--storage", choices=["supabase", "sqlite"], default=STORAGE_CONFIG["backend"], help="Donde guardar resultados")
     args = parser.parse_args()
     
-    if not SUPABASE_KEY:
-        print("ERROR: Falta SUPABASE_KEY en .env")
+    if args.storage == "supabase" and not SUPABASE_KEY:
+        print("ERROR: Falta SUPABASE_KEY en .env (o usa --storage sqlite)")
         sys.exit(1)
     
     product_ids = [id.strip() for id in args.ids.split(",") if id.strip()]
-    run_pipeline(product_ids, args.country, not args.no_ai)
+    run_pipeline(product_ids, args.country, not args.no_ai, not args.no_cache, not args.full, args.storage)
 
 
 if __name__ == "__main__":
@@ -133,9 +133,15 @@ CREATE TABLE IF NOT EXISTS pipeline_runs (
     filters_used JSONB,
     
     -- Errores
-    error_message TEXT
+    error_message TEXT,
+    
+    -- Latencias p50/p95/p99, requests, bytes y tokens por etapa
+    metrics JSONB
 );
 
+-- Para bases creadas antes de la columna metrics
+ALTER TABLE pipeline_runs ADD COLUMN IF NOT EXISTS metrics JSONB;
+
 -- Vista para productos recomendados (lo que muestra el frontend)
 CREATE OR REPLACE VIEW recommended_products AS
 SELECT 
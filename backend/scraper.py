@@ -1,10 +1,26 @@
 """
 Scraper para DropKiller y Adskiller
+
+Los metodos async (prefijo a*) usan el pool compartido de http_client;
+los metodos sync son wrappers para el pipeline (run.py).
 """
-import requests
-import time
-from typing import List, Dict, Optional
-from config import COUNTRIES
+import asyncio
+from collections import deque
+from typing import List, Dict, Iterator, Optional
+from config import COUNTRIES, PAGINATION_CONFIG
+from http_client import HttpClient, get_http_client, DEFAULT_USER_AGENT
+from metrics import record_error
+from history_fetcher import HistoryFetcher
+from search_cache import SearchCache, get_search_cache, normalize_term
+
+
+class ProductPageError(Exception):
+    """Una pagina del listado de DropKiller no se pudo descargar"""
+    
+    def __init__(self, page: int, message: str):
+        super().__init__(f"pagina {page}: {message}")
+        self.page = page
+
 
 class DropKillerScraper:
     """Scraper para obtener productos de DropKiller"""
@@ -12,18 +28,19 @@ class DropKillerScraper:
     BASE_URL = "https://app.dropkiller.com"
     PUBLIC_API = "https://extension-api.dropkiller.com"
     
-    def __init__(self, jwt: str):
+    def __init__(self, jwt: str, http: Optional[HttpClient] = None):
         self.jwt = jwt
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.http = http or get_http_client()
+        self.history = HistoryFetcher(self.http, url=f"{self.PUBLIC_API}/api/v3/history")
+        self.headers = {
             "Authorization": f"Bearer {jwt}",
             "Cookie": f"__session={jwt}",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "User-Agent": DEFAULT_USER_AGENT,
             "Accept": "application/json",
             "Content-Type": "application/json"
-        })
+        }
     
-    def get_products(
+    async def aget_products(
         self,
         country_code: str = "CO",
         platform: str = "dropi",
@@ -37,6 +54,30 @@ class DropKillerScraper:
         """
         Obtiene productos del dashboard de DropKiller con filtros
         """
+        try:
+            return await self.afetch_products_page(
+                country_code, platform, min_sales_7d, min_stock,
+                min_price, max_price, limit, page
+            )
+        except ProductPageError as e:
+            print(f"Error obteniendo productos: {e}")
+            return []
+    
+    async def afetch_products_page(
+        self,
+        country_code: str = "CO",
+        platform: str = "dropi",
+        min_sales_7d: int = 50,
+        min_stock: int = 30,
+        min_price: int = 20000,
+        max_price: int = 200000,
+        limit: int = 50,
+        page: int = 1
+    ) -> List[Dict]:
+        """
+        Como aget_products, pero lanza ProductPageError si la pagina falla
+        en vez de devolver [] (que se confundiria con el fin del listado)
+        """
         country = COUNTRIES.get(country_code, COUNTRIES["CO"])
         
         params = {
@@ -52,50 +93,120 @@ class DropKillerScraper:
         
         try:
             url = f"{self.BASE_URL}/api/products"
-            response = self.session.get(url, params=params, timeout=30)
+            response = await self.http.get(url, params=params, headers=self.headers)
             
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("products", data.get("data", []))
-            else:
-                print(f"Error {response.status_code}: {response.text[:200]}")
-                return []
-                
+            if response.status_code != 200:
+                raise ProductPageError(page, f"HTTP {response.status_code}: {response.text[:200]}")
+            data = response.json()
+            return data.get("products", data.get("data", []))
+        except ProductPageError:
+            raise
         except Exception as e:
-            print(f"Error obteniendo productos: {e}")
-            return []
+            raise ProductPageError(page, f"{type(e).__name__}: {e}") from e
     
-    def get_product_history(self, product_ids: List[str], country_code: str = "CO") -> Dict:
+    def get_products(
+        self,
+        country_code: str = "CO",
+        platform: str = "dropi",
+        min_sales_7d: int = 50,
+        min_stock: int = 30,
+        min_price: int = 20000,
+        max_price: int = 200000,
+        limit: int = 50,
+        page: int = 1
+    ) -> List[Dict]:
+        return self.http.run(self.aget_products(
+            country_code, platform, min_sales_7d, min_stock,
+            min_price, max_price, limit, page
+        ))
+    
+    def iter_products(
+        self,
+        country_code: str = "CO",
+        platform: str = "dropi",
+        min_sales_7d: int = 50,
+        min_stock: int = 30,
+        min_price: int = 20000,
+        max_price: int = 200000,
+        max_products: Optional[int] = None,
+        max_pages: Optional[int] = PAGINATION_CONFIG["max_pages"],
+        page_size: int = PAGINATION_CONFIG["page_size"],
+        prefetch: int = PAGINATION_CONFIG["prefetch"]
+    ) -> Iterator[List[Dict]]:
         """
-        Obtiene historial de ventas de la API publica (sin auth)
+        Recorre las paginas del dashboard de forma perezosa y entrega cada
+        pagina (sin productos repetidos) apenas llega. Mientras se procesa
+        una pagina, las siguientes `prefetch` ya se estan descargando.
+        Para en max_products, max_pages, una pagina incompleta o una pagina
+        sin productos nuevos. Si una pagina falla (ya reintentada por el
+        cliente HTTP) lanza ProductPageError despues de entregar las
+        anteriores, para no confundir el error con el fin del listado.
         """
-        if not product_ids:
-            return {}
+        seen = set()
+        pending = deque()
+        next_page = 1
+        yielded = 0
         
-        ids_str = ",".join(str(pid) for pid in product_ids)
-        url = f"{self.PUBLIC_API}/api/v3/history?ids={ids_str}&country={country_code}"
+        def schedule():
+            nonlocal next_page
+            while len(pending) < max(prefetch, 1) and (not max_pages or next_page <= max_pages):
+                pending.append(self.http.submit(self.afetch_products_page(
+                    country_code, platform, min_sales_7d, min_stock,
+                    min_price, max_price, page_size, next_page
+                )))
+                next_page += 1
         
         try:
-            response = requests.get(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return {item["externalId"]: item for item in data}
-            else:
-                print(f"Error historial: {response.status_code}")
-                return {}
+            schedule()
+            while pending:
+                products = pending.popleft().result()
                 
-        except Exception as e:
-            print(f"Error obteniendo historial: {e}")
+                fresh = []
+                for product in products:
+                    product_id = str(product.get("id", product.get("externalId", "")))
+                    if product_id not in seen:
+                        seen.add(product_id)
+                        fresh.append(product)
+                if max_products:
+                    fresh = fresh[:max_products - yielded]
+                yielded += len(fresh)
+                
+                done = (
+                    len(products) < page_size
+                    or not fresh
+                    or (max_products and yielded >= max_products)
+                )
+                if not done:
+                    schedule()
+                if fresh:
+                    yield fresh
+                if done:
+                    break
+        finally:
+            # Si el consumidor corta antes, no seguir descargando paginas
+            for future in pending:
+                future.cancel()
+    
+    async def aget_product_history(self, product_ids: List[str], country_code: str = "CO") -> Dict:
+        """
+        Obtiene historial de ventas de la API publica (sin auth)
+        en batches concurrentes (ver history_fetcher)
+        """
+        if not product_ids:
             return {}
+        
+        return await self.history.afetch(product_ids, country_code)
     
-    def get_product_detail(self, product_id: str, platform: str = "dropi") -> Optional[Dict]:
+    def get_product_history(self, product_ids: List[str], country_code: str = "CO") -> Dict:
+        return self.http.run(self.aget_product_history(product_ids, country_code))
+    
+    async def aget_product_detail(self, product_id: str, platform: str = "dropi") -> Optional[Dict]:
         """
         Obtiene detalle completo de un producto
         """
         try:
             url = f"{self.BASE_URL}/api/products/{product_id}?platform={platform}"
-            response = self.session.get(url, timeout=30)
+            response = await self.http.get(url, headers=self.headers)
             
             if response.status_code == 200:
                 return response.json()
@@ -104,6 +215,9 @@ class DropKillerScraper:
         except Exception as e:
             print(f"Error detalle producto: {e}")
             return None
+    
+    def get_product_detail(self, product_id: str, platform: str = "dropi") -> Optional[Dict]:
+        return self.http.run(self.aget_product_detail(product_id, platform))
 
 
 class AdskillerScraper:
@@ -111,18 +225,36 @@ class AdskillerScraper:
     
     BASE_URL = "https://app.dropkiller.com"
     
-    def __init__(self, jwt: str):
+    # (plataforma, limite de anuncios) que consulta find_competitors
+    COMPETITOR_PLATFORMS = (("facebook", 15), ("tiktok", 10))
+    
+    def __init__(self, jwt: str, http: Optional[HttpClient] = None, cache: Optional[SearchCache] = None):
         self.jwt = jwt
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.http = http or get_http_client()
+        self.cache = cache or get_search_cache()
+        self.headers = {
             "Authorization": f"Bearer {jwt}",
             "Cookie": f"__session={jwt}",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "User-Agent": DEFAULT_USER_AGENT,
             "Accept": "application/json",
             "Content-Type": "application/json"
-        })
+        }
     
-    def search_ads(
+    async def _search_ads_request(self, payload: Dict) -> List[Dict]:
+        """Request crudo a Adskiller; lanza excepcion si falla (no se cachea)"""
+        url = f"{self.BASE_URL}/api/adskiller"
+        # Es una busqueda (solo lectura) aunque vaya por POST
+        response = await self.http.post(url, json=payload, headers=self.headers, idempotent=True)
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        
+        data = response.json()
+        if data.get("success"):
+            return data.get("data", {}).get("data", [])
+        return []
+    
+    async def asearch_ads(
         self,
         search_term: str,
         country_code: str = "CO",
@@ -144,28 +276,33 @@ class AdskillerScraper:
             "limit": limit
         }
         
+        key = (normalize_term(search_term), country_code, platform, limit)
+        
         try:
-            url = f"{self.BASE_URL}/api/adskiller"
-            response = self.session.post(url, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("success"):
-                    return data.get("data", {}).get("data", [])
-            
-            return []
+            ads = await self.cache.get_or_fetch(key, lambda: self._search_ads_request(payload))
+            return list(ads)
             
         except Exception as e:
             print(f"Error buscando ads: {e}")
+            record_error()
             return []
     
-    def get_ad_detail(self, ad_id: str) -> Optional[Dict]:
+    def search_ads(
+        self,
+        search_term: str,
+        country_code: str = "CO",
+        platform: str = "facebook",
+        limit: int = 20
+    ) -> List[Dict]:
+        return self.http.run(self.asearch_ads(search_term, country_code, platform, limit))
+    
+    async def aget_ad_detail(self, ad_id: str) -> Optional[Dict]:
         """
         Obtiene detalle completo de un anuncio con analisis IA
         """
         try:
             url = f"{self.BASE_URL}/api/adskiller/{ad_id}"
-            response = self.session.get(url, timeout=30)
+            response = await self.http.get(url, headers=self.headers)
             
             if response.status_code == 200:
                 return response.json()
@@ -175,25 +312,31 @@ class AdskillerScraper:
             print(f"Error detalle ad: {e}")
             return None
     
-    def find_competitors(self, product_name: str, country_code: str = "CO") -> List[Dict]:
+    def get_ad_detail(self, ad_id: str) -> Optional[Dict]:
+        return self.http.run(self.aget_ad_detail(ad_id))
+    
+    async def afind_competitors(self, product_name: str, country_code: str = "CO") -> List[Dict]:
         """
         Encuentra competidores vendiendo un producto similar
-        Busca en Facebook e Instagram
+        Busca en todas las plataformas a la vez; el ritmo lo pone el
+        rate limiter del cliente HTTP
         """
         competitors = []
         
         keywords = product_name.lower().split()[:3]
         search_term = " ".join(keywords)
         
-        fb_ads = self.search_ads(search_term, country_code, "facebook", limit=15)
-        competitors.extend(fb_ads)
-        
-        time.sleep(0.5)
-        
-        tt_ads = self.search_ads(search_term, country_code, "tiktok", limit=10)
-        competitors.extend(tt_ads)
+        results = await asyncio.gather(*(
+            self.asearch_ads(search_term, country_code, platform, limit=limit)
+            for platform, limit in self.COMPETITOR_PLATFORMS
+        ))
+        for ads in results:
+            competitors.extend(ads)
         
         return competitors
+    
+    def find_competitors(self, product_name: str, country_code: str = "CO") -> List[Dict]:
+        return self.http.run(self.afind_competitors(product_name, country_code))
 
 
 def extract_competitor_data(ads: List[Dict]) -> List[Dict]:
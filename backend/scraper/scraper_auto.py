@@ -16,12 +16,16 @@ import json
 import re
 import argparse
 import asyncio
+import time
 import requests
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, field
 from collections import defaultdict
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
 
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -31,6 +35,38 @@ DROPKILLER_EMAIL = os.getenv("DROPKILLER_EMAIL", "")
 DROPKILLER_PASSWORD = os.getenv("DROPKILLER_PASSWORD", "")
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+# Cookies + localStorage de la última sesión válida (se reutilizan entre corridas)
+STATE_FILE = os.getenv("DROPKILLER_STATE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".dropkiller_state.json"))
+
+APP_URL = "https://app.dropkiller.com"
+DASHBOARD_URL = f"{APP_URL}/dashboard"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+# Server action de Next.js que devuelve el historial de un producto
+HISTORY_ACTION_ID = "7ff80d9301fb1d1d96845742009470be0442d3283f"
+# --history http: requests de historial en vuelo y cada cuánto se releen las cookies del navegador
+HISTORY_HTTP_CONCURRENCY = int(os.getenv("DROPKILLER_HISTORY_CONCURRENCY", "32"))
+COOKIE_REFRESH_SECONDS = 30
+# Fallas seguidas de --history http antes de pasar todo el historial al navegador
+HISTORY_HTTP_MAX_FAILURES = int(os.getenv("DROPKILLER_HISTORY_MAX_FAILURES", "5"))
+
+# Captura del listado desde las respuestas de red del dashboard (--capture network)
+LISTING_URL_PATTERNS = [p for p in os.getenv("DROPKILLER_LISTING_PATTERNS", "/api/products,/dashboard/products").split(",") if p]
+LISTING_CAPTURE_TIMEOUT = float(os.getenv("DROPKILLER_LISTING_TIMEOUT", "15"))
+
+# Perfil --lean: tipos de recurso que no se descargan y hosts propios (el resto se bloquea)
+LEAN_BLOCKED_TYPES = {"image", "media", "font", "texttrack", "manifest", "ping"}
+LEAN_ALLOWED_HOSTS = [h for h in os.getenv("DROPKILLER_LEAN_ALLOW", "dropkiller.com,clerk.com,clerk.accounts.dev").split(",") if h]
+
+# Esperas por condición (segundos): formulario de login, primera fila del
+# listado y crecimiento de filas tras cada scroll
+LOGIN_FORM_TIMEOUT = 30
+LISTING_ROWS_TIMEOUT = 20
+LISTING_SCROLL_TIMEOUT = 1.5
+LISTING_MAX_SCROLLS = 3
+
+# Botones de fila del listado (mismo criterio que extract_products_with_uuid)
+_COUNT_ROWS_JS = "() => Array.from(document.querySelectorAll('button')).filter(b => b.innerText && b.innerText.includes('Ver detalle')).length"
 
 DROPKILLER_COUNTRIES = {
     "CO": "65c75a5f-0c4a-45fb-8c90-5b538805a15a",
@@ -93,6 +129,72 @@ class TrendAnalysis:
     historial_solido: bool
 
 
+@dataclass
+class TrendBatch:
+    """
+    Resultado de TrendAnalyzerV2.analyze_batch: una fila por producto.
+    Los valores coinciden con los de TrendAnalyzerV2.analyze.
+    """
+    daily: np.ndarray                   # (productos, días), día 0 = más reciente
+    lengths: np.ndarray                 # días reales de historial por producto
+    empty: np.ndarray                   # sin historial o sin ventas (SIN_DATOS vacío)
+    week_totals: np.ndarray             # (productos, 12)
+    days_with_sales: np.ndarray         # (productos, 12)
+    consistency: np.ndarray             # (productos, 12)
+    week_over_week_growth: np.ndarray   # (productos, 3)
+    total_sold: np.ndarray
+    peak_week: np.ndarray
+    peak_vs_current: np.ndarray         # sin redondear (como lo usa _detect_pattern)
+    semanas_con_50_ventas: np.ndarray
+    historial_solido: np.ndarray
+    pattern: np.ndarray                 # códigos de patrón (str)
+    score: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.pattern)
+    
+    def to_analysis(self, i: int) -> TrendAnalysis:
+        """Materializa el TrendAnalysis completo (con alertas) de un producto"""
+        n = int(self.lengths[i])
+        daily_sales = [int(v) for v in self.daily[i, :n]]
+        if self.empty[i]:
+            reason = "Sin datos históricos" if n == 0 else "Sin ventas registradas"
+            return TrendAnalyzerV2._empty_analysis(reason)
+        
+        weeks = []
+        for week_num in range(12):
+            week_sales = daily_sales[week_num * 7:week_num * 7 + 7]
+            if len(week_sales) >= 5:
+                weeks.append(TrendAnalyzerV2._calculate_week_metrics(week_num, week_sales))
+            else:
+                weeks.append(WeeklyMetrics(
+                    week_number=week_num, total_sales=0, days_with_sales=0,
+                    avg_daily=0, max_daily=0, min_daily=0, consistency=0
+                ))
+        
+        wow_growth = [float(g) for g in self.week_over_week_growth[i]]
+        peak_week = int(self.peak_week[i])
+        semanas = int(self.semanas_con_50_ventas[i])
+        pattern, pattern_reason, alerts, score = TrendAnalyzerV2._detect_pattern(
+            weeks, wow_growth, peak_week, float(self.peak_vs_current[i]), daily_sales, semanas
+        )
+        
+        return TrendAnalysis(
+            weeks=weeks,
+            total_sold=int(self.total_sold[i]),
+            total_days=n,
+            week_over_week_growth=wow_growth,
+            pattern=pattern,
+            pattern_reason=pattern_reason,
+            alerts=alerts,
+            score=score,
+            peak_week=peak_week,
+            peak_vs_current=round(float(self.peak_vs_current[i]), 2),
+            semanas_con_50_ventas=semanas,
+            historial_solido=bool(self.historial_solido[i])
+        )
+
+
 @dataclass
 class FiltroResult:
     """Resultado de aplicar filtros"""
@@ -346,6 +448,132 @@ class TrendAnalyzerV2:
             historial_solido=historial_solido
         )
     
+    @staticmethod
+    def history_matrix(histories: List[List[Dict]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convierte historiales de la API en la matriz productos × días que
+        usa analyze_batch (mismo orden que analyze: fecha descendente).
+        """
+        rows = [
+            [d.get('soldUnits', 0) for d in sorted(history or [], key=lambda x: x.get('date', ''), reverse=True)]
+            for history in histories
+        ]
+        lengths = np.array([len(r) for r in rows], dtype=np.int64)
+        matrix = np.zeros((len(rows), max(int(lengths.max()) if len(rows) else 0, 84)), dtype=np.int64)
+        for i, row in enumerate(rows):
+            matrix[i, :len(row)] = row
+        return matrix, lengths
+    
+    @staticmethod
+    def analyze_batch(sales: np.ndarray, lengths: Optional[np.ndarray] = None) -> TrendBatch:
+        """
+        Versión vectorizada de analyze para muchos productos a la vez.
+        
+        sales: matriz productos × días (día 0 = más reciente), con ceros de
+        relleno a la derecha. lengths: días reales por producto (por defecto
+        todas las columnas).
+        """
+        sales = np.asarray(sales, dtype=np.int64)
+        n_products, n_days = sales.shape
+        if lengths is None:
+            lengths = np.full(n_products, n_days, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        
+        # Relleno a 84 días (12 semanas) y enmascarado de días inexistentes
+        width = max(n_days, 84)
+        daily = np.zeros((n_products, width), dtype=np.int64)
+        daily[:, :n_days] = sales
+        day_idx = np.arange(width)
+        daily = np.where(day_idx[None, :] < lengths[:, None], daily, 0)
+        
+        total_sold = daily.sum(axis=1)
+        empty = (lengths == 0) | (total_sold == 0)
+        
+        # ---------- métricas semanales ----------
+        weeks = daily[:, :84].reshape(n_products, 12, 7)
+        week_len = np.clip(lengths[:, None] - 7 * np.arange(12)[None, :], 0, 7)
+        week_valid = week_len >= 5
+        week_totals = np.where(week_valid, weeks.sum(axis=2), 0)
+        days_with_sales = np.where(week_valid, (weeks > 0).sum(axis=2), 0)
+        consistency = np.where(week_valid, _CONSISTENCY_TABLE[week_len, days_with_sales], 0.0)
+        
+        min_ventas = FILTROS_EXPERTO["min_ventas_por_semana"]
+        semanas_con_50 = (week_totals >= min_ventas).sum(axis=1)
+        historial_solido = semanas_con_50 >= FILTROS_EXPERTO["min_semanas_con_ventas"]
+        
+        # ---------- crecimiento WoW ----------
+        current = week_totals[:, :3]
+        previous = week_totals[:, 1:4]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            raw_growth = (current - previous) / previous * 100
+        raw_growth = np.where(previous > 0, raw_growth, np.where(current > 0, 100.0, 0.0))
+        wow = _py_round(raw_growth, 1)
+        
+        # ---------- pico ----------
+        max_sales = week_totals.max(axis=1)
+        peak_week = np.where(max_sales > 0, week_totals.argmax(axis=1), 0)
+        w0, w1, w2 = week_totals[:, 0], week_totals[:, 1], week_totals[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            peak_vs_current = np.where(w0 > 0, max_sales / w0, np.inf)
+        
+        # ---------- patrón ----------
+        first_14 = daily[:, :14]
+        max_day = first_14.max(axis=1)
+        total_14d = first_14.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            max_day_ratio = np.where(total_14d > 0, (max_day / total_14d) * 100, 0.0)
+        
+        g0, g1 = wow[:, 0], wow[:, 1]
+        c0 = consistency[:, 0]
+        
+        conditions = [
+            empty | (w0 == 0),
+            ((w1 + w2) <= 5) & (w0 > 20),
+            (peak_week > 0) & (peak_vs_current > 2.5),
+            (total_14d > 0) & (max_day_ratio > 50),
+            ((w1 > 10) | (w2 > 10)) & (g0 > 20) & (g1 > 0) & (c0 >= 50),
+            (w1 > 10) & (g0 > 10) & (c0 >= 40),
+            (np.abs(g0) <= 20) & (c0 >= 40),
+            g0 < -20,
+            c0 < 30,
+        ]
+        patterns = [
+            "SIN_DATOS", "APARICION_SUBITA", "VIRAL_MUERTO", "PICO_UNICO", "DESPEGANDO",
+            "CRECIMIENTO_SOSTENIDO", "ESTABLE", "DECAYENDO", "INCONSISTENTE",
+        ]
+        scores = [
+            np.zeros(n_products, dtype=np.int64),
+            np.full(n_products, 45),
+            np.maximum(10, 40 - peak_week * 10),
+            np.full(n_products, 25),
+            np.minimum(95, 70 + np.trunc(g0 / 5).astype(np.int64) + np.trunc(c0 / 10).astype(np.int64)),
+            np.minimum(85, 60 + np.trunc(g0 / 3).astype(np.int64)),
+            55 + np.trunc(c0 / 5).astype(np.int64),
+            np.maximum(20, 50 + np.trunc(g0 / 2).astype(np.int64)),
+            np.full(n_products, 35),
+        ]
+        pattern = np.select(conditions, patterns, default="EVALUAR").astype(object)
+        score = np.select(conditions, scores, default=50 + np.trunc(c0 / 4).astype(np.int64))
+        
+        # Los vacíos no tienen semanas ni crecimiento (igual que _empty_analysis)
+        zero_if_empty = ~empty
+        return TrendBatch(
+            daily=daily,
+            lengths=lengths,
+            empty=empty,
+            week_totals=week_totals,
+            days_with_sales=days_with_sales,
+            consistency=consistency,
+            week_over_week_growth=wow,
+            total_sold=total_sold,
+            peak_week=np.where(zero_if_empty, peak_week, 0),
+            peak_vs_current=np.where(zero_if_empty, peak_vs_current, 0.0),
+            semanas_con_50_ventas=np.where(zero_if_empty, semanas_con_50, 0),
+            historial_solido=historial_solido & zero_if_empty,
+            pattern=pattern,
+            score=np.where(zero_if_empty, score, 0)
+        )
+    
     @staticmethod
     def _calculate_week_metrics(week_num: int, sales: List[int]) -> WeeklyMetrics:
         total = sum(sales)
@@ -488,6 +716,27 @@ class TrendAnalyzerV2:
         )
 
 
+def _py_round(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    np.round con el mismo resultado que round() de Python. Solo difieren
+    en valores que caen casi en .5; esos pocos se recalculan con round().
+    """
+    rounded = np.round(values, ndigits)
+    scaled = np.abs(values) * (10 ** ndigits)
+    with np.errstate(invalid='ignore'):
+        near_tie = np.isfinite(scaled) & (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for idx in zip(*np.nonzero(near_tie)):
+        rounded[idx] = round(float(values[idx]), ndigits)
+    return rounded
+
+
+# consistency de _calculate_week_metrics indexada por [días con datos, días con ventas]
+_CONSISTENCY_TABLE = np.array([
+    [round((active / days) * 100, 1) if days and active <= days else 0.0 for active in range(8)]
+    for days in range(8)
+])
+
+
 # ============== MARKET ANALYZER ==============
 class MarketAnalyzer:
     @staticmethod
@@ -577,19 +826,288 @@ def calculate_margin(cost_price: int) -> Dict:
     }
 
 
+# ============== LISTADO DESDE JSON ==============
+_ID_KEYS = ("uuid", "id", "externalId")
+_PRICE_KEYS = ("providerPrice", "salePrice", "price")
+_LIST_KEYS = ("products", "data", "items", "results")
+
+
+def _first(item: Dict, keys: Tuple[str, ...]):
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def _to_int(value) -> int:
+    if isinstance(value, bool):
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(float(value.replace(",", "")))
+        except ValueError:
+            return 0
+    return 0
+
+
+def _looks_like_product(item) -> bool:
+    return isinstance(item, dict) and _first(item, _ID_KEYS) is not None and _first(item, _PRICE_KEYS) is not None
+
+
+def find_product_list(payload) -> Optional[List[Dict]]:
+    """
+    Busca la lista de productos dentro de una respuesta del dashboard (JSON
+    de la API o payload RSC ya parseado). None si no hay ninguna.
+    """
+    if isinstance(payload, dict):
+        for key in _LIST_KEYS:
+            value = payload.get(key)
+            if isinstance(value, list) and (not value or _looks_like_product(value[0])):
+                return value
+        values = payload.values()
+    elif isinstance(payload, list):
+        if payload and _looks_like_product(payload[0]):
+            return payload
+        values = payload
+    else:
+        return None
+    
+    for value in values:
+        found = find_product_list(value)
+        if found is not None:
+            return found
+    return None
+
+
+def parse_rsc_row(body: str, row: str = "1"):
+    """JSON de la fila `row:` de un stream RSC (respuesta de una server action)"""
+    prefix = f"{row}:"
+    for line in body.splitlines():
+        if line.startswith(prefix):
+            try:
+                return json.loads(line[len(prefix):])
+            except ValueError:
+                return None
+    return None
+
+
+def parse_listing_body(body: str) -> Optional[List[Dict]]:
+    """Lista de productos de una respuesta JSON o text/x-component (líneas `N:{json}`)"""
+    try:
+        return find_product_list(json.loads(body))
+    except ValueError:
+        pass
+    for line in body.splitlines():
+        _, sep, rest = line.partition(':')
+        if not sep or rest[:1] not in ('{', '['):
+            continue
+        try:
+            found = find_product_list(json.loads(rest))
+        except ValueError:
+            continue
+        if found is not None:
+            return found
+    return None
+
+
+def product_from_listing(item: Dict) -> Optional[Dict]:
+    """Mismo registro que extract_products_with_uuid, armado desde el JSON del listado"""
+    uuid = _first(item, _ID_KEYS)
+    name = _first(item, ("name", "title"))
+    provider_price = _to_int(_first(item, _PRICE_KEYS))
+    if not uuid or not name or provider_price == 0:
+        return None
+    
+    suggested = _to_int(_first(item, ("suggestedPrice", "suggested_price")))
+    profit = _to_int(item.get("profit")) or (suggested - provider_price if suggested else 0)
+    
+    return {
+        "uuid": str(uuid),
+        "name": str(name)[:60],
+        "providerPrice": provider_price,
+        "profit": profit,
+        "stock": _to_int(_first(item, ("stock", "currentStock"))),
+        "sales7d": _to_int(_first(item, ("sales7d", "soldUnits7d"))),
+        "sales30d": _to_int(_first(item, ("sales30d", "soldUnits30d"))),
+    }
+
+
+# ============== PAGE POOL ==============
+class PagePool:
+    """
+    Pool de N páginas dentro del mismo contexto logueado.
+    Cada tarea toma una página libre y la devuelve al terminar.
+    """
+    
+    def __init__(self, context, size: int = 4, timeout: int = 60000):
+        self.context = context
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.pages = []
+        self._free: asyncio.Queue = asyncio.Queue()
+    
+    async def start(self, first_page=None, warmup_url: Optional[str] = None):
+        """
+        Abre las páginas que falten. Las nuevas navegan a warmup_url para
+        quedar en el origen de la app (los fetch relativos lo necesitan).
+        """
+        if first_page is not None:
+            self.pages.append(first_page)
+        new_pages = []
+        while len(self.pages) + len(new_pages) < self.size:
+            page = await self.context.new_page()
+            page.set_default_timeout(self.timeout)
+            new_pages.append(page)
+        if warmup_url and new_pages:
+            await asyncio.gather(*[
+                page.goto(warmup_url, wait_until='domcontentloaded', timeout=self.timeout)
+                for page in new_pages
+            ])
+        self.pages.extend(new_pages)
+        for page in self.pages:
+            self._free.put_nowait(page)
+    
+    async def run(self, fn, *args):
+        """Ejecuta fn(page, *args) con una página del pool"""
+        page = await self._free.get()
+        try:
+            return await fn(page, *args)
+        finally:
+            self._free.put_nowait(page)
+    
+    async def map(self, fn, items: List, on_result=None) -> List:
+        """
+        Aplica fn(page, item) a todos los items repartidos en el pool.
+        La concurrencia queda acotada por el tamaño del pool.
+        """
+        async def _one(index, item):
+            result = await self.run(fn, item)
+            if on_result:
+                on_result(index, item, result)
+            return result
+        
+        return await asyncio.gather(*[_one(i, item) for i, item in enumerate(items)])
+    
+    async def close(self):
+        for page in self.pages[1:]:
+            await page.close()
+
+
+# ============== HISTORIAL SIN NAVEGADOR ==============
+class HistoryHttpError(Exception):
+    """La server action de historial no respondió con un historial válido"""
+
+
+class HistoryHttpClient:
+    """
+    Llama la server action de historial desde Python con las cookies de la
+    sesión del navegador, sin pasar por Chromium. Clerk renueva __session
+    cada minuto desde el JS de la página que queda abierta, así que las
+    cookies se releen del contexto cada COOKIE_REFRESH_SECONDS.
+    
+    Las cookies van solo en el header manual: el jar del cliente rechaza
+    todo Set-Cookie para no mandarlas dos veces con valores distintos.
+    """
+    
+    def __init__(self, context, concurrency: int = HISTORY_HTTP_CONCURRENCY):
+        import httpx
+        from http.cookiejar import CookieJar, DefaultCookiePolicy
+        
+        self._httpx = httpx
+        self.context = context
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.client = httpx.AsyncClient(
+            base_url=APP_URL,
+            headers={
+                'user-agent': USER_AGENT,
+                'origin': APP_URL,
+                'accept': 'text/x-component',
+                'content-type': 'text/plain;charset=UTF-8',
+                'next-action': HISTORY_ACTION_ID,
+            },
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=30.0,
+            follow_redirects=False,
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        )
+        self._cookie_header = ""
+        self._cookies_at = 0.0
+        self._cookie_lock = asyncio.Lock()
+    
+    async def _cookies(self) -> str:
+        async with self._cookie_lock:
+            if time.monotonic() - self._cookies_at > COOKIE_REFRESH_SECONDS:
+                cookies = await self.context.cookies(APP_URL)
+                self._cookie_header = "; ".join(f"{c['name']}={c['value']}" for c in cookies)
+                self._cookies_at = time.monotonic()
+            return self._cookie_header
+    
+    async def fetch(self, uuid: str, date_range: str) -> Dict:
+        """Historial de un producto; HistoryHttpError si la action no lo devuelve"""
+        path = f"/dashboard/tracking/detail/{uuid}"
+        async with self.semaphore:
+            try:
+                response = await self.client.post(
+                    path,
+                    params={'platform': 'dropi'},
+                    headers={'cookie': await self._cookies(), 'referer': f"{APP_URL}{path}?platform=dropi"},
+                    content=json.dumps([uuid, date_range])
+                )
+            except self._httpx.HTTPError as e:
+                raise HistoryHttpError(f"{type(e).__name__}: {e}") from e
+        # Un redirect (a /sign-in) o error = sesión vencida o action cambiada
+        if response.status_code != 200:
+            raise HistoryHttpError(f"HTTP {response.status_code} ({response.headers.get('location', '')})")
+        history = parse_rsc_row(response.text)
+        if history is None:
+            raise HistoryHttpError("respuesta sin fila de historial (¿cambió la server action?)")
+        return history
+    
+    async def close(self):
+        await self.client.aclose()
+
+
 # ============== DROPKILLER SCRAPER v7.3 ==============
 class DropKillerScraper:
-    def __init__(self, email: str, password: str, debug: bool = False):
+    def __init__(self, email: str, password: str, debug: bool = False, pool_size: int = 4,
+                 capture: str = "network", history: str = "http"):
         self.email = email
         self.password = password
         self.browser = None
         self.page = None
+        self.pool: Optional[PagePool] = None
+        self.pool_size = pool_size
         self.debug = debug
         self.session_cookies = None
+        # network: JSON de las respuestas del dashboard; dom: parsear el HTML renderizado
+        self.capture = capture
+        self.listing_stats = {"network": 0, "dom": 0}
+        # http: server action de historial desde Python; browser: fetch dentro de las páginas
+        self.history_mode = history
+        self.history_client: Optional[HistoryHttpClient] = None
+        self.history_stats = {"http": 0, "http_failed": 0, "browser": 0}
+        self._history_failures = 0
+        self.traffic_stats = {"requests": 0, "bytes": 0, "blocked": defaultdict(int)}
+        self.wait_stats = defaultdict(float)  # fase -> segundos esperando (sumados entre páginas)
+    
+    @asynccontextmanager
+    async def waiting(self, phase: str):
+        """Acumula el tiempo del bloque como espera de la fase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wait_stats[phase] += time.perf_counter() - started
     
-    async def init_browser(self, headless: bool = True):
+    async def init_browser(self, headless: bool = True, state_file: Optional[str] = None):
         from playwright.async_api import async_playwright
         
+        self.state_file = state_file
+        self.state_loaded = bool(state_file and os.path.exists(state_file))
+        
         self.playwright = await async_playwright().start()
         self.browser = await self.playwright.chromium.launch(
             headless=headless,
@@ -597,55 +1115,136 @@ class DropKillerScraper:
         )
         self.context = await self.browser.new_context(
             viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            user_agent=USER_AGENT,
+            storage_state=state_file if self.state_loaded else None
         )
+        self.context.on('requestfinished', self._on_request_finished)
         self.page = await self.context.new_page()
         self.page.set_default_timeout(60000)
     
+    async def _on_request_finished(self, request):
+        """Cuenta requests y bytes transferidos (headers + body de la respuesta)"""
+        self.traffic_stats["requests"] += 1
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        self.traffic_stats["bytes"] += sizes["responseHeadersSize"] + sizes["responseBodySize"]
+    
+    async def enable_lean(self):
+        """
+        Perfil liviano: bloquea imágenes, video, fuentes y hosts de terceros
+        (analytics, CDNs de widgets). Se activa después del login para no
+        romper el formulario de sign-in.
+        """
+        await self.context.route('**/*', self._route_lean)
+    
+    async def _route_lean(self, route):
+        request = route.request
+        host = urlparse(request.url).hostname or ""
+        if request.resource_type in LEAN_BLOCKED_TYPES:
+            reason = request.resource_type
+        elif not any(host == allowed or host.endswith("." + allowed) for allowed in LEAN_ALLOWED_HOSTS):
+            reason = "terceros"
+        else:
+            await route.continue_()
+            return
+        self.traffic_stats["blocked"][reason] += 1
+        await route.abort()
+    
+    async def init_pool(self):
+        """Crea el pool de páginas (después del login, comparten cookies)"""
+        self.pool = PagePool(self.context, self.pool_size)
+        await self.pool.start(first_page=self.page, warmup_url=DASHBOARD_URL)
+        if self.history_mode == "http":
+            self.history_client = HistoryHttpClient(self.context)
+    
+    async def session_is_valid(self) -> bool:
+        """
+        Carga el dashboard con la sesión guardada siguiendo redirects y
+        decide por la URL final. __session dura ~60 s, así que con un estado
+        guardado lo normal es pasar por el handshake de Clerk (307), que la
+        renueva con la cookie larga del cliente; solo si termina en
+        /sign-in la sesión venció.
+        """
+        try:
+            await self.page.goto(DASHBOARD_URL, wait_until='domcontentloaded', timeout=60000)
+            try:
+                # Clerk también puede redirigir desde el cliente después de cargar
+                await self.page.wait_for_load_state('networkidle', timeout=15000)
+            except Exception:
+                pass
+            url = self.page.url
+            return '/dashboard' in url and '/sign-in' not in url
+        except Exception:
+            return False
+    
+    async def save_state(self):
+        if not self.state_file:
+            return
+        try:
+            await self.context.storage_state(path=self.state_file)
+            os.chmod(self.state_file, 0o600)
+        except Exception as e:
+            print(f"  [!] No se pudo guardar la sesión: {e}")
+    
+    async def ensure_logged_in(self) -> bool:
+        """Reutiliza la sesión guardada si sigue vigente; si no, login completo"""
+        if self.state_loaded:
+            if await self.session_is_valid():
+                print("  [✓] Sesión guardada reutilizada")
+                self.session_cookies = await self.context.cookies()
+                # Guardar las cookies que renovó el handshake
+                await self.save_state()
+                return True
+            print("  [!] Sesión guardada vencida, haciendo login")
+            await self.context.clear_cookies()
+        
+        if not await self.login():
+            return False
+        await self.save_state()
+        return True
+    
     async def login(self) -> bool:
         print("  [1] Iniciando login...")
         try:
             await self.page.goto('https://app.dropkiller.com/sign-in', wait_until='domcontentloaded', timeout=60000)
-            await asyncio.sleep(5)
-            
-            email_input = None
-            for selector in ['input#identifier-field', 'input[name="identifier"]', 'input[type="email"]']:
-                try:
-                    email_input = await self.page.wait_for_selector(selector, timeout=3000)
-                    if email_input:
-                        break
-                except:
-                    continue
             
-            if not email_input:
+            # El formulario lo monta el JS de Clerk: se espera al input, no un tiempo fijo
+            try:
+                async with self.waiting("login"):
+                    email_input = await self.page.wait_for_selector(
+                        'input#identifier-field, input[name="identifier"], input[type="email"]',
+                        state='visible', timeout=LOGIN_FORM_TIMEOUT * 1000
+                    )
+            except Exception:
                 return False
             
             await email_input.fill(self.email)
-            await asyncio.sleep(1)
-            
-            password_input = None
-            for selector in ['input#password-field', 'input[type="password"]']:
-                try:
-                    password_input = await self.page.wait_for_selector(selector, timeout=3000)
-                    if password_input:
-                        break
-                except:
-                    continue
             
-            if not password_input:
+            try:
+                async with self.waiting("login"):
+                    password_input = await self.page.wait_for_selector(
+                        'input#password-field, input[type="password"]',
+                        state='visible', timeout=LOGIN_FORM_TIMEOUT * 1000
+                    )
+            except Exception:
                 return False
             
             await password_input.fill(self.password)
-            await asyncio.sleep(1)
             
             try:
-                submit_btn = await self.page.wait_for_selector('button:has-text("Iniciar")', timeout=3000)
+                async with self.waiting("login"):
+                    submit_btn = await self.page.wait_for_selector(
+                        'button:has-text("Iniciar"):not([disabled])', timeout=3000
+                    )
                 await submit_btn.click()
             except:
                 await password_input.press('Enter')
             
             try:
-                await self.page.wait_for_url('**/dashboard**', timeout=30000)
+                async with self.waiting("login"):
+                    await self.page.wait_for_url('**/dashboard**', timeout=30000)
                 print("  [✓] Login exitoso")
                 self.session_cookies = await self.context.cookies()
                 return True
@@ -659,8 +1258,9 @@ class DropKillerScraper:
             print(f"  [✗] Error: {e}")
             return False
     
-    async def extract_products_with_uuid(self) -> List[Dict]:
-        return await self.page.evaluate('''() => {
+    async def extract_products_with_uuid(self, page=None) -> List[Dict]:
+        page = page or self.page
+        return await page.evaluate('''() => {
             const products = [];
             const seen = new Set();
             
@@ -754,41 +1354,143 @@ class DropKillerScraper:
             return products;
         }''')
     
-    async def get_product_history(self, uuid: str, months: int = 6) -> Optional[Dict]:
+    async def get_product_history(self, uuid: str, months: int = 6, page=None) -> Optional[Dict]:
         """Obtiene historial extendido (6 meses para cubrir 12+ semanas)"""
+        page = page or self.page
         try:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=months * 30)
             date_range = f"{start_date.strftime('%Y-%m-%d')}/{end_date.strftime('%Y-%m-%d')}"
             
-            result = await self.page.evaluate('''async (params) => {
-                const [uuid, dateRange] = params;
+            if self.history_client:
+                return await self._history_via_http(uuid, date_range, page)
+            return await self._history_via_page(uuid, date_range, page)
+        except:
+            return None
+    
+    async def _history_via_http(self, uuid: str, date_range: str, page) -> Optional[Dict]:
+        """
+        --history http con fallback al fetch dentro de la página. Tras
+        HISTORY_HTTP_MAX_FAILURES fallas seguidas se deja de intentar por HTTP.
+        """
+        if self.history_mode == "http":
+            try:
+                history = await self.history_client.fetch(uuid, date_range)
+                self._history_failures = 0
+                self.history_stats["http"] += 1
+                return history
+            except HistoryHttpError as e:
+                self.history_stats["http_failed"] += 1
+                self._history_failures += 1
+                if self.debug:
+                    print(f"      Historial HTTP de {uuid} falló: {e}")
+                if self._history_failures >= HISTORY_HTTP_MAX_FAILURES and self.history_mode == "http":
+                    self.history_mode = "browser"
+                    print(f"\n  ⚠️  --history http falló {self._history_failures} veces seguidas ({e})")
+                    print("      Se sigue con el historial desde el navegador (--history browser)")
+        
+        # Mismo límite de concurrencia que el cliente HTTP, ahora sobre la página
+        async with self.history_client.semaphore:
+            return await self._history_via_page(uuid, date_range, page)
+    
+    async def _history_via_page(self, uuid: str, date_range: str, page) -> Optional[Dict]:
+        """Historial con un fetch a la server action dentro de la página"""
+        self.history_stats["browser"] += 1
+        body = await page.evaluate('''async (params) => {
+                const [uuid, dateRange, actionId] = params;
                 try {
                     const response = await fetch(`/dashboard/tracking/detail/${uuid}?platform=dropi`, {
                         method: 'POST',
                         headers: {
                             'accept': 'text/x-component',
                             'content-type': 'text/plain;charset=UTF-8',
-                            'next-action': '7ff80d9301fb1d1d96845742009470be0442d3283f'
+                            'next-action': actionId
                         },
                         body: JSON.stringify([uuid, dateRange])
                     });
-                    const text = await response.text();
-                    const lines = text.split('\\n');
-                    for (const line of lines) {
-                        if (line.startsWith('1:')) {
-                            return JSON.parse(line.substring(2));
-                        }
-                    }
-                    return null;
+                    return await response.text();
                 } catch (e) {
                     return null;
                 }
-            }''', [uuid, date_range])
-            
-            return result
-        except:
+            }''', [uuid, date_range, HISTORY_ACTION_ID])
+        
+        return parse_rsc_row(body) if body else None
+    
+    async def _capture_listing(self, page, url: str) -> Optional[List[Dict]]:
+        """
+        Navega al listado y devuelve los productos de la primera respuesta
+        de datos del dashboard, apenas llega. None si no aparece ninguna en
+        LISTING_CAPTURE_TIMEOUT segundos.
+        """
+        found = asyncio.get_running_loop().create_future()
+        
+        async def on_response(response):
+            if found.done() or response.status != 200:
+                return
+            if response.request.resource_type not in ('xhr', 'fetch'):
+                return
+            if not any(pattern in response.url for pattern in LISTING_URL_PATTERNS):
+                return
+            try:
+                items = parse_listing_body(await response.text())
+            except Exception:
+                return
+            if items is not None and not found.done():
+                found.set_result(items)
+        
+        page.on('response', on_response)
+        try:
+            async with self.waiting("listado"):
+                await page.goto(url, wait_until='commit', timeout=60000)
+                items = await asyncio.wait_for(found, LISTING_CAPTURE_TIMEOUT)
+        except asyncio.TimeoutError:
             return None
+        finally:
+            page.remove_listener('response', on_response)
+        
+        products = []
+        for item in items:
+            product = product_from_listing(item)
+            if product:
+                products.append(product)
+        return products
+    
+    async def _load_listing_page(self, page, url: str) -> List[Dict]:
+        if self.capture == "network":
+            products = await self._capture_listing(page, url)
+            if products is not None:
+                self.listing_stats["network"] += 1
+                return products
+            if self.capture == "network":  # otra página del pool pudo cambiarlo ya
+                print("      [!] No se vio la respuesta de datos del listado, se sigue con el DOM")
+                self.capture = "dom"
+        
+        self.listing_stats["dom"] += 1
+        async with self.waiting("listado"):
+            await page.goto(url, wait_until='domcontentloaded', timeout=60000)
+            await self._wait_listing_rows(page)
+        
+        return await self.extract_products_with_uuid(page)
+    
+    async def _wait_listing_rows(self, page):
+        """
+        Espera a que aparezca la primera fila y luego hace scroll mientras
+        sigan llegando filas nuevas (hasta LISTING_MAX_SCROLLS veces)
+        """
+        try:
+            await page.wait_for_function(f"() => ({_COUNT_ROWS_JS})() > 0", timeout=LISTING_ROWS_TIMEOUT * 1000)
+        except Exception:
+            return  # página vacía o layout distinto: extract devuelve lo que haya
+        
+        for _ in range(LISTING_MAX_SCROLLS):
+            count = await page.evaluate(_COUNT_ROWS_JS)
+            await page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
+            try:
+                await page.wait_for_function(
+                    f"() => ({_COUNT_ROWS_JS})() > {count}", timeout=LISTING_SCROLL_TIMEOUT * 1000
+                )
+            except Exception:
+                return  # el conteo de filas ya no cambia
     
     async def get_products(self, country: str = "CO", min_sales: int = 10, 
                           max_products: int = 100, max_pages: int = 5) -> List[Dict]:
@@ -797,49 +1499,54 @@ class DropKillerScraper:
         country_id = DROPKILLER_COUNTRIES.get(country, DROPKILLER_COUNTRIES["CO"])
         all_products = []
         seen_ids = set()
+        pool_size = self.pool.size if self.pool else 1
         
         try:
-            for page_num in range(1, max_pages + 1):
-                url = f"https://app.dropkiller.com/dashboard/products?country={country_id}&limit=50&page={page_num}&s7min={min_sales}"
+            # Se cargan las páginas en tandas del tamaño del pool
+            for wave_start in range(1, max_pages + 1, pool_size):
+                page_nums = list(range(wave_start, min(wave_start + pool_size, max_pages + 1)))
+                urls = [
+                    f"https://app.dropkiller.com/dashboard/products?country={country_id}&limit=50&page={n}&s7min={min_sales}"
+                    for n in page_nums
+                ]
                 
-                print(f"      Página {page_num}/{max_pages}...", end=" ", flush=True)
-                await self.page.goto(url, wait_until='domcontentloaded', timeout=60000)
-                await asyncio.sleep(4)
-                
-                for _ in range(3):
-                    await self.page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-                    await asyncio.sleep(0.5)
-                
-                page_products = await self.extract_products_with_uuid()
-                
-                new_count = 0
-                for p in page_products:
-                    pid = p.get('uuid', '')
-                    if pid and pid not in seen_ids:
-                        seen_ids.add(pid)
-                        all_products.append(p)
-                        new_count += 1
+                if self.pool:
+                    results = await self.pool.map(self._load_listing_page, urls)
+                else:
+                    results = [await self._load_listing_page(self.page, urls[0])]
                 
-                print(f"→ {len(page_products)} extraídos, {new_count} nuevos | Total: {len(all_products)}")
+                wave_new = 0
+                for page_num, page_products in zip(page_nums, results):
+                    new_count = 0
+                    for p in page_products:
+                        pid = p.get('uuid', '')
+                        if pid and pid not in seen_ids:
+                            seen_ids.add(pid)
+                            all_products.append(p)
+                            new_count += 1
+                    wave_new += new_count
+                    print(f"      Página {page_num}/{max_pages} → {len(page_products)} extraídos, {new_count} nuevos | Total: {len(all_products)}")
                 
-                if new_count == 0 or len(all_products) >= max_products:
+                if wave_new == 0 or len(all_products) >= max_products:
                     break
             
             all_products = [p for p in all_products if p.get('sales7d', 0) >= min_sales][:max_products]
-            print(f"  [✓] Total: {len(all_products)} productos extraídos")
+            print(f"  [✓] Total: {len(all_products)} productos extraídos "
+                  f"({self.listing_stats['network']} páginas por red, {self.listing_stats['dom']} por DOM)")
             
             return all_products
         except Exception as e:
             print(f"  [✗] Error: {e}")
             return all_products
     
-    async def analyze_product_deep(self, product: Dict) -> Dict:
+    async def analyze_product_deep(self, product: Dict, page=None) -> Dict:
         uuid = product.get('uuid')
         if not uuid:
             return product
         
         # Obtener 6 meses de historial
-        history_data = await self.get_product_history(uuid, months=6)
+        async with self.waiting("historial"):
+            history_data = await self.get_product_history(uuid, months=6, page=page)
         
         if not history_data or 'data' not in history_data:
             product['trend'] = TrendAnalyzerV2._empty_analysis("No se pudo obtener historial")
@@ -862,7 +1569,40 @@ class DropKillerScraper:
         
         return product
 
+    async def analyze_products_deep(self, products: List[Dict], on_result=None) -> List[Dict]:
+        """
+        Análisis profundo de todos los productos: con --history http van
+        todos a la vez (acotados por el semáforo del cliente HTTP); si no,
+        repartidos en el pool de páginas
+        """
+        if self.history_client:
+            async def _one(index, product):
+                result = await self.analyze_product_deep(product)
+                if on_result:
+                    on_result(index, product, result)
+                return result
+            
+            return await asyncio.gather(*[_one(i, product) for i, product in enumerate(products)])
+        
+        if not self.pool:
+            results = []
+            for i, product in enumerate(products):
+                result = await self.analyze_product_deep(product)
+                if on_result:
+                    on_result(i, product, result)
+                results.append(result)
+            return results
+        
+        async def _deep(page, product):
+            return await self.analyze_product_deep(product, page=page)
+        
+        return await self.pool.map(_deep, products, on_result=on_result)
+    
     async def close(self):
+        if self.history_client:
+            await self.history_client.close()
+        if self.pool:
+            await self.pool.close()
         if self.browser:
             await self.browser.close()
         if hasattr(self, 'playwright') and self.playwright:
@@ -889,6 +1629,28 @@ def print_filtro_stats(stats: Dict):
     print(f"\n  📈 Tasa de aprobación: {tasa:.1f}%")
 
 
+def print_traffic_stats(stats: Dict):
+    """Requests, bytes transferidos y requests bloqueados por --lean"""
+    blocked = sum(stats["blocked"].values())
+    print(f"\n  🌐 Tráfico: {stats['requests']} requests | {stats['bytes'] / 1024 / 1024:.1f} MB transferidos")
+    if blocked:
+        detalle = ", ".join(f"{kind}: {count}" for kind, count in sorted(stats["blocked"].items(), key=lambda x: -x[1]))
+        print(f"      Bloqueados: {blocked} ({detalle})")
+
+
+def print_history_stats(stats: Dict):
+    """De dónde salió el historial: HTTP directo, fallas HTTP y navegador"""
+    if stats["http"] or stats["http_failed"]:
+        print(f"  📜 Historial: {stats['http']} por HTTP | {stats['http_failed']} fallas HTTP | {stats['browser']} desde el navegador")
+
+
+def print_wait_stats(waits: Dict):
+    """Tiempo esperando condiciones por fase"""
+    if waits:
+        detalle = " | ".join(f"{phase}: {seconds:.1f}s" for phase, seconds in waits.items())
+        print(f"  ⏱️  Esperas: {detalle}")
+
+
 def print_product_analysis(rank: int, product: Dict, show_details: bool = True):
     """Imprime análisis detallado de un producto aprobado"""
     name = product.get('name', 'N/A')[:40]
@@ -976,6 +1738,15 @@ async def main():
     parser.add_argument("--debug", action="store_true", help="Modo debug")
     parser.add_argument("--top", type=int, default=20, help="Mostrar top N productos aprobados")
     parser.add_argument("--show-descartados", action="store_true", help="Mostrar productos descartados")
+    parser.add_argument("--pages", type=int, default=4, help="Páginas del navegador en paralelo")
+    parser.add_argument("--state-file", default=STATE_FILE, help="Archivo de sesión guardada")
+    parser.add_argument("--fresh-login", action="store_true", help="Ignorar la sesión guardada")
+    parser.add_argument("--lean", action="store_true",
+                        help="Bloquear imágenes, fuentes, video y hosts de terceros")
+    parser.add_argument("--history", choices=["http", "browser"], default="http",
+                        help="Historial por HTTP directo (cookies de la sesión) o desde el navegador")
+    parser.add_argument("--capture", choices=["network", "dom"], default="network",
+                        help="Leer el listado del JSON de red o del DOM renderizado")
     args = parser.parse_args()
     
     if not DROPKILLER_EMAIL or not DROPKILLER_PASSWORD:
@@ -989,17 +1760,25 @@ async def main():
     print(f"  Filtros: 12 sem ≥50v | V7d≥50 | Días≥4/7 | Caída≤30% | ROI≥20%")
     print("=" * 75)
     
-    scraper = DropKillerScraper(DROPKILLER_EMAIL, DROPKILLER_PASSWORD, debug=args.debug)
+    scraper = DropKillerScraper(DROPKILLER_EMAIL, DROPKILLER_PASSWORD, debug=args.debug, pool_size=args.pages,
+                               capture=args.capture, history=args.history)
     
     try:
         # FASE 1: Login
         print("\n[FASE 1] Login")
-        await scraper.init_browser(headless=not args.visible)
+        await scraper.init_browser(
+            headless=not args.visible,
+            state_file=None if args.fresh_login else args.state_file
+        )
         
-        if not await scraper.login():
+        if not await scraper.ensure_logged_in():
             print("\nERROR: Login fallido")
             return
         
+        if args.lean:
+            await scraper.enable_lean()
+        await scraper.init_pool()
+        
         # FASE 2: Extracción
         print("\n[FASE 2] Extracción de productos")
         products = await scraper.get_products(args.country, args.min_sales, args.max_products, args.max_pages)
@@ -1012,25 +1791,25 @@ async def main():
         print(f"\n[FASE 3] Análisis profundo + Filtros ({len(products)} productos)...")
         print(f"         (Analizando 12 semanas de historial por producto)")
         
-        for i, product in enumerate(products, 1):
-            name = product.get('name', 'N/A')[:25]
-            print(f"      [{i}/{len(products)}] {name}...", end=" ", flush=True)
-            
-            product = await scraper.analyze_product_deep(product)
-            products[i-1] = product
-            
-            trend = product.get('trend')
-            filtro = product.get('filtro_result')
+        done = 0
+        
+        def report(index: int, product: Dict, result: Dict):
+            nonlocal done
+            done += 1
+            name = result.get('name', 'N/A')[:25]
+            trend = result.get('trend')
+            filtro = result.get('filtro_result')
             
             if filtro and filtro.pasa:
-                print(f"✅ PASA | {trend.semanas_con_50_ventas}/12 sem | {trend.pattern[:10] if trend else '?'}")
+                status = f"✅ PASA | {trend.semanas_con_50_ventas}/12 sem | {trend.pattern[:10] if trend else '?'}"
             elif trend:
                 sem = trend.semanas_con_50_ventas
-                print(f"❌ {sem}/12 sem | {filtro.razones_descarte[0][:30] if filtro else '?'}")
+                status = f"❌ {sem}/12 sem | {filtro.razones_descarte[0][:30] if filtro else '?'}"
             else:
-                print("❌ Sin datos")
-            
-            await asyncio.sleep(0.3)
+                status = "❌ Sin datos"
+            print(f"      [{done}/{len(products)}] {name}... {status}")
+        
+        products = await scraper.analyze_products_deep(products, on_result=report)
         
         # FASE 4: Resultados
         stats = FiltroExperto.resumen_filtros(products)
@@ -1072,6 +1851,9 @@ async def main():
         print("=" * 75)
         
     finally:
+        print_traffic_stats(scraper.traffic_stats)
+        print_history_stats(scraper.history_stats)
+        print_wait_stats(scraper.wait_stats)
         await scraper.close()
 
 
@@ -0,0 +1,101 @@
+"""
+Cache compartido de busquedas de Adskiller
+
+find_competitors busca con las tres primeras palabras del nombre, asi que
+muchos productos del catalogo terminan en el mismo termino. Este cache TTL
+guarda el resultado por (termino normalizado, pais, plataforma, limite) y
+junta las llamadas concurrentes al mismo termino en una sola request.
+
+Vive en el event loop del cliente HTTP compartido, por eso no usa locks.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from config import SEARCH_CACHE_CONFIG
+
+T = TypeVar("T")
+
+
+def normalize_term(term: str) -> str:
+    """Minusculas y espacios colapsados"""
+    return " ".join(term.casefold().split())
+
+
+class SearchCache:
+    """Cache TTL + coalescing de requests en vuelo"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = SEARCH_CACHE_CONFIG["ttl_seconds"],
+        max_entries: int = SEARCH_CACHE_CONFIG["max_entries"]
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return (self.stats["hits"] + self.stats["coalesced"]) / total if total else 0.0
+
+    def _get_fresh(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        """
+        Devuelve el valor cacheado o llama a fetch(). Si ya hay un fetch en
+        vuelo para la misma llave, espera ese en vez de lanzar otro. Los
+        errores no se cachean: se propagan a todos los que esperaban.
+        """
+        entry = self._get_fresh(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry[1]
+
+        pending: Optional[asyncio.Future] = self._in_flight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita el warning de "exception never retrieved" si nadie esperaba
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+
+_shared_cache: Optional[SearchCache] = None
+
+
+def get_search_cache() -> SearchCache:
+    """Cache compartido por todas las instancias de AdskillerScraper"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SearchCache()
+    return _shared_cache
@@ -0,0 +1,203 @@
+"""
+Backends de almacenamiento para los resultados del pipeline
+
+Storage cubre lo que escribe el pipeline: upserts en bloque de
+analyzed_products y el log de pipeline_runs. SupabaseStorage habla con la
+API REST de Supabase por el cliente HTTP compartido; SQLiteStorage guarda
+todo en un archivo local (desarrollo offline, corridas locales rapidas y
+benchmarks sin latencia de red).
+"""
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import STORAGE_CONFIG, SUPABASE_URL, SUPABASE_KEY
+from bulk_writer import PRODUCT_KEY_FIELDS
+from http_client import HttpClient, get_http_client
+
+
+class StorageError(RuntimeError):
+    """
+    Error de escritura del backend. status_code es el HTTP de la respuesta
+    (o el equivalente de SQLite); None si no hubo respuesta.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Storage(ABC):
+    """Interfaz comun de los backends"""
+
+    name = "base"
+
+    @abstractmethod
+    def upsert_products(self, rows: List[Dict]):
+        """Upsert en bloque por (external_id, platform, country_code); lanza StorageError si falla"""
+
+    @abstractmethod
+    def log_run(self, run: Dict):
+        """Inserta una fila en pipeline_runs"""
+
+    def close(self):
+        pass
+
+
+class SupabaseStorage(Storage):
+    """PostgREST de Supabase sobre el pool HTTP compartido"""
+
+    name = "supabase"
+
+    def __init__(self, url: str = SUPABASE_URL, key: str = SUPABASE_KEY, http: Optional[HttpClient] = None):
+        self.url = url.rstrip("/")
+        self.http = http or get_http_client()
+        self.headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=minimal"
+        }
+
+    def _post(self, table: str, rows, idempotent: bool, prefer: str, params: Optional[Dict] = None):
+        response = self.http.request_sync(
+            "POST",
+            f"{self.url}/rest/v1/{table}",
+            headers={**self.headers, "Prefer": prefer},
+            json=rows,
+            params=params,
+            idempotent=idempotent
+        )
+        if response.status_code not in [200, 201, 204]:
+            raise StorageError(f"HTTP {response.status_code}: {response.text[:200]}", response.status_code)
+
+    def upsert_products(self, rows: List[Dict]):
+        # merge-duplicates hace el upsert idempotente: se puede reintentar
+        self._post(
+            "analyzed_products", rows,
+            idempotent=True,
+            prefer="resolution=merge-duplicates,return=minimal",
+            params={"on_conflict": ",".join(PRODUCT_KEY_FIELDS)}
+        )
+
+    def log_run(self, run: Dict):
+        self._post("pipeline_runs", run, idempotent=False, prefer="return=minimal")
+
+
+class SQLiteStorage(Storage):
+    """
+    Base local en SQLite. Las columnas de llave y las que se usan para
+    filtrar van aparte; la fila completa queda como JSON en data.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = STORAGE_CONFIG["sqlite_path"]):
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS analyzed_products (
+                external_id TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                country_code TEXT NOT NULL,
+                name TEXT,
+                viability_score INTEGER,
+                is_recommended INTEGER,
+                analyzed_at TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (external_id, platform, country_code)
+            );
+            CREATE INDEX IF NOT EXISTS idx_products_recommended ON analyzed_products(is_recommended);
+            CREATE INDEX IF NOT EXISTS idx_products_score ON analyzed_products(viability_score DESC);
+
+            CREATE TABLE IF NOT EXISTS pipeline_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT,
+                finished_at TEXT,
+                status TEXT,
+                products_scanned INTEGER,
+                products_analyzed INTEGER,
+                products_recommended INTEGER,
+                error_message TEXT,
+                data TEXT NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def upsert_products(self, rows: List[Dict]):
+        values = [
+            (
+                str(row["external_id"]),
+                row.get("platform", "dropi"),
+                row.get("country_code", "CO"),
+                row.get("name"),
+                row.get("viability_score"),
+                int(bool(row.get("is_recommended"))),
+                row.get("analyzed_at") or datetime.now().isoformat(),
+                json.dumps(row, ensure_ascii=False, default=str)
+            )
+            for row in rows
+        ]
+        try:
+            self._executemany_products(values)
+        except (sqlite3.IntegrityError, sqlite3.InterfaceError) as e:
+            # Fila invalida (constraint o tipo no soportado): como un 422 de PostgREST
+            raise StorageError(f"SQLite: {e}", 422) from e
+
+    def _executemany_products(self, values: List[tuple]):
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                INSERT INTO analyzed_products
+                    (external_id, platform, country_code, name, viability_score, is_recommended, analyzed_at, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (external_id, platform, country_code) DO UPDATE SET
+                    name = excluded.name,
+                    viability_score = excluded.viability_score,
+                    is_recommended = excluded.is_recommended,
+                    analyzed_at = excluded.analyzed_at,
+                    data = excluded.data
+            """, values)
+
+    def log_run(self, run: Dict):
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO pipeline_runs
+                    (started_at, finished_at, status, products_scanned, products_analyzed,
+                     products_recommended, error_message, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                run.get("started_at"),
+                run.get("finished_at"),
+                run.get("status"),
+                run.get("products_scanned"),
+                run.get("products_analyzed"),
+                run.get("products_recommended"),
+                run.get("error_message"),
+                json.dumps(run, ensure_ascii=False, default=str)
+            ))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_storage(backend: Optional[str] = None, **kwargs) -> Storage:
+    """Backend segun STORAGE_BACKEND (supabase | sqlite)"""
+    backend = (backend or STORAGE_CONFIG["backend"]).lower()
+    if backend == "supabase":
+        return SupabaseStorage(**kwargs)
+    if backend == "sqlite":
+        return SQLiteStorage(**kwargs)
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los modulos del backend se importan planos (from config import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,19 @@
+"""
+Llave del cache de analisis de Claude
+"""
+import analyzer
+from analyzer import ProductAnalyzer
+
+INPUTS = ProductAnalyzer._prompt_inputs(
+    {"name": "Lampara LED"}, {"cost_price": 30000, "sale_price": 80000}, [], []
+)
+
+
+def test_key_is_stable_for_same_prompt():
+    assert ProductAnalyzer._cache_key(INPUTS) == ProductAnalyzer._cache_key(dict(INPUTS))
+
+
+def test_key_changes_when_system_prompt_changes(monkeypatch):
+    before = ProductAnalyzer._cache_key(INPUTS)
+    monkeypatch.setattr(analyzer, "SYSTEM_PROMPT", analyzer.SYSTEM_PROMPT + "\nNueva regla.")
+    assert ProductAnalyzer._cache_key(INPUTS) != before
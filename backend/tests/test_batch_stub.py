@@ -0,0 +1,49 @@
+"""
+analyze_batch de punta a punta contra el stand-in local de batches
+"""
+from analyzer import ProductAnalyzer
+from batch_stub import BatchStub, STUB_ANALYSIS
+from config import BATCH_CONFIG, HTTP_CASSETTE_CONFIG
+
+
+def _items(count: int) -> list:
+    return [
+        {
+            "product": {"name": f"Producto {i}"},
+            "margin_data": {"cost_price": 30000, "sale_price": 80000},
+            "competitors": [],
+            "used_angles": [],
+        }
+        for i in range(count)
+    ]
+
+
+def _analyzer(stub: BatchStub, monkeypatch) -> ProductAnalyzer:
+    monkeypatch.setitem(HTTP_CASSETTE_CONFIG, "mode", "")
+    return ProductAnalyzer("sk-test", base_url=stub.base_url)
+
+
+def test_batch_mixes_succeeded_errored_and_expired(monkeypatch):
+    outcomes = {"item-1": "errored", "item-2": "expired"}
+    with BatchStub(outcomes, polls_until_ended=2) as stub:
+        analyzer = _analyzer(stub, monkeypatch)
+        results = analyzer.analyze_batch(_items(4), poll_interval=0)
+
+    assert results[0] == STUB_ANALYSIS
+    assert results[3] == STUB_ANALYSIS
+    assert results[1]["recommendation"] == "REVISAR_MANUALMENTE"
+    assert results[2]["recommendation"] == "REVISAR_MANUALMENTE"
+    assert analyzer.batch_stats == {"submitted": 4, "succeeded": 2, "failed": 2}
+    assert analyzer.token_stats["input"] == 200
+    assert stub.calls["create"] == 1 and stub.calls["results"] == 1
+
+
+def test_batch_past_deadline_is_canceled(monkeypatch):
+    monkeypatch.setitem(BATCH_CONFIG, "max_wait_seconds", -1)
+    with BatchStub(polls_until_ended=100) as stub:
+        analyzer = _analyzer(stub, monkeypatch)
+        results = analyzer.analyze_batch(_items(2), poll_interval=0)
+
+    assert stub.calls["cancel"] == 1
+    assert all(result["recommendation"] == "REVISAR_MANUALMENTE" for result in results)
+    assert analyzer.batch_stats["succeeded"] == 0
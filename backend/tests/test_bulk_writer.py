@@ -0,0 +1,60 @@
+"""
+Bisect de chunks fallidos en BulkUpserter
+"""
+import httpx
+
+from bulk_writer import BulkUpserter
+from storage import StorageError
+
+
+def _rows(count: int) -> list:
+    return [{"external_id": str(i), "platform": "dropi", "country_code": "CO"} for i in range(count)]
+
+
+class FakeBackend:
+    def __init__(self, error=None, bad_ids=()):
+        self.error = error
+        self.bad_ids = set(bad_ids)
+        self.calls = 0
+        self.written = []
+
+    def upsert(self, rows):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        if any(row["external_id"] in self.bad_ids for row in rows):
+            raise StorageError("HTTP 422: fila invalida", 422)
+        self.written.extend(rows)
+
+
+def test_row_error_is_bisected_down_to_the_bad_row():
+    backend = FakeBackend(bad_ids={"5"})
+    writer = BulkUpserter(backend.upsert, chunk_size=8)
+    for row in _rows(8):
+        writer.add(row)
+
+    assert [f.key for f in writer.failures] == ["5,dropi,CO"]
+    assert writer.rows_written == 7
+    assert len(backend.written) == 7
+
+
+def test_server_error_fails_the_chunk_once():
+    backend = FakeBackend(error=StorageError("HTTP 503: unavailable", 503))
+    writer = BulkUpserter(backend.upsert, chunk_size=8)
+    for row in _rows(8):
+        writer.add(row)
+
+    assert backend.calls == 1
+    assert len(writer.failures) == 8
+    assert writer.rows_written == 0
+
+
+def test_transport_error_fails_the_chunk_once():
+    backend = FakeBackend(error=httpx.ConnectError("connection refused"))
+    writer = BulkUpserter(backend.upsert, chunk_size=4)
+    for row in _rows(6):
+        writer.add(row)
+    writer.flush()
+
+    assert backend.calls == 2
+    assert len(writer.failures) == 6
@@ -0,0 +1,22 @@
+"""
+Armado de batches de HistoryFetcher
+"""
+import uuid
+from collections import deque
+
+import httpx
+
+from history_fetcher import HistoryFetcher
+
+
+def test_batch_url_fits_max_length_once_encoded():
+    fetcher = HistoryFetcher(http=object(), initial_batch_size=500, max_batch_size=500)
+    pending = deque(str(uuid.uuid4()) for _ in range(200))
+
+    batch = fetcher._take_batch(pending, "CO")
+    url = httpx.URL(fetcher.url, params={"ids": ",".join(batch), "country": "CO"})
+
+    assert len(str(url)) <= fetcher.max_url_length
+    # Un ID mas ya no entraria
+    with_next = httpx.URL(fetcher.url, params={"ids": ",".join(batch + [pending[0]]), "country": "CO"})
+    assert len(str(with_next)) > fetcher.max_url_length
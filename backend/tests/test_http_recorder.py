@@ -0,0 +1,67 @@
+"""
+Record/replay de trafico con el SDK de Anthropic (HTTP_CASSETTE)
+"""
+import json
+
+from analyzer import ProductAnalyzer, SDK_HTTPX
+from config import HTTP_CASSETTE_CONFIG
+from http_recorder import Cassette
+
+ANALYSIS = {
+    "recommendation": "VENDER",
+    "confidence": 8,
+    "optimal_price": 79900,
+    "unused_angles": [],
+    "risks": [],
+    "action_items": [],
+}
+
+
+def _message(text: str) -> dict:
+    return {
+        "id": "msg_test",
+        "type": "message",
+        "role": "assistant",
+        "model": ProductAnalyzer.MODEL,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": 120, "output_tokens": 40},
+    }
+
+
+def _item() -> dict:
+    return {
+        "product": {"name": "Lampara LED"},
+        "margin_data": {"cost_price": 30000, "sale_price": 80000},
+        "competitors": [],
+        "used_angles": [],
+    }
+
+
+def test_record_mode_analyzer_can_be_built(tmp_path, monkeypatch):
+    monkeypatch.setitem(HTTP_CASSETTE_CONFIG, "mode", "record")
+    monkeypatch.setitem(HTTP_CASSETTE_CONFIG, "path", str(tmp_path / "record.jsonl"))
+    analyzer = ProductAnalyzer("sk-test")
+    assert analyzer.client is not None
+
+
+def test_replay_mode_answers_from_cassette(tmp_path, monkeypatch):
+    path = str(tmp_path / "claude.jsonl")
+    request = SDK_HTTPX.Request(
+        "POST", "https://api.anthropic.com/v1/messages",
+        headers={"x-api-key": "sk-real"}, json={"model": ProductAnalyzer.MODEL}
+    )
+    response = SDK_HTTPX.Response(
+        200, headers={"content-type": "application/json"}, json=_message(json.dumps(ANALYSIS))
+    )
+    Cassette(path).append(request, response, response.content, 0.2)
+    assert "sk-real" not in open(path, encoding="utf-8").read()
+
+    monkeypatch.delenv("ANTHROPIC_BASE_URL", raising=False)
+    monkeypatch.setitem(HTTP_CASSETTE_CONFIG, "mode", "replay")
+    monkeypatch.setitem(HTTP_CASSETTE_CONFIG, "path", path)
+    monkeypatch.setitem(HTTP_CASSETTE_CONFIG, "replay_latency", 0.0)
+    analyzer = ProductAnalyzer("sk-test")
+
+    assert analyzer.analyze_product(**_item()) == ANALYSIS
+    assert analyzer.token_stats["input"] == 120
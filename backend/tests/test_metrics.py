@@ -0,0 +1,40 @@
+"""
+Errores por etapa en RunMetrics
+"""
+import httpx
+import pytest
+
+from http_client import HttpClient, RetryPolicy
+from metrics import RunMetrics, record_error
+
+
+def test_record_error_marks_the_active_sample_once():
+    metrics = RunMetrics()
+    with metrics.stage("competitor_search"):
+        record_error()
+        record_error()
+    with metrics.stage("competitor_search"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.stage("competitor_search"):
+            record_error()
+            raise ValueError("boom")
+
+    summary = metrics.summary()["competitor_search"]
+    assert summary["count"] == 3
+    assert summary["errors"] == 2
+    record_error()  # fuera de una etapa no hace nada
+
+
+def test_http_error_response_counts_in_the_caller_stage():
+    transport = httpx.MockTransport(lambda request: httpx.Response(503))
+    http = HttpClient(rate_limits={}, retry_policy=RetryPolicy(max_retries=0), transport=transport)
+    metrics = RunMetrics()
+    with metrics.stage("competitor_search"):
+        response = http.request_sync("GET", "https://example.test/ads")
+    http.close()
+
+    assert response.status_code == 503
+    summary = metrics.summary()["competitor_search"]
+    assert summary["errors"] == 1
+    assert summary["requests"] == 1
@@ -0,0 +1,29 @@
+"""
+Caida del listado de DropKiller en Pipeline.run
+"""
+import sqlite3
+
+from run import Pipeline
+from scraper import ProductPageError
+from storage import SQLiteStorage
+
+
+def test_first_page_failure_is_logged_as_run_with_errors(tmp_path, capsys):
+    path = str(tmp_path / "runs.sqlite")
+    pipeline = Pipeline(
+        jwt="jwt", anthropic_key="sk-test", supabase_url="", supabase_key="",
+        use_cache=False, incremental=False, storage=SQLiteStorage(path), metrics_path=None
+    )
+
+    def failing_pages(**kwargs):
+        raise ProductPageError(1, "HTTP 503: unavailable")
+        yield
+
+    pipeline.dropkiller.iter_products = failing_pages
+    stats = pipeline.run(max_products=10)
+
+    assert stats["product_pages_failed"] == 1
+    assert "Verifica el JWT" not in capsys.readouterr().out
+    row = sqlite3.connect(path).execute("SELECT status, error_message FROM pipeline_runs").fetchone()
+    assert row[0] == "completed_with_errors"
+    assert "pagina 1" in row[1]
@@ -0,0 +1,51 @@
+"""
+Texto de los prompts a Claude
+"""
+from analyzer import ProductAnalyzer
+
+
+def _inputs(name: str, page_name: str, angle: str) -> dict:
+    return ProductAnalyzer._prompt_inputs(
+        {"name": name, "sales_7d": 120},
+        {"cost_price": 30000, "sale_price": 80000},
+        [{"page_name": page_name, "engagement_level": "alto", "main_angle": angle}],
+        [angle],
+    )
+
+
+def test_single_prompt_keeps_flat_sections():
+    prompt = ProductAnalyzer._build_prompt(_inputs("Lampara", "Tienda A", "ahorro"))
+    assert "## PRODUCTO\n" in prompt
+    assert "## COMPETENCIA (1 competidores encontrados)" in prompt
+    assert "###" not in prompt
+
+
+def test_grouped_prompt_tags_every_subsection_with_its_product():
+    sections = [
+        (f"p{i}", ProductAnalyzer._product_section(_inputs(name, page, angle), product_id=f"p{i}"))
+        for i, (name, page, angle) in enumerate([("Lampara", "Tienda A", "ahorro"), ("Faja", "Tienda B", "postura")])
+    ]
+    prompt = ProductAnalyzer._build_multi_prompt(sections)
+
+    # Los unicos encabezados de nivel 2 son los de cada producto
+    assert [line for line in prompt.splitlines() if line.startswith("## ")] == ["## PRODUCTO p0", "## PRODUCTO p1"]
+    for product_id, page, angle in (("p0", "Tienda A", "ahorro"), ("p1", "Tienda B", "postura")):
+        assert f"### ANALISIS FINANCIERO {product_id}\n" in prompt
+        assert f"### COMPETENCIA {product_id} (1 competidores encontrados)\n1. {page}" in prompt
+        assert f"### ANGULOS YA USADOS POR LA COMPETENCIA {product_id}\n{angle}" in prompt
+
+
+def test_system_prompt_rubric_follows_analysis_config(monkeypatch):
+    import importlib
+    import analyzer
+    from config import ANALYSIS_CONFIG
+
+    monkeypatch.setitem(ANALYSIS_CONFIG, "min_viable_margin", 12500)
+    monkeypatch.setitem(ANALYSIS_CONFIG, "min_viable_roi", 20)
+    try:
+        prompt = importlib.reload(analyzer).SYSTEM_PROMPT
+    finally:
+        monkeypatch.undo()
+        importlib.reload(analyzer)
+
+    assert "sobre $12.500 COP o equivalente), ROI de 20% o mas" in prompt